@@ -13,6 +13,23 @@ from frappe.utils.password import update_password
 
 from g_healthy.utils import get_request_form_data
 from g_healthy.apis.list import get_list as custom_get_list
+from g_healthy.cache import (
+    bump_generation,
+    get_cached,
+    get_generation,
+    get_roles_hash,
+    make_cache_key,
+    make_hash,
+)
+from g_healthy.etag import conditional_response
+from g_healthy.expressions import compile_expression, evaluate_partial
+from g_healthy.permissions import get_permission_context
+
+# compiled schemas are versioned by their keys, the ttl only evicts unused ones
+SCHEMA_CACHE_TTL = 24 * 60 * 60
+
+# doctypes whose event field lists the live Codes, see `get_field_data`
+LIVE_FIELD_DATA_DOCTYPES = ("Log Details", "General Cargo Other Items")
 
 
 @frappe.whitelist()
@@ -114,13 +131,72 @@ def getdoctype(
     docs = []
     parent_dt = None
 
+    doc_data = load_document(doctype, name)
+    check_read_permission(doctype, name)
+
+    if with_parent and (parent_dt := frappe.model.meta.get_parent_dt(doctype)):
+        docs = get_meta_bundle(parent_dt)
+        frappe.response["parent_dt"] = parent_dt
+
+    if not docs:
+        docs = get_meta_bundle(doctype, field_name)
+
+    frappe.response["user_settings"] = get_user_settings(parent_dt or doctype)
+
+    if cached_timestamp and docs[0].modified == cached_timestamp:
+        return "use_cache"
+
+    def build_schema():
+        return get_doctype_schema(
+            doctype,
+            docs,
+            doc_data,
+            name=name,
+            showall=showall,
+            selectedfieldname=selectedfieldname,
+            selectedfieldvalue=selectedfieldvalue,
+            only_send_ticket_type=only_send_ticket_type,
+            event_data=event_data,
+            cache_parts=(with_parent, field_name),
+        )
+
+    # the event field lists live data, everything else only changes with the
+    # meta, the user settings and the document
+    if event_data or doctype in LIVE_FIELD_DATA_DOCTYPES:
+        return build_schema()
+
+    return conditional_response(
+        (
+            "getdoctype",
+            doctype,
+            [str(doc.modified) for doc in docs],
+            get_generation("schema"),
+            frappe.response["user_settings"],
+            doc_data and str(doc_data.modified),
+            str(with_parent),
+            str(showall),
+            selectedfieldname,
+            selectedfieldvalue,
+            str(only_send_ticket_type),
+            field_name,
+        ),
+        build_schema,
+    )
+
+
+def load_document(doctype, name):
+    """
+    Returns the document a form is opened for, None if there is none
+    """
     try:
         if name and frappe.db.exists(doctype, name):
-            doc_data = frappe.get_doc(doctype, name)
-        else:
-            doc_data = None
-    except:
-        doc_data = None
+            return frappe.get_doc(doctype, name)
+    except Exception:
+        pass
+    return None
+
+
+def check_read_permission(doctype, name=None):
     try:
         if not frappe.permissions.has_permission(doctype, "read"):
             frappe.throw(
@@ -137,27 +213,85 @@ def getdoctype(
             _("You don't have permission to read {0}").format(doctype),
             frappe.PermissionError,
         )
-    docstatus = 0
 
-    if with_parent and (parent_dt := frappe.model.meta.get_parent_dt(doctype)):
-        docs = get_meta_bundle(parent_dt)
-        frappe.response["parent_dt"] = parent_dt
 
-    if not docs:
-        docs = get_meta_bundle(doctype, field_name)
+def get_doctype_schema(
+    doctype,
+    docs,
+    doc_data,
+    name=None,
+    showall=False,
+    selectedfieldname=None,
+    selectedfieldvalue=None,
+    only_send_ticket_type=False,
+    event_data=False,
+    cache_parts=(),
+):
+    """
+    Returns the form schema of a loaded meta bundle filled with the values of
+    the document, as sent by `getdoctype`
+    """
+    return_obj = []
+    if docs:
+        docstatus = 0
+        if name:
+            docstatus = doc_data.docstatus if doc_data else None
+
+        return_obj = get_compiled_schema(
+            docs,
+            doctype,
+            showall,
+            selectedfieldname,
+            selectedfieldvalue,
+            only_send_ticket_type=only_send_ticket_type,
+            event_data=event_data,
+            cache_parts=cache_parts,
+        )
+        apply_document_values(
+            return_obj, doctype, doc_data, docstatus, name, event_data=event_data
+        )
 
-    frappe.response["user_settings"] = get_user_settings(parent_dt or doctype)
+    if name and not doc_data:
+        return_obj.append({"error": "Record not found"})
+    return return_obj
 
-    if cached_timestamp and docs[0].modified == cached_timestamp:
-        return "use_cache"
 
-    return_obj = []
-    if docs:
-        i = 0
+def get_compiled_schema(
+    docs,
+    doctype,
+    showall,
+    selectedfieldname,
+    selectedfieldvalue,
+    only_send_ticket_type=False,
+    event_data=False,
+    cache_parts=(),
+):
+    """
+    Returns the role resolved property list of a meta bundle from the schema cache.
+    The key holds the `modified` of every meta in the bundle and the role set of
+    the user, so a schema is only compiled again when one of them changes.
+    Per document values are not part of it, see `apply_document_values`.
+    """
+    key = make_cache_key(
+        "schema",
+        get_generation("schema"),
+        doctype,
+        make_hash(
+            [str(doc.modified) for doc in docs],
+            get_roles_hash(),
+            str(showall),
+            selectedfieldname,
+            selectedfieldvalue,
+            str(only_send_ticket_type),
+            str(event_data),
+            [str(part) for part in cache_parts],
+        ),
+    )
+
+    def compile_schema():
+        schema = []
         formwidth = "700px"
-        for doc in docs:
-            if name:
-                docstatus = frappe.db.get_value(doctype, name, "docstatus")
+        for i, doc in enumerate(docs):
             if i == 0 and doc.fields:
                 for field in doc.fields:
                     if field.print_width == "8":
@@ -165,31 +299,52 @@ def getdoctype(
 
             properties = get_cleared_fields(
                 doc.fields,
-                doc_data,
+                None,
                 doc.permissions,
                 showall,
                 doctype,
-                name,
+                None,
                 selectedfieldname,
                 selectedfieldvalue,
                 only_send_ticket_type=only_send_ticket_type,
                 event_data=event_data,
             )
+            schema.append(
+                {
+                    "doctype": doc.doctype,
+                    "name": doc.name,
+                    "docstatus": 0,
+                    "properties": properties,
+                    "permissions": get_user_permissions(doc.permissions),
+                    "formwidth": formwidth,
+                }
+            )
+        # Store the schema the way it is sent to the client
+        return frappe.as_json(schema, indent=None)
 
-            temp_obj = {
-                "doctype": doc.doctype,
-                "name": doc.name,
-                "docstatus": docstatus,
-                "properties": properties,
-                "permissions": get_user_permissions(doc.permissions),
-                "formwidth": formwidth,
-            }
-            return_obj.append(temp_obj)
-            i += 1
+    return json.loads(get_cached(key, compile_schema, SCHEMA_CACHE_TTL))
+
+
+def apply_document_values(schema, doctype, doc_data, docstatus, name, event_data=False):
+    """
+    Adds the values that depend on the requested document to a compiled schema
+    """
+    for schema_doc in schema:
+        schema_doc["docstatus"] = docstatus
+        for prop in schema_doc["properties"]:
+            field = frappe._dict(fieldname=prop.get("fieldname"))
+            prop["default_value"] = get_default_value(field, doc_data, doctype)
+            if field.fieldname == "event":
+                # codes are data, not schema, so they are never served from the cache
+                prop["field_data"] = get_field_data(field, doctype, name, event_data)
 
-    if name and not frappe.db.exists(doctype, name):
-        return_obj.append({"error": "Record not found"})
-    return return_obj
+
+def clear_schema_cache(doc=None, method=None):
+    """
+    Invalidates the compiled schemas of `getdoctype`.
+    Called on save of DocType, Custom Field, Property Setter and Custom DocPerm.
+    """
+    bump_generation("schema")
 
 
 def get_meta_bundle(doctype, field_name=None):
@@ -347,15 +502,20 @@ def check_req_val(field, selectedfieldname, selectedfieldvalue):
 def check_eval_value(expression, selectedfieldname, selectedfieldvalue):
     """
     This function checks for eval part of depends on and
-    equired fields and returns True and False based on the eval expression
+    equired fields and returns True and False based on the eval expression.
+    The expression is compiled once (see g_healthy.expressions) and evaluated
+    with the selected field only, when that field decides it.
     """
-    # First, remove 'eval:' and potential semicolon at the end for cleaner processing
+    node = compile_expression(expression)
+    if node is not None:
+        result = evaluate_partial(node, {selectedfieldname: selectedfieldvalue})
+        if result is not None:
+            return result
+
+    # expressions depending on other fields, or that the compiler does not
+    # support (function calls...), only match on their `doc.field == "value"` parts
     clean_expression = expression.replace("eval:", "").strip().rstrip(";")
-
-    conditions = clean_expression.split("||")
-
-    # Evaluate each condition
-    for condition in conditions:
+    for condition in clean_expression.split("||"):
         pattern = r'doc\.(\w+)\s*(==|!=)\s*["\']([^"\']+)["\']'
         match = re.match(pattern, condition.strip())
 
@@ -376,10 +536,7 @@ def get_field_data(field, doctype, name, event_data=False):
     This function is useful when you need a doctype metadata for an Update Form
     """
 
-    if (
-        doctype in ["Log Details", "General Cargo Other Items"]
-        and field.fieldname == "event"
-    ):
+    if doctype in LIVE_FIELD_DATA_DOCTYPES and field.fieldname == "event":
         total_data = []
         codeGroup = frappe.get_all(
             "Logs Group", fields=["*"], filters={"status": ["!=", "Active"]}
@@ -572,30 +729,13 @@ def get_user_permissions(permissions):
     """
     This function converts frappe permissions object to a simple object with only needed fields
     """
-    roles = frappe.get_roles(frappe.session.user)
+    permissions_r = None
     if permissions:
-        for permission in permissions:
-            for role in roles:
-                if role in permission.role:
-                    if permission.permlevel == 0:
-                        if "Administrator" in roles:
-                            return {
-                                "read": 1,
-                                "create": 1,
-                                "delete": 1,
-                                "update": 1,
-                                "only_owner": 0,
-                            }
-                        else:
-                            return {
-                                "read": permission.read,
-                                "create": permission.create,
-                                "delete": permission.delete,
-                                "update": permission.write,
-                                "only_owner": permission.if_owner,
-                            }
+        permissions_r = get_permission_context().get_dashboard_permissions(
+            permissions[0].parent
+        )
 
-    return {
+    return permissions_r or {
         "read": 0,
         "create": 0,
         "delete": 0,
@@ -618,7 +758,7 @@ def get_hidden_info(field, permissions):
     """
     Based on user permission this function decides if we need to show or hide a particular field
     """
-    roles = frappe.get_roles(frappe.session.user)
+    roles = get_permission_context().role_set
     if field.hidden == 1:
         return 1
     else:
@@ -666,7 +806,7 @@ def get_read_info(field, permissions):
     """
     based on provided permissions this function decides if to set a field to readonly or not
     """
-    roles = frappe.get_roles(frappe.session.user)
+    roles = get_permission_context().role_set
     if field.read_only == 1:
         return 1
     else:
@@ -1,6 +1,8 @@
 import frappe
 from frappe import _
 
+from g_healthy.batch import run_batch, throw_on_failures
+
 
 @frappe.whitelist()
 def process_doctype_changes(doctype, data):
@@ -13,44 +15,33 @@ def process_doctype_changes(doctype, data):
     containing the names of the documents that were inserted, updated or deleted.\n
     The function will throw an error if the payload does not contain a doctype or
     if the name of a document is missing in an update or delete payload.\n
+    The changes are saved in one transaction by g_healthy.batch.run_batch: when
+    any of them fails nothing is saved, and the result of every item is sent
+    with the error as "results".\n
     """
-    try:
-        return_data = {"inserted": [], "updated": [], "deleted": []}
-
-        if not doctype:
-            frappe.throw(_("Doctype not specified in payload"))
-
-        # Handle Additions
-        add_array = data.get("addArray", [])
-        for item in add_array:
-            new_doc = frappe.new_doc(doctype)
-            new_doc.update(item)
-            new_doc.insert(ignore_permissions=True)
-            return_data["inserted"].append(new_doc.name)
-        # Handle Updates
-        update_array = data.get("updateArray", [])
-        for item in update_array:
-            doc_name = item.get("name")
-            if not doc_name:
-                frappe.throw(_("Document name missing in update payload"))
-            doc = frappe.get_doc(doctype, doc_name)
-            doc.update(item)
-            doc.save(ignore_permissions=True)
-            return_data["updated"].append(doc.name)
-
-        # Handle Deletions
-        delete_array = data.get("deleteArray", [])
-        for item in delete_array:
-            doc_name = item.get("name")
-            if not doc_name:
-                frappe.throw(_("Document name missing in delete payload"))
-            frappe.delete_doc(doctype, doc_name, ignore_permissions=True)
-            return_data["deleted"].append(doc_name)
-
-        return return_data
+    if not doctype:
+        frappe.throw(_("Doctype not specified in payload"))
 
+    data = frappe.parse_json(data) or {}
+    try:
+        results = run_batch(
+            doctype,
+            data.get("addArray"),
+            data.get("updateArray"),
+            data.get("deleteArray"),
+        )
     except Exception as e:
         frappe.log_error(
             frappe.get_traceback(), _("Error in handle_crane_working_times")
         )
         frappe.throw(str(e))
+
+    # nothing is kept when an item fails, the report tells which ones did
+    throw_on_failures(results)
+
+    return {
+        "inserted": [result["name"] for result in results["add"]],
+        "updated": [result["name"] for result in results["update"]],
+        "deleted": [result["name"] for result in results["delete"]],
+        "results": results,
+    }
@@ -1,12 +1,19 @@
 import json
 
 import frappe
-from frappe.utils.pdf import get_pdf
 from frappe.www.printview import (
     get_print_format_doc,
     get_print_style,
     get_rendered_template,
-    set_link_titles,
+)
+
+from g_healthy.enrichment import set_link_titles
+from g_healthy.pdf_renderer import get_pdf
+from g_healthy.render_cache import (
+    get_cached_html,
+    get_cached_pdf,
+    get_default_letterhead,
+    get_render_hash,
 )
 
 
@@ -34,27 +41,58 @@ def get_html_and_style(
 
     document.check_permission()
 
-    print_format = get_print_format_doc(print_format, meta=document.meta)
-    set_link_titles(document)
-
-    try:
-        html = get_rendered_template(
-            doc=document,
-            print_format=print_format,
-            meta=document.meta,
-            no_letterhead=no_letterhead,
-            letterhead=letterhead,
-            trigger_print=trigger_print,
-            settings=frappe.parse_json(settings),
+    print_format_doc = get_print_format_doc(print_format, meta=document.meta)
+
+    def render():
+        set_link_titles(document)
+
+        try:
+            html = get_rendered_template(
+                doc=document,
+                print_format=print_format_doc,
+                meta=document.meta,
+                no_letterhead=no_letterhead,
+                letterhead=letterhead,
+                trigger_print=trigger_print,
+                settings=frappe.parse_json(settings),
+            )
+        except frappe.TemplateNotFoundError:
+            frappe.clear_last_message()
+            html = None
+
+        return {
+            "html": html,
+            "style": get_print_style(style=style, print_format=print_format_doc),
+        }
+
+    if not isinstance(name, str):
+        # unsaved documents have no version to address a render by
+        return render()
+
+    # the formats used when none is given are resolved, so that editing them
+    # makes a new render
+    used_letterhead = None
+    if not no_letterhead:
+        used_letterhead = (
+            letterhead or document.get("letter_head") or get_default_letterhead()
         )
-    except frappe.TemplateNotFoundError:
-        frappe.clear_last_message()
-        html = None
 
-    return {
-        "html": html,
-        "style": get_print_style(style=style, print_format=print_format),
-    }
+    return get_cached_html(
+        get_render_hash(
+            document.doctype,
+            document.name,
+            document.modified,
+            print_format_doc and print_format_doc.name,
+            used_letterhead,
+            "html_and_style",
+            no_letterhead,
+            trigger_print,
+            style,
+            settings,
+            add_to_doc,
+        ),
+        render,
+    )
 
 
 def generate_pdf(invoice_number):
@@ -93,13 +131,27 @@ def generate_pdf(invoice_number):
         "transactions": logs_transactions,
     }
 
-    response = get_html_and_style(
-        "Dockage",
-        invoice_number,
-        print_format="Dockage",
-        add_to_doc=add_to_doc,
-        letterhead="Invoices Letterhead",
+    def render():
+        response = get_html_and_style(
+            "Dockage",
+            invoice_number,
+            print_format="Dockage",
+            add_to_doc=add_to_doc,
+            letterhead="Invoices Letterhead",
+        )
+        return get_pdf(response.get("html"), {"orientation": "Landscape"})
+
+    # the same invoice version is attached once per render
+    return get_cached_pdf(
+        get_render_hash(
+            "Dockage",
+            invoice_data.name,
+            invoice_data.modified,
+            "Dockage",
+            "Invoices Letterhead",
+            "pdf",
+            "Landscape",
+            add_to_doc,
+        ),
+        render,
     )
-
-    pdf_data = get_pdf(response.get("html"), {"orientation": "Landscape"})
-    return pdf_data
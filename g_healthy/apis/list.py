@@ -1,12 +1,26 @@
+import base64
 import json
 import datetime
 from collections import defaultdict
 import re
 
 import frappe
-
+from frappe import _
+from frappe.utils import cint
+
+from g_healthy.count import get_count
+from g_healthy.enrichment import (
+    enrich_owners_and_assignees,
+    get_record_link_titles,
+)
+from g_healthy.permissions import get_permission_context
+from g_healthy.search import get_list_query
 from g_healthy.utils import get_request_form_data
 
+# Hard cap for a page in cursor mode, whatever the client asks for
+MAX_CURSOR_PAGE_LENGTH = 500
+DEFAULT_CURSOR_PAGE_LENGTH = 20
+
 
 @frappe.whitelist()
 def get_list(
@@ -19,10 +33,25 @@ def get_list(
     book_versions=None,
     group_by=None,
     history=0,
+    pagination=None,
+    cursor=None,
+    fields=None,
 ):
-    roles = frappe.get_roles(frappe.session.user)
-    keys = []
-    link_keys = []
+    """
+    Returns a page of records of a doctype along with list view metadata.
+
+    By default pages are fetched with `start` / `page_length` offsets.
+    Passing `pagination="cursor"` (or a `cursor`) switches to keyset pagination:
+    records are fetched after the opaque `cursor` of the previous page, ordered by
+    the `order_by` column plus `name`, and the response carries a `next_cursor`
+    (None on the last page). Page length is capped to MAX_CURSOR_PAGE_LENGTH.
+
+    `total` is an estimate on large tables, `total_is_exact` tells which one it is.
+    `link_titles` maps linked doctype -> {name: title} for the Link columns.
+
+    Only the list view columns are fetched (see `get_list_fields`), unless an
+    explicit list of `fields` is passed.
+    """
     try:
         # Parse filters once
         if filters:
@@ -46,7 +75,6 @@ def get_list(
         # Get metadata and permissions in a single query
         meta = frappe.get_meta(doctype)
         permissions_r = None
-        fields = None
         has_multistep_form = 0
         multistep_form_name = ""
         has_tabs, show_non_standard_fields = 0, 0
@@ -71,179 +99,70 @@ def get_list(
             if docs[0].has_multistep_form == 1 and docs[0].has_multistep_form:
                 has_multistep_form = 1
                 multistep_form_name = docs[0].multistep_form_name
-            fields = docs[0].fields
-            permissions = docs[0].permissions
-            if permissions:
-                for permission in permissions:
-                    if permission.permlevel == 0:
-                        if "Administrator" in roles:
-                            permissions_r = {
-                                "read": 1,
-                                "create": 1,
-                                "delete": 1,
-                                "update": 1,
-                                "only_owner": 0,
-                            }
-                        else:
-                            if permission.role in roles:
-                                permissions_r = {
-                                    "read": permission.read,
-                                    "create": permission.create,
-                                    "delete": permission.delete,
-                                    "update": permission.write,
-                                    "only_owner": permission.if_owner,
-                                }
+            permissions_r = get_permission_context().get_dashboard_permissions(
+                doctype
+            )
 
         track_seen = meta.track_seen
 
-        # Handle global search efficiently
-        global_value = None
-        if filters and "global" in filters:
-            global_value = filters.pop("global")
+        # Global search is resolved against the search index within the list
+        # query, so that it applies to the whole table and is reflected in the total
+        search = filters.pop("global", None) if isinstance(filters, dict) else None
 
-        # Get data in a single query with all needed fields
-        fields_to_fetch = ["*"]
+        # Get data in a single query with only the fields shown in the list
+        fields_to_fetch = get_list_fields(doctype, fields=fields, order_by=order_by)
         if track_seen:
             fields_to_fetch.append("_seen")
         if show_non_standard_fields:
             fields_to_fetch.extend(["owner", "creation", "_assign"])
 
-        re_data = frappe.get_list(
-            doctype,
-            filters=filters,
-            or_filters=or_filters,
-            fields=fields_to_fetch,
-            order_by=order_by,
-            limit_start=start,
-            limit_page_length=page_length,
-            group_by=group_by,
-        )
+        next_cursor = None
+        if pagination == "cursor" or cursor:
+            re_data, next_cursor = get_cursor_page(
+                doctype,
+                filters=filters,
+                or_filters=or_filters,
+                fields=fields_to_fetch,
+                order_by=order_by,
+                cursor=cursor,
+                page_length=page_length,
+                group_by=group_by,
+                search=search,
+            )
+        else:
+            re_data = get_list_query(doctype, search).execute(
+                filters=filters,
+                or_filters=or_filters,
+                fields=fields_to_fetch,
+                order_by=order_by,
+                limit_start=start,
+                limit_page_length=page_length,
+                group_by=group_by,
+            )
 
-        # Handle global search filtering
-        if global_value:
-            filtered_data = []
-            for record in re_data:
-                for key_dict in keys:
-                    field_name = key_dict["key"]
-                    if field_name in record and global_value in str(record[field_name]):
-                        filtered_data.append(record)
-                        break
-            re_data = filtered_data
+        total_is_exact = True
         if book_versions and doctype == "Annual Dev Programme":
             total_count = frappe.db.count(
                 "List of ADPs", filters={"parent": book_versions}
             )
         else:
-            total_count = frappe.desk.reportview.get_count(
-                doctype=doctype, filters=filters
+            total_count, total_is_exact = get_count(
+                doctype, filters=filters, or_filters=or_filters, search=search
             )
 
-        # Handle link fields efficiently
-        if link_keys and re_data:
-            # Collect all link field values
-            link_values = {}
-            for key in link_keys:
-                docs_temp = get_meta_bundle(key.options)
-                title_field = "name"
-                if docs_temp and docs_temp[0] and docs_temp[0].title_field:
-                    title_field = docs_temp[0].title_field
-                if title_field == "name":
-                    continue
-
-                # Collect all unique values
-                unique_values = set()
-                for dat in re_data:
-                    current_key_id = getattr(dat, key.fieldname)
-                    if current_key_id:
-                        unique_values.add(current_key_id)
-
-                if unique_values:
-                    # Fetch all linked documents in one query
-                    linked_docs = frappe.get_all(
-                        key.options,
-                        filters={"name": ["in", list(unique_values)]},
-                        fields=["name", title_field],
-                    )
-                    link_values[key.fieldname] = {
-                        doc.name: doc[title_field] for doc in linked_docs
-                    }
+        # Titles of the Link columns, resolved per linked doctype
+        link_titles = get_record_link_titles(doctype, re_data) if re_data else {}
 
-            # Update records with link values
-            for dat in re_data:
-                for key in link_keys:
-                    if key.fieldname in link_values:
-                        current_key_id = getattr(dat, key.fieldname)
-                        if current_key_id in link_values[key.fieldname]:
-                            setattr(
-                                dat,
-                                key.fieldname,
-                                link_values[key.fieldname][current_key_id],
-                            )
-
-        # Handle assignments efficiently
+        # Resolve owners and assignees of the whole page at once
         if re_data and show_non_standard_fields:
-            doc_owners = set(dat.owner for dat in re_data if dat.owner)
-            owner_names = {}
-
-            if doc_owners:
-                user_records = frappe.get_all(
-                    "User",
-                    filters={"name": ["in", list(doc_owners)]},
-                    fields=["name", "full_name"],
-                )
-                owner_names = {
-                    "Administrator": "Admin",
-                    **{u.name: u.full_name for u in user_records},
-                }
-
-            for dat in re_data:
-                dat["owner_name"] = owner_names.get(dat.owner, dat.owner)
-            doc_names = [dat.name for dat in re_data]
-            if doc_names:
-                # Get all assignments in one query
-                assign_data = frappe.get_all(
-                    doctype,
-                    filters={"name": ["in", doc_names]},
-                    fields=["name", "_assign"],
-                )
-
-                # Get all assigned users in one query
-                assigned_users = set()
-                for row in assign_data:
-                    if row["_assign"]:
-                        assigned_users.update(json.loads(row["_assign"]))
-
-                if assigned_users:
-                    user_details = frappe.get_all(
-                        "User",
-                        filters={"email": ["in", list(assigned_users)]},
-                        fields=["email", "full_name"],
-                    )
-                    user_dict = {user.email: user.full_name for user in user_details}
-
-                    # Create assignment dictionary
-                    assign_dict = {}
-                    for row in assign_data:
-                        if row["_assign"]:
-                            assigned_users = json.loads(row["_assign"])
-                            assign_dict[row["name"]] = [
-                                {"email": email, "full_name": user_dict.get(email, "")}
-                                for email in assigned_users
-                            ]
-
-                    # Update records with assignment data
-                    for dat in re_data:
-                        dat["owner_name"] = (
-                            "Admin"
-                            if dat.owner == "Administrator"
-                            else frappe.db.get_value("User", dat.owner, "full_name")
-                        )
-                        if dat.name in assign_dict:
-                            dat["_assign"] = assign_dict[dat.name]
+            enrich_owners_and_assignees(re_data)
 
         return {
             "values": re_data,
             "total": total_count,
+            "total_is_exact": total_is_exact,
+            "link_titles": link_titles,
+            "next_cursor": next_cursor,
             "states": states,
             "permissions": permissions_r,
             "has_multistep_form": has_multistep_form,
@@ -254,6 +173,184 @@ def get_list(
         frappe.clear_messages()
 
 
+def get_cursor_page(
+    doctype,
+    filters=None,
+    or_filters=None,
+    fields=None,
+    order_by="creation desc",
+    cursor=None,
+    page_length=None,
+    group_by=None,
+    search=None,
+):
+    """
+    Returns a page of records that come after `cursor` and the cursor of the next page.
+
+    The position is expressed as a filter on (order_by column, name) instead of an
+    OFFSET, so every page costs the same. The order_by column should not be nullable.
+    """
+    fieldname, direction = parse_order_by(doctype, order_by)
+    operator = "<" if direction == "desc" else ">"
+    page_length = min(
+        cint(page_length) or DEFAULT_CURSOR_PAGE_LENGTH, MAX_CURSOR_PAGE_LENGTH
+    )
+    if fieldname == "name":
+        order_by = f"`tab{doctype}`.`name` {direction}"
+    else:
+        order_by = f"`tab{doctype}`.`{fieldname}` {direction}, `tab{doctype}`.`name` {direction}"
+
+    filters = get_filters_as_list(filters)
+    records = []
+    if cursor:
+        value, name = decode_cursor(cursor)
+        if fieldname == "name":
+            filters.append(["name", operator, name])
+        else:
+            # records sharing the value of the last record, placed after it by name
+            records = get_list_query(doctype, search).execute(
+                filters=[*filters, [fieldname, "=", value], ["name", operator, name]],
+                or_filters=or_filters,
+                fields=fields,
+                order_by=order_by,
+                limit_page_length=page_length + 1,
+                group_by=group_by,
+            )
+            filters.append([fieldname, operator, value])
+
+    if len(records) <= page_length:
+        records += get_list_query(doctype, search).execute(
+            filters=filters,
+            or_filters=or_filters,
+            fields=fields,
+            order_by=order_by,
+            limit_page_length=page_length + 1 - len(records),
+            group_by=group_by,
+        )
+
+    next_cursor = None
+    if len(records) > page_length:
+        records = records[:page_length]
+        next_cursor = encode_cursor(records[-1].get(fieldname), records[-1].name)
+
+    return records, next_cursor
+
+
+def get_list_fields(doctype, fields=None, order_by=None, user=None):
+    """
+    Returns the fields to fetch for a list of a doctype.
+
+    Explicit `fields` are validated against the columns of the doctype, otherwise
+    the projection is made of the List View Settings and User List Settings
+    columns plus the fields every list needs. Falls back to `*` when the doctype
+    has no list settings at all.
+    """
+    meta = frappe.get_meta(doctype)
+    valid_columns = set(meta.get_valid_columns()) | set(frappe.model.optional_fields)
+    valid_columns.discard("doctype")
+
+    if fields:
+        if isinstance(fields, str):
+            fields = json.loads(fields)
+        for fieldname in fields:
+            if fieldname not in valid_columns:
+                frappe.throw(
+                    _("Field {0} is not a column of {1}").format(fieldname, doctype),
+                    frappe.ValidationError,
+                )
+        requested = list(fields)
+    else:
+        requested = [
+            field.get("fieldname")
+            for field in json.loads(
+                frappe.get_cached_value("List View Settings", doctype, "fields") or "[]"
+            )
+        ]
+        requested.extend(
+            frappe.parse_json(
+                frappe.db.get_value(
+                    "User List Settings",
+                    {"user": user or frappe.session.user, "ref_doctype": doctype},
+                    "fields",
+                )
+            )
+            or []
+        )
+        if not requested:
+            return ["*"]
+
+    requested.extend(["name", "modified", "docstatus"])
+    requested.extend(
+        df.fieldname
+        for df in meta.fields
+        if df.fieldname == "status" or df.fieldtype == "Status" or df.get("is_status")
+    )
+    if meta.title_field:
+        requested.append(meta.title_field)
+    # the sort columns are needed by the cursor of keyset pagination
+    for part in (order_by or "").split(","):
+        if part.strip():
+            requested.append(part.replace("`", "").split()[0].split(".")[-1])
+
+    return [
+        fieldname
+        for fieldname in dict.fromkeys(requested)
+        if fieldname in valid_columns
+    ]
+
+
+def parse_order_by(doctype, order_by):
+    """
+    Returns fieldname and direction of a single column order_by e.g. `creation desc`
+    """
+    parts = (order_by or "creation desc").replace("`", "").split()
+    if not parts or len(parts) > 2 or "," in order_by:
+        frappe.throw(_("Cursor pagination supports ordering by a single column"))
+
+    fieldname = parts[0].split(".")[-1]
+    direction = parts[1].lower() if len(parts) == 2 else "asc"
+    if direction not in ("asc", "desc"):
+        frappe.throw(_("Invalid sort order {0}").format(parts[1]))
+    if fieldname not in frappe.model.default_fields and not frappe.get_meta(
+        doctype
+    ).has_field(fieldname):
+        frappe.throw(_("Cannot sort {0} by {1}").format(doctype, fieldname))
+
+    return fieldname, direction
+
+
+def get_filters_as_list(filters):
+    """
+    Converts dict filters to a list of [fieldname, operator, value] filters,
+    so that more than one condition can be added for the same field
+    """
+    if not filters:
+        return []
+    if isinstance(filters, dict):
+        return [
+            (
+                [fieldname, *value]
+                if isinstance(value, list | tuple)
+                else [fieldname, "=", value]
+            )
+            for fieldname, value in filters.items()
+        ]
+    return list(filters)
+
+
+def encode_cursor(value, name):
+    data = json.dumps([value, name], default=str)
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        frappe.throw(_("Invalid cursor"))
+    return value, name
+
+
 def get_meta_bundle(doctype):
     bundle = [frappe.desk.form.meta.get_meta(doctype)]
     for df in bundle[0].fields:
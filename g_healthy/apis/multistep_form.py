@@ -1,5 +1,16 @@
 import frappe
-from g_healthy.apis.api import getdoctype
+from frappe import _
+from frappe.model.utils.user_settings import get_user_settings
+
+from g_healthy.apis.api import (
+    LIVE_FIELD_DATA_DOCTYPES,
+    check_read_permission,
+    get_doctype_schema,
+    get_meta_bundle,
+    load_document,
+)
+from g_healthy.cache import get_generation
+from g_healthy.etag import conditional_response
 
 
 @frappe.whitelist()
@@ -8,6 +19,9 @@ def getform(form_id, name=None, selectedfieldname=None, selectedfieldvalue=None)
     Returns doctype fields including their metadata for multistep form\n
     Multistep form should be present in MultiStep Forms Doctype
 
+    All the tabs are loaded at once, and each doctype of the form is checked,
+    loaded and compiled only once whatever the number of its tabs.
+
     method
     ------
     GET
@@ -20,50 +34,121 @@ def getform(form_id, name=None, selectedfieldname=None, selectedfieldvalue=None)
     --------
     Object
     """
-    if frappe.db.exists("MultiStep Forms", form_id):
-        multistep_form = frappe.get_doc("MultiStep Forms", form_id)
+    if not frappe.db.exists("MultiStep Forms", form_id):
+        frappe.throw("Form not found!")
+
+    multistep_form = frappe.get_doc("MultiStep Forms", form_id)
+    tab_names = [tab.tab for tab in multistep_form.tabs]
+    if not tab_names:
+        return []
+
+    tabs = {
+        tab.name: tab
+        for tab in frappe.get_all(
+            "Multiform Tabs",
+            filters={"name": ["in", tab_names]},
+            fields=["name", "tab_title", "doctype_name", "modified"],
+        )
+    }
+    for tab_name in tab_names:
+        if tab_name not in tabs:
+            frappe.throw(
+                _("Multiform Tabs {0} not found").format(tab_name),
+                frappe.DoesNotExistError,
+            )
+
+    tab_fields = {}
+    for row in frappe.get_all(
+        "Multiform Tab Fields",
+        filters={"parenttype": "Multiform Tabs", "parent": ["in", tab_names]},
+        fields=["parent", "field_name", "print_width"],
+        order_by="idx asc",
+    ):
+        tab_fields.setdefault(row.parent, []).append(row)
+
+    # meta bundle and document of every doctype of the form
+    bundles = {}
+    for tab_name in tab_names:
+        doctype = tabs[tab_name].doctype_name
+        if doctype not in bundles:
+            doc_data = load_document(doctype, name)
+            check_read_permission(doctype, name)
+            bundles[doctype] = (get_meta_bundle(doctype), doc_data)
+
+    # as when the tabs were loaded one by one, the settings of the last doctype
+    frappe.response["user_settings"] = get_user_settings(
+        tabs[tab_names[-1]].doctype_name
+    )
+
+    def build_form():
+        schemas = {}
         form_data = []
-        if multistep_form.tabs:
-            for tab in multistep_form.tabs:
-                tab_data = {}
-                tab_details = frappe.get_doc("Multiform Tabs", tab.tab)
-                tab_data["tab_title"] = tab_details.tab_title
-                tab_data["doctype"] = tab_details.doctype_name
-                if (
-                    form_id == "FORM-001040"
-                    and selectedfieldname
-                    and not selectedfieldvalue
-                    and tab.tab == "FORM-TAB-001012"
-                ):
-                    only_send_ticket_type = True
-                else:
-                    only_send_ticket_type = False
-                fields_information = getdoctype(
-                    tab_details.doctype_name,
-                    showall=True,
+        for tab_name in tab_names:
+            tab_details = tabs[tab_name]
+            doctype = tab_details.doctype_name
+            only_send_ticket_type = bool(
+                form_id == "FORM-001040"
+                and selectedfieldname
+                and not selectedfieldvalue
+                and tab_name == "FORM-TAB-001012"
+            )
+            if (doctype, only_send_ticket_type) not in schemas:
+                docs, doc_data = bundles[doctype]
+                schemas[(doctype, only_send_ticket_type)] = get_doctype_schema(
+                    doctype,
+                    docs,
+                    doc_data,
                     name=name,
+                    showall=True,
                     selectedfieldname=selectedfieldname,
                     selectedfieldvalue=selectedfieldvalue,
                     only_send_ticket_type=only_send_ticket_type,
+                    cache_parts=(False, None),
                 )
-                # return fields_information
-                permissions = fields_information[0]["permissions"]
-                properties_dict = {
-                    prop["fieldname"]: prop
-                    for prop in fields_information[0]["properties"]
+            fields_information = schemas[(doctype, only_send_ticket_type)]
+
+            properties_dict = {
+                prop["fieldname"]: prop for prop in fields_information[0]["properties"]
+            }
+            result_list = []
+            for item in tab_fields.get(tab_name, []):
+                # Get the corresponding properties using the field_name
+                properties_item = properties_dict.get(item.field_name)
+                if properties_item:
+                    result_list.append({**properties_item, "span": item.print_width})
+
+            form_data.append(
+                {
+                    "tab_title": tab_details.tab_title,
+                    "doctype": doctype,
+                    "properties": result_list,
+                    "permissions": fields_information[0]["permissions"],
                 }
-                result_list = []
-                for item in tab_details.fields:
-                    # Get the corresponding properties using the field_name
-                    properties_item = properties_dict.get(item.field_name)
-                    if properties_item:
-                        properties_item["span"] = item.print_width
-                        # Append the properties to the result_list
-
-                        result_list.append(properties_item)
-                tab_data["properties"] = result_list
-                tab_data["permissions"] = permissions
-                form_data.append(tab_data)
+            )
         return form_data
-    else:
-        frappe.throw("Form not found!")
+
+    # the event field of these lists live data
+    if any(doctype in LIVE_FIELD_DATA_DOCTYPES for doctype in bundles):
+        return build_form()
+
+    return conditional_response(
+        (
+            "getform",
+            form_id,
+            str(multistep_form.modified),
+            [str(tabs[tab_name].modified) for tab_name in tab_names],
+            {
+                doctype: (
+                    [str(doc.modified) for doc in docs],
+                    doc_data and str(doc_data.modified),
+                )
+                for doctype, (docs, doc_data) in bundles.items()
+            },
+            get_generation("schema"),
+            frappe.response["user_settings"],
+            name,
+            selectedfieldname,
+            selectedfieldvalue,
+        ),
+        build_form,
+    )
@@ -1,11 +1,17 @@
 import re
 
 import frappe
-from frappe.utils.pdf import get_pdf
+from frappe.www.printview import validate_print_permission
 
 from g_healthy.apis.query_report import provide_binary_file
 
 from g_healthy.apis.email import get_html_and_style
+from g_healthy.pdf_renderer import get_pdf
+from g_healthy.render_cache import (
+    get_cached_pdf,
+    get_default_letterhead,
+    get_render_hash,
+)
 from datetime import datetime
 from calendar import monthrange
 from collections import defaultdict
@@ -29,13 +35,31 @@ def preview_and_download(dt, dn):
         or "Standard"
     )
 
-    add_to_doc = {}
+    doc = frappe.get_doc(dt, dn)
+    # checked by frappe.get_print, which a cached PDF skips
+    validate_print_permission(doc)
 
-    html = frappe.get_print(dt, dn, print_format=pdf_format)
+    def render():
+        html = frappe.get_print(dt, dn, print_format=pdf_format, doc=doc)
 
-    html = re.sub(
-        r'<div class="action-banner print-hide">.*?</div>', "", html, flags=re.DOTALL
+        html = re.sub(
+            r'<div class="action-banner print-hide">.*?</div>',
+            "",
+            html,
+            flags=re.DOTALL,
+        )
+        return get_pdf(html)
+
+    pdf_content = get_cached_pdf(
+        get_render_hash(
+            dt,
+            dn,
+            doc.modified,
+            pdf_format,
+            get_default_letterhead(),
+            "preview_and_download",
+        ),
+        render,
     )
-    pdf_content = get_pdf(html)
 
     provide_binary_file(dt, dn, "pdf", pdf_content)
@@ -1,8 +1,10 @@
+import copy
 import datetime
+import itertools
 import json
 import os
+import tempfile
 from datetime import timedelta
-from playwright.sync_api import sync_playwright
 
 import frappe
 import frappe.desk.reportview
@@ -14,13 +16,42 @@ from frappe.modules import get_module_path, scrub
 from frappe.monitor import add_data_to_monitor
 from frappe.permissions import get_role_permissions
 from frappe.utils import cint, cstr, flt, format_duration, get_html_format, sbool
-from frappe.utils.pdf import get_pdf
 from frappe.desk.query_report import run
-from frappe.desk.utils import get_csv_bytes, pop_csv_params
+from frappe.desk.utils import pop_csv_params
 from frappe.core.doctype.prepared_report.prepared_report import (
     get_completed_prepared_report,
 )
-from frappe.utils.xlsxutils import make_xlsx
+from frappe.utils.safe_exec import check_safe_sql_query
+
+from g_healthy.enrichment import get_link_titles
+from g_healthy.etag import conditional_response
+from g_healthy.pdf_renderer import get_pdf
+from g_healthy.report_result import ReportResult
+from g_healthy.report_jobs import (
+    complete_export,
+    enqueue_export,
+    fail_export,
+    get_export_file_name,
+    get_user_export_status,
+    save_export_content,
+    save_export_file,
+    set_export_status,
+    track_progress,
+)
+from g_healthy.report_cache import get_cached_report_result, get_report_cache_key
+from g_healthy.report_html import render_report_html
+from g_healthy.report_export import (
+    get_header_rows,
+    iter_export_rows,
+    iter_spooled_chunks,
+    make_file_response,
+    spool_rows,
+    unbuffered_cursor,
+    write_csv,
+    write_xlsx,
+)
+
+EXPORT_JOB_METHOD = "g_healthy.apis.query_report.run_export_job"
 
 
 def get_report_doc(report_name):
@@ -87,6 +118,24 @@ def generate_report_result(
     is_tree=False,
     parent_field=None,
 ):
+    data = build_report_result(
+        report, filters, user, custom_columns, is_tree, parent_field
+    )
+    return {**data, "result": data["result"].to_rows()}
+
+
+@frappe.read_only()
+def build_report_result(
+    report,
+    filters=None,
+    user=None,
+    custom_columns=None,
+    is_tree=False,
+    parent_field=None,
+):
+    """
+    Same as `generate_report_result`, with the result as a `ReportResult`
+    """
     user = user or frappe.session.user
     filters = filters or []
 
@@ -98,9 +147,9 @@ def generate_report_result(
     columns, result, message, chart, report_summary, skip_total_row = ljust_list(res, 6)
     columns = [get_column_as_dict(col) for col in (columns or [])]
     report_column_names = [col["fieldname"] for col in columns]
-    # convert to list of dicts
+    # convert to columns keyed by fieldname
 
-    result = normalize_result(result, columns)
+    result = ReportResult.from_rows(result, columns)
 
     if report.custom_columns:
         # saved columns (with custom columns / with different column order)
@@ -139,25 +188,54 @@ def generate_report_result(
     }
 
 
-def normalize_result(result, columns):
-    # Converts to list of dicts from list of lists/tuples
-    data = []
-    column_names = [column["fieldname"] for column in columns]
-    if result and isinstance(result[0], list | tuple):
-        for row in result:
-            row_obj = {}
-            for idx, column_name in enumerate(column_names):
-                row_obj[column_name] = row[idx]
-            data.append(row_obj)
-    else:
-        data = result
-
-    return data
+def get_report_result_cached(
+    report,
+    filters=None,
+    user=None,
+    custom_columns=None,
+    is_tree=False,
+    parent_field=None,
+):
+    """
+    Same as `build_report_result`, with the results of slow reports cached
+    """
+    user = user or frappe.session.user
+    return get_cached_report_result(
+        get_report_cache_key(
+            report, filters, user, custom_columns, is_tree, parent_field
+        ),
+        lambda: build_report_result(
+            report, filters, user, custom_columns, is_tree, parent_field
+        ),
+    )
 
 
 @frappe.whitelist()
 def get_script(report_name):
+    # checks the permissions, also when the response is a 304
     report = get_report_doc(report_name)
+    script_path, print_path = get_report_file_paths(report)
+    return conditional_response(
+        (
+            "report_script",
+            report_name,
+            str(report.modified),
+            report.get("custom_report")
+            and str(frappe.db.get_value("Report", report_name, "modified")),
+            [get_file_mtime(path) for path in (script_path, print_path)],
+            # includes of the script are only picked up by a release
+            get_app_version(report.module),
+            frappe.cache.hget("report_execution_time", report_name) or 0,
+        ),
+        lambda: build_script(report_name, report, script_path, print_path),
+    )
+
+
+def get_report_file_paths(report):
+    """
+    Returns the paths of the `.js` and `.html` files of a report, empty for
+    the reports of custom modules
+    """
     module = report.module or frappe.db.get_value(
         "DocType", report.ref_doctype, "module"
     )
@@ -175,7 +253,22 @@ def get_script(report_name):
     print_path = report_folder and os.path.join(
         report_folder, scrub(report.name) + ".html"
     )
+    return script_path, print_path
+
 
+def get_file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns if path else None
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def get_app_version(module):
+    app = module and frappe.local.module_app.get(scrub(module))
+    return app and getattr(frappe.get_module(app), "__version__", None)
+
+
+def build_script(report_name, report, script_path, print_path):
     script = None
     if os.path.exists(script_path):
         with open(script_path) as f:
@@ -218,7 +311,13 @@ def custom_run(
     is_tree=False,
     parent_field=None,
     are_default_filters=True,
+    as_columns=False,
 ):
+    """
+    Runs a report. With `as_columns` the rows are sent in the columnar form of
+    `ReportResult.to_columns` instead of a list of dicts. `link_titles` maps
+    linked doctype -> {name: title} for the Link columns.
+    """
     report = get_report_doc(report_name)
     if not user:
         user = frappe.session.user
@@ -247,10 +346,21 @@ def custom_run(
             else:
                 dn = ""
             result = get_prepared_report_result(report, filters, dn, user)
+            result["link_titles"] = get_report_link_titles(
+                result.get("columns") or [], result.get("result") or []
+            )
         else:
-            result = generate_report_result(
+            result = get_report_result_cached(
                 report, filters, user, custom_columns, is_tree, parent_field
             )
+            result["link_titles"] = get_report_link_titles(
+                result["columns"], result["result"]
+            )
+            result["result"] = (
+                result["result"].to_columns()
+                if sbool(as_columns)
+                else result["result"].to_rows()
+            )
             add_data_to_monitor(report=report.reference_report or report.name)
     except Exception:
         frappe.log_error("Report Error")
@@ -280,23 +390,25 @@ def add_custom_column_data(custom_columns, result):
     for column in custom_columns:
         key = (column.get("doctype"), column.get("fieldname"))
         if key in custom_column_data:
-            for row in result:
-                link_field = column.get("link_field")
+            link_field = column.get("link_field")
 
-                # backwards compatibile `link_field`
-                # old custom reports which use `str` should not break.
-                if isinstance(link_field, str):
-                    link_field = frappe._dict({"fieldname": link_field, "names": []})
+            # backwards compatibile `link_field`
+            # old custom reports which use `str` should not break.
+            if isinstance(link_field, str):
+                link_field = frappe._dict({"fieldname": link_field, "names": []})
 
-                row_reference = row.get(link_field.get("fieldname"))
-                # possible if the row is empty
-                if not row_reference:
-                    continue
-                if key[0] in doctype_names_from_custom_field:
-                    column["fieldname"] = column.get("id")
-                row[column.get("fieldname")] = custom_column_data.get(key).get(
-                    row_reference
-                )
+            row_references = result.values(link_field.get("fieldname"))
+            # possible if the rows are empty
+            if not any(row_references):
+                continue
+            if key[0] in doctype_names_from_custom_field:
+                column["fieldname"] = column.get("id")
+
+            field_values = custom_column_data.get(key)
+            values = result.column(column.get("fieldname"))
+            for idx, row_reference in enumerate(row_references):
+                if row_reference:
+                    values[idx] = field_values.get(row_reference)
 
     return result
 
@@ -339,11 +451,15 @@ def get_prepared_report_result(report, filters, dn="", user=None):
 
 @frappe.whitelist()
 def export_query():
-    """export from query reports"""
-    form_params = frappe._dict(frappe.local.form_dict)
-    csv_params = pop_csv_params(form_params)
-    clean_params(form_params)
-    parse_json(form_params)
+    """export from query reports
+
+    The rows are written one chunk at a time to a temporary file which is then
+    streamed, so the memory used does not grow with the size of the report.
+    With `run_in_background` the export runs on the long queue and the status
+    of the job is returned instead, see `get_export_status`.
+    """
+    params = dict(frappe.local.form_dict)
+    form_params, csv_params = parse_export_params(params)
 
     report_name = form_params.report_name
     frappe.permissions.can_export(
@@ -351,217 +467,313 @@ def export_query():
         raise_exception=True,
     )
 
+    if sbool(form_params.run_in_background):
+        return enqueue_export(EXPORT_JOB_METHOD, "export_query", report_name, params)
+
+    export = build_query_export(form_params, csv_params)
+    if not export:
+        frappe.respond_as_web_page(
+            _("No data to export"),
+            _("You can try changing the filters of your report."),
+        )
+        return
+
+    file_extension, export_file = export
+    return make_file_response(
+        export_file, f"Report-{report_name}.{file_extension}", file_extension
+    )
+
+
+def parse_export_params(params):
+    form_params = frappe._dict(params)
+    csv_params = pop_csv_params(form_params)
+    clean_params(form_params)
+    parse_json(form_params)
+    return form_params, csv_params
+
+
+def build_query_export(form_params, csv_params, export_job_id=None):
+    """
+    Writes the export of a report to a temporary file, returns the file extension
+    and the file, None when the report has no columns
+    """
     file_format_type = form_params.file_format_type
+    if file_format_type not in ("CSV", "Excel"):
+        frappe.throw(_("Unsupported file format: {0}").format(file_format_type))
+
     custom_columns = frappe.parse_json(form_params.custom_columns or "[]")
-    include_indentation = form_params.include_indentation
-    include_filters = form_params.include_filters
     visible_idx = form_params.visible_idx
 
     if isinstance(visible_idx, str):
         visible_idx = json.loads(visible_idx)
 
-    # Ensure visible_idx is not None
-    if visible_idx is None:
-        visible_idx = []
-
-    data = custom_run(
-        report_name,
+    columns, rows = iter_report_result(
+        get_report_doc(form_params.report_name),
         form_params.filters,
         custom_columns=custom_columns,
-        are_default_filters=False,
     )
-    data = frappe._dict(data)
-    data.filters = form_params.applied_filters
 
-    if not data.columns:
-        frappe.respond_as_web_page(
-            _("No data to export"),
-            _("You can try changing the filters of your report."),
-        )
-        return
+    if not columns:
+        return None
+
+    if export_job_id:
+        rows = track_progress(export_job_id, rows)
+
+    return write_export_file(
+        columns,
+        rows,
+        file_format_type,
+        csv_params=csv_params,
+        visible_idx=visible_idx,
+        include_indentation=form_params.include_indentation,
+        include_filters=form_params.include_filters,
+        filters=form_params.applied_filters,
+    )
 
-    format_duration_fields(data)
-    xlsx_data, column_widths = build_xlsx_data(
-        data, visible_idx, include_indentation, include_filters=include_filters
+
+def write_export_file(
+    columns,
+    rows,
+    file_format_type,
+    csv_params=None,
+    visible_idx=None,
+    include_indentation=False,
+    include_filters=False,
+    filters=None,
+):
+    """
+    Writes the rows of a report to a temporary file as CSV or Excel,
+    returns the file extension and the file rewound
+    """
+    # a report without rows is exported with its header only
+    header_rows, column_widths = get_header_rows(columns, filters, include_filters)
+    export_rows = itertools.chain(
+        header_rows,
+        iter_export_rows(columns, rows, visible_idx, include_indentation),
     )
 
-    if file_format_type == "CSV":
-        content = get_csv_bytes(xlsx_data, csv_params)
-        file_extension = "csv"
-    elif file_format_type == "Excel":
+    export_file = tempfile.TemporaryFile()
+    try:
+        if file_format_type == "CSV":
+            file_extension = "csv"
+            write_csv(export_file, export_rows, csv_params)
+        else:
+            file_extension = "xlsx"
+            write_xlsx(export_file, export_rows, "Query Report", column_widths)
+    except Exception:
+        export_file.close()
+        raise
 
-        file_extension = "xlsx"
-        content = make_xlsx(
-            xlsx_data, "Query Report", column_widths=column_widths
-        ).getvalue()
+    export_file.seek(0)
+    return file_extension, export_file
 
-    provide_binary_file("Report", report_name, file_extension, content)
 
+def iter_report_result(report, filters=None, user=None, custom_columns=None):
+    """
+    Returns the columns of a report and an iterator over its rows, with the
+    same custom columns, permission filtering and total row as
+    `generate_report_result`.
 
-def format_duration_fields(data: frappe._dict) -> None:
-    for i, col in enumerate(data.columns):
-        if col.get("fieldtype") != "Duration":
-            continue
+    The rows of Query Reports are read with an unbuffered cursor, spooled to
+    disk and processed one chunk at a time. Other report types build their
+    result in memory.
+    """
+    user = user or frappe.session.user
+    filters = filters or {}
 
-        for row in data.result:
-            index = col.get("fieldname") if isinstance(row, dict) else i
-            if row[index]:
-                row[index] = format_duration(row[index])
+    if filters and isinstance(filters, str):
+        filters = json.loads(filters)
 
+    if report.report_type != "Query Report":
+        data = get_report_result_cached(report, filters, user, custom_columns)
+        return data["columns"], data["result"].iter_rows()
 
-def build_xlsx_data(
-    data,
-    visible_idx,
-    include_indentation,
-    include_filters=False,
-    ignore_visible_idx=False,
-):
-    EXCEL_TYPES = (
-        str,
-        bool,
-        type(None),
-        int,
-        float,
-        datetime.datetime,
-        datetime.date,
-        datetime.time,
-        datetime.timedelta,
-    )
-    if len(data.message) == 0:
-        return frappe.throw(
-            _("No data to export"),
-            _("You can try changing the filters of your report."),
-        )
-    if len(visible_idx) == len(data.message) or not visible_idx:
-        # It's not possible to have the same length and different content.
-        ignore_visible_idx = True
-    else:
-        # Note: converted for faster lookups
-        visible_idx = set(visible_idx)
+    columns, chunks = spool_query_report(report, filters)
+    columns = [get_column_as_dict(col) for col in columns]
+    report_columns = list(columns)
+    report_column_names = [col["fieldname"] for col in columns]
 
-    result = []
-    column_widths = []
+    if report.custom_columns:
+        # saved columns (with custom columns / with different column order)
+        columns = report.custom_columns
 
-    if cint(include_filters):
-        filter_data = []
-        filters = data.filters
-        for filter_name, filter_value in filters.items():
-            if not filter_value:
-                continue
-            filter_value = (
-                ", ".join([cstr(x) for x in filter_value])
-                if isinstance(filter_value, list)
-                else cstr(filter_value)
-            )
-            filter_data.append([cstr(filter_name), filter_value])
-        filter_data.append([])
-        result += filter_data
+    # unsaved custom_columns
+    if custom_columns:
+        for custom_column in custom_columns:
+            columns.insert(custom_column["insert_after_index"] + 1, custom_column)
 
-    column_data = []
-    for column in data.columns:
-        if column.get("hidden"):
-            continue
-        column_data.append(_(column.get("label")))
-        column_width = cint(column.get("width", 0))
-        # to convert into a scale accepted by openpyxl
-        column_width /= 10
-        column_widths.append(column_width)
-    result.append(column_data)
-
-    # build table from result
-    for row_idx, row in enumerate(data.message):
-        # only pick up rows that are visible in the report
-        if ignore_visible_idx or row_idx in visible_idx:
-            row_data = []
-            if isinstance(row, dict):
-                for col_idx, column in enumerate(data.columns):
-                    if column.get("hidden"):
-                        continue
-                    label = column.get("label")
-                    fieldname = column.get("fieldname")
-                    cell_value = row.get(fieldname, row.get(label, ""))
-                    if not isinstance(cell_value, EXCEL_TYPES):
-                        cell_value = cstr(cell_value)
+    # all columns which are not in original report
+    report_custom_columns = [
+        column for column in columns if column["fieldname"] not in report_column_names
+    ]
+    # add_custom_column_data renames the columns it fills, each chunk starts
+    # from the saved definition
+    saved_custom_columns = copy.deepcopy(report_custom_columns)
+
+    def iter_rows():
+        totals = TotalRow(columns) if cint(report.add_total_row) else None
+        for chunk in chunks:
+            result = ReportResult.from_rows(chunk, report_columns)
+
+            if report_custom_columns:
+                for column, saved_column in zip(
+                    report_custom_columns, saved_custom_columns, strict=True
+                ):
+                    column.update(copy.deepcopy(saved_column))
+                result = add_custom_column_data(report_custom_columns, result)
+
+            result = get_filtered_data(report.ref_doctype, columns, result, user)
+            if totals:
+                totals.add(result)
+            yield from result.iter_rows()
+
+        if totals and totals.count:
+            yield totals.get_row()
 
-                    if cint(include_indentation) and "indent" in row and col_idx == 0:
-                        cell_value = ("    " * cint(row["indent"])) + cstr(cell_value)
-                    row_data.append(cell_value)
-            elif row:
-                row_data = row
+    return columns, iter_rows()
 
-            result.append(row_data)
 
-    return result, column_widths
+@frappe.read_only()
+def spool_query_report(report, filters):
+    """
+    Runs the query of a Query Report and spools its rows to disk,
+    returns the columns and an iterator over chunks of rows
+    """
+    if not report.query:
+        frappe.throw(_("Must specify a Query to run"), title=_("Report Document Error"))
+
+    check_safe_sql_query(report.query)
+
+    with unbuffered_cursor():
+        rows = frappe.db.sql(report.query, filters, as_iterator=True)
+        columns = report.get_columns() or [
+            cstr(c[0]) for c in frappe.db.get_description()
+        ]
+        spool = spool_rows(rows)
+
+    return columns, iter_spooled_chunks(spool)
 
 
 def add_total_row(result, columns, meta=None, is_tree=False, parent_field=None):
-    total_row = [""] * len(columns)
-    has_percent = []
-
-    for i, col in enumerate(columns):
-        fieldtype, options, fieldname = None, None, None
-        if isinstance(col, str):
-            if meta:
-                # get fieldtype from the meta
-                field = meta.get_field(col)
-                if field:
-                    fieldtype = meta.get_field(col).fieldtype
-                    fieldname = meta.get_field(col).fieldname
-            else:
-                col = col.split(":")
-                if len(col) > 1:
-                    if col[1]:
-                        fieldtype = col[1]
-                        if "/" in fieldtype:
-                            fieldtype, options = fieldtype.split("/")
-                    else:
-                        fieldtype = "Data"
-        else:
-            fieldtype = col.get("fieldtype")
-            fieldname = col.get("fieldname")
-            options = col.get("options")
+    totals = TotalRow(columns, meta=meta, is_tree=is_tree, parent_field=parent_field)
+    totals.add(result)
+    if isinstance(result, ReportResult):
+        result.total_row = totals.get_row()
+    else:
+        result.append(totals.get_row())
+    return result
 
-        for row in result:
-            if i >= len(row):
+
+class TotalRow:
+    """
+    Total row of a report, accumulated one chunk of rows at a time with
+    operations on whole columns
+    """
+
+    def __init__(self, columns, meta=None, is_tree=False, parent_field=None):
+        self.columns = columns
+        self.is_tree = is_tree
+        self.parent_field = parent_field
+        self.total_row = [""] * len(columns)
+        self.has_percent = []
+        self.count = 0
+        self.column_types = [get_total_column_type(col, meta) for col in columns]
+
+    def add(self, result):
+        if not isinstance(result, ReportResult):
+            result = ReportResult.from_rows(result)
+        if not result:
+            return
+
+        total_row = self.total_row
+        row_lengths = result.row_lengths()
+        # child rows of a tree are already summed in their parent
+        is_child = (
+            [bool(parent) for parent in result.values(self.parent_field)]
+            if self.is_tree
+            else [False] * len(result)
+        )
+
+        for i, (fieldtype, _options, fieldname) in enumerate(self.column_types):
+            values = result.values(fieldname if result.is_dict else i)
+            # same as skipping the cells past the length of their row
+            cells = [
+                (value, is_child[idx])
+                for idx, value in enumerate(values)
+                if row_lengths[idx] > i
+            ]
+            if not cells:
                 continue
-            cell = row.get(fieldname) if isinstance(row, dict) else row[i]
-            if fieldtype in ["Currency", "Int", "Float", "Percent", "Duration"] and flt(
-                cell
-            ):
-                if not (is_tree and row.get(parent_field)):
-                    total_row[i] = flt(total_row[i]) + flt(cell)
-
-            if fieldtype == "Percent" and i not in has_percent:
-                has_percent.append(i)
-
-            if fieldtype == "Time" and cell:
-                if not total_row[i]:
-                    total_row[i] = timedelta(hours=0, minutes=0, seconds=0)
-                total_row[i] = total_row[i] + cell
-
-        if fieldtype == "Link" and options == "Currency":
-            total_row[i] = (
-                result[0].get(fieldname)
-                if isinstance(result[0], dict)
-                else result[0][i]
-            )
 
-    for i in has_percent:
-        total_row[i] = flt(total_row[i]) / len(result)
+            if fieldtype in ["Currency", "Int", "Float", "Percent", "Duration"]:
+                for value, child in cells:
+                    if flt(value) and not child:
+                        total_row[i] = flt(total_row[i]) + flt(value)
 
-    first_col_fieldtype = None
-    if isinstance(columns[0], str):
-        first_col = columns[0].split(":")
-        if len(first_col) > 1:
-            first_col_fieldtype = first_col[1].split("/", 1)[0]
-    else:
-        first_col_fieldtype = columns[0].get("fieldtype")
+            if fieldtype == "Percent" and i not in self.has_percent:
+                self.has_percent.append(i)
+
+            if fieldtype == "Time":
+                for value, _child in cells:
+                    if not value:
+                        continue
+                    if not total_row[i]:
+                        total_row[i] = timedelta(hours=0, minutes=0, seconds=0)
+                    total_row[i] = total_row[i] + value
+
+        for i, (fieldtype, options, fieldname) in enumerate(self.column_types):
+            if fieldtype == "Link" and options == "Currency" and not self.count:
+                total_row[i] = result.values(fieldname if result.is_dict else i)[0]
+
+        self.count += len(result)
+
+    def get_row(self):
+        total_row = list(self.total_row)
+        for i in self.has_percent:
+            total_row[i] = flt(total_row[i]) / self.count
+
+        columns = self.columns
+        first_col_fieldtype = None
+        if isinstance(columns[0], str):
+            first_col = columns[0].split(":")
+            if len(first_col) > 1:
+                first_col_fieldtype = first_col[1].split("/", 1)[0]
+        else:
+            first_col_fieldtype = columns[0].get("fieldtype")
 
-    if first_col_fieldtype not in ["Currency", "Int", "Float", "Percent", "Date"]:
-        total_row[0] = _("Total")
+        if first_col_fieldtype not in ["Currency", "Int", "Float", "Percent", "Date"]:
+            total_row[0] = _("Total")
 
-    result.append(total_row)
-    return result
+        return total_row
+
+
+def get_total_column_type(col, meta=None):
+    """
+    Returns the fieldtype, options and fieldname of a report column
+    """
+    fieldtype, options, fieldname = None, None, None
+    if isinstance(col, str):
+        if meta:
+            # get fieldtype from the meta
+            field = meta.get_field(col)
+            if field:
+                fieldtype = field.fieldtype
+                fieldname = field.fieldname
+        else:
+            col = col.split(":")
+            if len(col) > 1:
+                if col[1]:
+                    fieldtype = col[1]
+                    if "/" in fieldtype:
+                        fieldtype, options = fieldtype.split("/")
+                else:
+                    fieldtype = "Data"
+    else:
+        fieldtype = col.get("fieldtype")
+        fieldname = col.get("fieldname")
+        options = col.get("options")
+
+    return fieldtype, options, fieldname
 
 
 @frappe.whitelist()
@@ -596,11 +808,7 @@ def get_data_for_custom_report(columns, result):
             doctype = column.get("doctype")
 
             row_key = link_field.get("fieldname")
-            names = []
-            for row in result:
-                if row.get(row_key):
-                    names.append(row.get(row_key))
-            names = list(set(names))
+            names = list({name for name in result.values(row_key) if name})
 
             doc_field_value_map[(doctype, fieldname)] = get_data_for_custom_field(
                 doctype, fieldname, names
@@ -648,119 +856,202 @@ def save_report(reference_report, report_name, columns, filters):
 
 
 def get_filtered_data(ref_doctype, columns, data, user):
-    result = []
-    linked_doctypes = get_linked_doctypes(columns, data)
+    """
+    Returns the rows the user is permitted to see, as a `ReportResult` when
+    given one, as a list of rows otherwise.
+
+    The existence of the linked values is resolved with one query per linked
+    doctype, then whole columns are checked with set lookups.
+    """
+    result = data if isinstance(data, ReportResult) else ReportResult.from_rows(data)
+    linked_doctypes = get_linked_doctypes(columns, result)
     match_filters_per_doctype = get_user_match_filters(linked_doctypes, user=user)
-    shared = frappe.share.get_shared(ref_doctype, user)
+
+    if not match_filters_per_doctype:
+        return data if isinstance(data, ReportResult) else list(data)
+
+    shared = set(frappe.share.get_shared(ref_doctype, user))
     columns_dict = get_columns_dict(columns)
 
     role_permissions = get_role_permissions(frappe.get_meta(ref_doctype), user)
     if_owner = role_permissions.get("if_owner", {}).get("report")
 
-    if match_filters_per_doctype:
-        for row in data:
-            # Why linked_doctypes.get(ref_doctype)? because if column is empty, linked_doctypes[ref_doctype] is removed
-            if (
-                linked_doctypes.get(ref_doctype)
-                and shared
-                and row.get(linked_doctypes[ref_doctype]) in shared
-            ):
-                result.append(row)
-
-            elif has_match(
-                row,
-                linked_doctypes,
-                match_filters_per_doctype,
-                ref_doctype,
-                if_owner,
-                columns_dict,
-                user,
-            ):
-                result.append(row)
-    else:
-        result = list(data)
+    # allowed values as sets, for constant time lookups
+    match_filters_per_doctype = {
+        doctype: [
+            {dt: to_lookup_set(values) for dt, values in match_filters.items()}
+            for match_filters in filter_list
+        ]
+        for doctype, filter_list in match_filters_per_doctype.items()
+    }
+    existing_values = get_existing_values(
+        result, linked_doctypes, match_filters_per_doctype
+    )
 
-    return result
+    # empty rows are allowed
+    permitted = [length == 0 for length in result.row_lengths()]
+
+    # Why linked_doctypes.get(ref_doctype)? because if column is empty, linked_doctypes[ref_doctype] is removed
+    if linked_doctypes.get(ref_doctype) and shared:
+        for idx, value in enumerate(result.values(linked_doctypes[ref_doctype])):
+            if is_in(value, shared):
+                permitted[idx] = True
+
+    matched = get_match_mask(
+        result,
+        linked_doctypes,
+        match_filters_per_doctype,
+        ref_doctype,
+        if_owner,
+        columns_dict,
+        user,
+        existing_values,
+    )
+    result = result.take(
+        idx
+        for idx, (is_permitted, is_matched) in enumerate(
+            zip(permitted, matched, strict=True)
+        )
+        if is_permitted or is_matched
+    )
+    return result if isinstance(data, ReportResult) else result.to_rows()
 
 
-def has_match(
-    row,
+def get_match_mask(
+    result,
     linked_doctypes,
     doctype_match_filters,
     ref_doctype,
     if_owner,
     columns_dict,
     user,
+    existing_values,
 ):
-    """Returns True if after evaluating permissions for each linked doctype
-    - There is an owner match for the ref_doctype
-    - `and` There is a user permission match for all linked doctypes
-
-    Returns True if the row is empty
-
-    Note:
-    Each doctype could have multiple conflicting user permission doctypes.
-    Hence even if one of the sets allows a match, it is true.
-    This behavior is equivalent to the trickling of user permissions of linked doctypes to the ref doctype.
     """
-    resultant_match = True
-
-    if not row:
-        # allow empty rows :)
-        return resultant_match
+    Returns for every row of a `ReportResult` whether it matches the user
+    permissions, same as `has_match` on each row but one column at a time
+    """
+    length = len(result)
+    resultant_match = [True] * length
 
     for doctype, filter_list in doctype_match_filters.items():
-        matched_for_doctype = False
+        matched_for_doctype = [False] * length
 
         if doctype == ref_doctype and if_owner:
             idx = linked_doctypes.get("User")
-            if (
-                idx is not None
-                and row[idx] == user
-                and columns_dict[idx] == columns_dict.get("owner")
-            ):
+            if idx is not None and columns_dict[idx] == columns_dict.get("owner"):
                 # owner match is true
-                matched_for_doctype = True
-
-        if not matched_for_doctype:
-            for match_filters in filter_list:
-                match = True
-                for dt, idx in linked_doctypes.items():
-                    # case handled above
-                    if dt == "User" and columns_dict[idx] == columns_dict.get("owner"):
-                        continue
+                matched_for_doctype = [value == user for value in result.values(idx)]
 
-                    cell_value = None
-                    if isinstance(row, dict):
-                        cell_value = row.get(idx)
-                    elif isinstance(row, list | tuple):
-                        cell_value = row[idx]
+        for match_filters in filter_list:
+            match = [True] * length
+            for dt, idx in linked_doctypes.items():
+                # case handled above
+                if dt == "User" and columns_dict[idx] == columns_dict.get("owner"):
+                    continue
 
+                if dt not in match_filters:
+                    continue
+
+                allowed = match_filters[dt]
+                existing = existing_values.get(dt, ())
+                for row_idx, cell_value in enumerate(result.values(idx)):
                     if (
-                        dt in match_filters
-                        and cell_value not in match_filters.get(dt)
-                        and frappe.db.exists(dt, cell_value)
+                        match[row_idx]
+                        and not is_in(cell_value, allowed)
+                        and is_in(cell_value, existing)
                     ):
-                        match = False
-                        break
+                        match[row_idx] = False
 
-                # each doctype could have multiple conflicting user permission doctypes, hence using OR
-                # so that even if one of the sets allows a match, it is true
-                matched_for_doctype = matched_for_doctype or match
-
-                if matched_for_doctype:
-                    break
+            # each doctype could have multiple conflicting user permission doctypes, hence using OR
+            # so that even if one of the sets allows a match, it is true
+            matched_for_doctype = [
+                previous or current
+                for previous, current in zip(matched_for_doctype, match, strict=True)
+            ]
 
         # each doctype's user permissions should match the row! hence using AND
-        resultant_match = resultant_match and matched_for_doctype
-
-        if not resultant_match:
-            break
+        resultant_match = [
+            previous and current
+            for previous, current in zip(
+                resultant_match, matched_for_doctype, strict=True
+            )
+        ]
 
     return resultant_match
 
 
+def to_lookup_set(values):
+    try:
+        return set(values)
+    except TypeError:
+        return values
+
+
+def is_in(value, values):
+    try:
+        return value in values
+    except TypeError:
+        # unhashable cell, never equal to a document name
+        return False
+
+
+def get_existing_values(result, linked_doctypes, doctype_match_filters):
+    """
+    Returns {doctype: set of names} of the linked values that exist, for the
+    values a user permission could exclude, with one query per doctype
+    """
+    existing_values = {}
+    for dt, idx in linked_doctypes.items():
+        allowed_sets = [
+            match_filters[dt]
+            for filter_list in doctype_match_filters.values()
+            for match_filters in filter_list
+            if dt in match_filters
+        ]
+        if not allowed_sets:
+            continue
+
+        candidates = set()
+        for cell_value in result.values(idx):
+            if not cell_value or not isinstance(cell_value, str | int | float):
+                continue
+            if all(is_in(cell_value, allowed) for allowed in allowed_sets):
+                continue
+            candidates.add(cell_value)
+
+        existing_values[dt] = get_existing_names(dt, candidates)
+
+    return existing_values
+
+
+def get_existing_names(doctype, values, batch_size=1000):
+    """
+    Returns the given values which are names of existing records of a doctype
+    """
+    by_name = {}
+    for value in values:
+        by_name.setdefault(normalize_name(cstr(value)), []).append(value)
+
+    existing = set()
+    names = list(by_name)
+    for start in range(0, len(names), batch_size):
+        for name in frappe.get_all(
+            doctype,
+            filters={"name": ["in", names[start : start + batch_size]]},
+            pluck="name",
+        ):
+            existing.update(by_name.get(normalize_name(cstr(name)), []))
+    return existing
+
+
+def normalize_name(name):
+    # names are compared case insensitively by MariaDB
+    return name.casefold() if frappe.db.db_type == "mariadb" else name
+
+
 def get_linked_doctypes(columns, data):
+    result = data if isinstance(data, ReportResult) else ReportResult.from_rows(data)
     linked_doctypes = {}
 
     columns_dict = get_columns_dict(columns)
@@ -768,35 +1059,36 @@ def get_linked_doctypes(columns, data):
     for idx in range(len(columns)):
         df = columns_dict[idx]
         if df.get("fieldtype") == "Link":
-            if data and isinstance(data[0], list | tuple):
+            if not result.is_dict:
                 linked_doctypes[df["options"]] = idx
             else:
                 # dict
                 linked_doctypes[df["options"]] = df["fieldname"]
 
     # remove doctype if column is empty
-    columns_with_value = []
-    for row in data:
-        if row:
-            if len(row) != len(columns_with_value):
-                if isinstance(row, list | tuple):
-                    row = enumerate(row)
-                elif isinstance(row, dict):
-                    row = row.items()
-
-                for col, val in row:
-                    if val and col not in columns_with_value:
-                        columns_with_value.append(col)
-
-    items = list(linked_doctypes.items())
-
-    for doctype, key in items:
-        if key not in columns_with_value:
+    for doctype, key in list(linked_doctypes.items()):
+        if not any(result.values(key)):
             del linked_doctypes[doctype]
 
     return linked_doctypes
 
 
+def get_report_link_titles(columns, data):
+    """
+    Returns {linked doctype: {name: title}} for the Link columns of a report result
+    """
+    result = data if isinstance(data, ReportResult) else ReportResult.from_rows(data)
+    values_by_doctype = {}
+    for idx, col in enumerate(columns):
+        column = get_column_as_dict(col)
+        if column.get("fieldtype") == "Link" and column.get("options"):
+            key = column.get("fieldname") if result.is_dict else idx
+            values_by_doctype.setdefault(column["options"], set()).update(
+                result.values(key)
+            )
+    return get_link_titles(values_by_doctype)
+
+
 def get_columns_dict(columns):
     """Returns a dict with column docfield values as dict
     The keys for the dict are both idx and fieldname,
@@ -851,27 +1143,25 @@ def get_user_match_filters(doctypes, user):
 @frappe.whitelist()
 def export_pdf():
     """Export from query reports to PDF with custom handling."""
-    form_params = frappe._dict(frappe.local.form_dict)
+    params = dict(frappe.local.form_dict)
+    form_params = frappe._dict(params)
     clean_params(form_params)
     parse_json(form_params)
 
     report_name = form_params.report_name
     filters = form_params.filters
 
-    # Run the report and fetch data
-    data = run(report_name, filters, ignore_prepared_report=True)
-    data = frappe._dict(data)
+    if sbool(form_params.run_in_background) and not form_params.return_html:
+        return enqueue_export(EXPORT_JOB_METHOD, "export_pdf", report_name, params)
 
-    if not data.columns:
+    html_content = get_report_html(report_name, filters)
+    if html_content is None:
         frappe.respond_as_web_page(
             _("No data to export"),
             _("You can try changing the filters of your report."),
         )
         return
 
-    # Generate HTML from the report data
-    html_content = generate_report_html(report_name, filters, data.columns, data.result)
-
     if form_params.return_html:
         return html_content
 
@@ -881,6 +1171,21 @@ def export_pdf():
     provide_binary_file("Report", report_name, "pdf", pdf_content)
 
 
+def get_report_html(report_name, filters):
+    """
+    Runs a report and returns its printable HTML, None when it has no columns
+    """
+    # Run the report and fetch data
+    data = run(report_name, filters, ignore_prepared_report=True)
+    data = frappe._dict(data)
+
+    if not data.columns:
+        return None
+
+    # Generate HTML from the report data
+    return generate_report_html(report_name, filters, data.columns, data.result)
+
+
 def provide_binary_file(doctype, filename, file_extension, content):
     """Provide binary file as a response."""
     frappe.local.response.filename = f"{doctype}-{filename}.{file_extension}"
@@ -900,125 +1205,7 @@ def provide_binary_file(doctype, filename, file_extension, content):
 
 def generate_report_html(report_name, filters, columns, result):
     try:
-        # Get the path of the report folder and check for the HTML file
-        report = frappe.get_doc("Report", report_name)
-        module = report.module or frappe.db.get_value(
-            "DocType", report.ref_doctype, "module"
-        )
-        is_custom_module = frappe.get_cached_value("Module Def", module, "custom")
-
-        # Get module path, only if it's not a custom module
-        module_path = "" if is_custom_module else frappe.get_module_path(module)
-        report_folder = module_path and os.path.join(
-            module_path, "report", frappe.scrub(report.name)
-        )
-        html_file_path = report_folder and os.path.join(
-            report_folder, frappe.scrub(report.name) + ".html"
-        )
-
-        # Fetch letterhead content
-        letter_head_content = (
-            frappe.db.get_value("Letter Head", "Associated Terminals", "content") or ""
-        )
-
-        # If the HTML file exists, read and return its content
-        if html_file_path and os.path.exists(html_file_path):
-            with open(html_file_path, "r", encoding="utf-8") as file:
-                template_content = file.read()
-
-            # Render the template with the context
-            html_content = frappe.render_template(
-                template_content,
-                {
-                    "data": result,
-                    "columns": columns,
-                    "filters": filters,
-                    "letter_head": letter_head_content,
-                },
-            )
-            return html_content
-
-        # Extract data from the report_data dictionary
-        report_title = report_name
-        rows = result
-
-        # Generate filter HTML
-        if filters:
-            filter_html = "<div class='filters'>"
-            for filter_name, filter_value in filters.items():
-                filter_html += (
-                    f"<p><strong>{filter_name.replace('_', ' ').title()}:</strong> "
-                    f"{filter_value}</p>"
-                )
-            filter_html += "</div>"
-        else:
-            filter_html = ""
-
-        # Generate table headers
-        headers = "".join(
-            f"<th style='width: {col.get('width', 100)}px;'>{col['label']}</th>"
-            for col in columns
-        )
-
-        # Generate table rows
-        table_rows = ""
-        for row in rows:
-            table_row = "<tr>"
-            for col in columns:
-                fieldname = col["fieldname"]
-                value = row.get(fieldname, "")
-                table_row += f"<td>{value if value is not None else ''}</td>"
-            table_row += "</tr>"
-            table_rows += table_row
-
-        # Assemble the complete HTML content
-        html_content = f"""
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: "Roboto", sans-serif;
-                    margin: 20px;
-                }}
-                h1 {{
-                    text-align: center;
-                }}
-                .filters {{
-                    margin-bottom: 20px;
-                }}
-                table {{
-                    width: 100%;
-                    border-collapse: collapse;
-                }}
-                th, td {{
-                    border: 1px solid #ddd;
-                    padding: 8px;
-                    text-align: left;
-                }}
-                th {{
-                    background-color: #f2f2f2;
-                }}
-                .job-link {{
-                    color: blue;
-                    text-decoration: underline;
-                }}
-                .letter-head {{
-                    margin-bottom: 20px;
-                }}
-            </style>
-        </head>        <body>
-            <h1>{report_title}</h1>
-            {filter_html}
-            <table>
-                <tr>
-                    {headers}
-                </tr>
-                {table_rows}
-            </table>
-        </body>
-        </html>
-        """
-        return "html_content"
+        return render_report_html(report_name, filters, columns, result)
     except KeyError as e:
         frappe.log_error(
             f"Missing key in data dictionary: {e}", "Report Generation Error"
@@ -1029,26 +1216,37 @@ def generate_report_html(report_name, filters, columns, result):
 @frappe.whitelist()
 def send_pdf_via_email():
     """Generate PDF and send it via email."""
-    form_params = frappe._dict(frappe.local.form_dict)
+    params = dict(frappe.local.form_dict)
+    form_params = frappe._dict(params)
     clean_params(form_params)
     parse_json(form_params)
 
     report_name = form_params.report_name
-    filters = form_params.filters
-    email_to = form_params.email_to
 
-    # Generate PDF
-    data = run(report_name, filters, ignore_prepared_report=True)
-    data = frappe._dict(data)
+    if sbool(form_params.run_in_background):
+        return enqueue_export(
+            EXPORT_JOB_METHOD, "send_pdf_via_email", report_name, params
+        )
 
-    if not data.columns:
+    if not send_report_pdf(report_name, form_params.filters, form_params.email_to):
         frappe.respond_as_web_page(
             _("No data to export"),
             _("You can try changing the filters of your report."),
         )
         return
 
-    html_content = generate_report_html(report_name, filters, data.columns, data.result)
+    frappe.msgprint(f"Email sent to {form_params.email_to} with the PDF attachment.")
+
+
+def send_report_pdf(report_name, filters, email_to):
+    """
+    Sends the PDF of a report by email, returns False when it has no columns
+    """
+    # Generate PDF
+    html_content = get_report_html(report_name, filters)
+    if html_content is None:
+        return False
+
     pdf_content = get_pdf(html_content)
     file_name = f"{report_name}-{frappe.generate_hash(length=10)}.pdf"
     attachment = {"fname": file_name, "fcontent": pdf_content}
@@ -1064,8 +1262,65 @@ def send_pdf_via_email():
             now=True,
             attachments=[attachment],
         )
-        frappe.msgprint(f"Email sent to {email_to} with the PDF attachment.")
-
     except Exception as e:
         frappe.log_error("email error", f"Failed to send email: {e}")
         raise
+
+    return True
+
+
+@frappe.whitelist()
+def get_export_status(job_id):
+    """
+    Returns the status of a background export of the session user:
+    status (Queued, Running, Completed or Failed), rows written so far,
+    file_url of the result once completed and error when failed
+    """
+    return get_user_export_status(job_id)
+
+
+def run_export_job(export_job_id, kind, report_name, params):
+    """
+    Runs an export enqueued by `enqueue_export` as the user who requested it
+    """
+    set_export_status(export_job_id, status="Running")
+    file_doc = None
+    try:
+        if kind == "export_query":
+            form_params, csv_params = parse_export_params(params)
+            export = build_query_export(form_params, csv_params, export_job_id)
+            if not export:
+                frappe.throw(_("No data to export"))
+            file_extension, export_file = export
+            with export_file:
+                file_doc = save_export_file(
+                    export_file, get_export_file_name(report_name, file_extension)
+                )
+
+        else:
+            form_params = frappe._dict(params)
+            clean_params(form_params)
+            parse_json(form_params)
+
+            if kind == "export_pdf":
+                html_content = get_report_html(report_name, form_params.filters)
+                if html_content is None:
+                    frappe.throw(_("No data to export"))
+                file_doc = save_export_content(
+                    get_pdf(html_content), get_export_file_name(report_name, "pdf")
+                )
+            elif not send_report_pdf(
+                report_name, form_params.filters, form_params.email_to
+            ):
+                frappe.throw(_("No data to export"))
+    except Exception:
+        fail_export(export_job_id, report_name)
+        return
+
+    if file_doc:
+        subject = _("Export of report {0} is ready to download").format(report_name)
+    else:
+        subject = _("Report {0} was sent to {1}").format(
+            report_name, form_params.email_to
+        )
+    complete_export(export_job_id, file_doc, subject)
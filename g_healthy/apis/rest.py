@@ -3,7 +3,17 @@ import json
 import frappe
 from frappe import _
 from frappe.desk.search import build_for_autosuggest, search_widget
+from frappe.utils import sbool
 
+from g_healthy.batch import (
+    INSERT,
+    REPLACE,
+    get_parent_link_field,
+    save_children,
+    throw_on_failures,
+)
+from g_healthy.bulk import save_records
+from g_healthy.job_logs import get_idempotency_key, run_once, save_log
 from g_healthy.utils import get_request_form_data
 
 
@@ -15,28 +25,7 @@ def save_logs():
     data = get_request_form_data()
     events_data = data.pop("events", [])
     if frappe.request.method == "POST":
-        if data and not data.name:
-            data["doctype"] = "Logs"
-            log = frappe.get_doc(data).insert()
-            log_name = log.name
-        else:
-            log_name = data.name
-        if events_data:
-            for event in events_data:
-                if event and event["event"]:
-                    if frappe.db.exists("Code", event["event"]) and not data.name:
-                        event_data = frappe.get_doc("Code", event["event"])
-                        if event_data.is_billable:
-                            event["is_billable"] = event_data.is_billable
-                        if event_data.general_cargo_group:
-                            event["general_cargo_group"] = (
-                                event_data.general_cargo_group
-                            )
-                    if not "hold" in event or not event["hold"]:
-                        event["hold"] = ""
-                    event["doctype"] = "Log Details"
-                    event["logs"] = log_name
-                    frappe.get_doc(event).insert()
+        return run_once(get_idempotency_key(data), lambda: save_log(data, events_data))
     else:
         frappe.throw("Invalid request method")
 
@@ -45,9 +34,21 @@ def save_logs():
 def save_parent_child():
     """
     This API has been modified version of save_logs to save anykind of Doctype and Its Linked sub doctype.
+
+    params
+    ------
+
+    :doctype, :child_doctype
+    :child_data: the records of the sub doctype
+    :link_field: Link of the sub doctype to the doctype, found from the meta if not given
+    :mode: "insert" (default) inserts all of child_data, "upsert" updates the
+        records having a name, "replace" also deletes the records of the
+        parent missing from child_data (see g_healthy.batch.save_children)
     """
     data = get_request_form_data()
     child_data = data.pop("child_data", [])
+    mode = data.pop("mode", None) or INSERT
+    link_field = data.pop("link_field", None)
     if frappe.request.method == "POST":
         if data and not data.name:
             data["doctype"] = data.doctype
@@ -55,13 +56,17 @@ def save_parent_child():
             record_name = response.name
         else:
             record_name = data.name
-        if child_data:
-            for child in child_data:
-                if child:
-                    child["doctype"] = data.child_doctype
-                    parent_name = data.doctype.lower().replace(" ", "_")
-                    child[parent_name] = record_name
-                    frappe.get_doc(child).insert()
+        results = None
+        if child_data or mode == REPLACE:
+            results = save_children(
+                data.child_doctype,
+                get_parent_link_field(data.child_doctype, data.doctype, link_field),
+                record_name,
+                child_data,
+                mode,
+            )
+            throw_on_failures(results)
+        return {"name": record_name, "results": results}
     else:
         frappe.throw("Invalid request method")
 
@@ -77,11 +82,16 @@ def save_data():
     ------
 
     :doctype
-    :data
+    :info: JSON array of the records
+    :bulk: validate the batch up front and write it in committed chunks,
+        returning the result of every record (see g_healthy.bulk.save_records)
+    :chunk_size: records per chunk in bulk mode
     """
     data = get_request_form_data()
     method = "POST"
     if data.doctype and data.info:
+        if sbool(data.bulk):
+            return save_records(data.doctype, json.loads(data.info), data.chunk_size)
         for cur_data in json.loads(data.info):
             if "name" in cur_data and cur_data["name"]:
                 doc = frappe.get_doc(data.doctype, cur_data["name"], for_update=True)
@@ -11,6 +11,8 @@ from frappe.desk.form.assign_to import (
 from frappe.desk.form.document_follow import follow_document
 from frappe.utils.data import strip_html
 
+from g_healthy.enrichment import get_link_titles
+
 
 @frappe.whitelist()
 def todo_before_insert(doc, method):
@@ -143,6 +145,7 @@ def get_changed_fields(doctype, docname, fieldname=None, order="asc"):
         )
 
         changes = []
+        link_changes = []
         fieldname = fieldname.strip() if fieldname else None
 
         for version in versions:
@@ -193,34 +196,29 @@ def get_changed_fields(doctype, docname, fieldname=None, order="asc"):
                     fieldtype = meta.get_field(field).get("fieldtype")
                     link_doctype = meta.get_field(field).get("options")
 
-                    field_to_fetch = "name"
-
+                    change = {
+                        "label": meta.get_label(field),
+                        "field": field,
+                        "old_value": old_value,
+                        "new_value": new_value,
+                        "timestamp": version["creation"],
+                        "modified_by": version["modified_by"],
+                    }
+                    changes.append(change)
                     if fieldtype == "Link" and link_doctype:
-                        try:
-                            linked_meta = frappe.get_meta(link_doctype)
-                            field_to_fetch = linked_meta.title_field or "name"
-                        except Exception:
-                            field_to_fetch = "name"
-
-                        if old_value:
-                            old_value = frappe.db.get_value(
-                                link_doctype, old_value, field_to_fetch
-                            )
-                        if new_value:
-                            new_value = frappe.db.get_value(
-                                link_doctype, new_value, field_to_fetch
-                            )
-
-                    changes.append(
-                        {
-                            "label": meta.get_label(field),
-                            "field": field,
-                            "old_value": old_value,
-                            "new_value": new_value,
-                            "timestamp": version["creation"],
-                            "modified_by": version["modified_by"],
-                        }
-                    )
+                        link_changes.append((change, link_doctype))
+
+        # Show titles instead of names of linked documents, resolved in one go
+        values_by_doctype = {}
+        for change, link_doctype in link_changes:
+            values_by_doctype.setdefault(link_doctype, set()).update(
+                (change["old_value"], change["new_value"])
+            )
+        link_titles = get_link_titles(values_by_doctype)
+        for change, link_doctype in link_changes:
+            titles = link_titles.get(link_doctype, {})
+            for key in ("old_value", "new_value"):
+                change[key] = titles.get(change[key], change[key])
 
         return changes
     except Exception as e:
@@ -0,0 +1,342 @@
+"""
+This file includes the batch executor of the grid editors.
+
+The additions, updates and deletions of a grid are run in one transaction,
+grouped by type, every item within a savepoint: a failing item is undone and
+reported, the next ones still run so that the report covers the whole batch,
+and the caller rolls the transaction back when any item failed.
+
+- additions of doctypes without insert hooks are validated in memory and
+  inserted with one multi-row statement (see g_healthy.bulk);
+- the records to update are locked and loaded with one query, and only the
+  ones with changed fields are saved;
+- deletions of doctypes without delete hooks are checked for links with one
+  query per link field and deleted with one statement per table.
+"""
+
+import frappe
+from frappe import _
+from frappe.model import std_fields, table_fields
+from frappe.permissions import get_user_permissions
+
+from g_healthy.bulk import (
+    FAILED,
+    INSERTED,
+    UPDATED,
+    bulk_delete_docs,
+    can_bulk_delete,
+    can_bulk_insert,
+    get_attached_names,
+    get_error_message,
+    get_existing_names,
+    get_linked_names,
+    get_result,
+    has_child_rows,
+    insert_prepared,
+    load_docs,
+    normalize_name,
+    prepare_insert,
+    run_in_savepoint,
+    validate_links,
+)
+
+UNCHANGED = "Unchanged"
+DELETED = "Deleted"
+
+# Modes of save_children
+INSERT = "insert"
+UPSERT = "upsert"
+REPLACE = "replace"
+MODES = (INSERT, UPSERT, REPLACE)
+
+# Keys of an item which are not values of the document, or set by the framework
+IGNORED_KEYS = ("name", "doctype", "flags", "owner", "creation", "modified_by")
+
+STANDARD_FIELDS = {df["fieldname"]: frappe._dict(df) for df in std_fields}
+
+
+def new_doc(doctype, item):
+    doc = frappe.new_doc(doctype)
+    doc.update(item)
+    return doc
+
+
+def get_changed_values(doc, item):
+    """
+    Returns the values of an item differing from the document
+    """
+    changed = {}
+    for key, value in item.items():
+        if key in IGNORED_KEYS or key == "modified":
+            continue
+        df = doc.meta.get_field(key) or STANDARD_FIELDS.get(key)
+        if df and df.fieldtype in table_fields:
+            changed[key] = value
+        elif df:
+            # "2024-01-01" and a date, 1 and 1.0, None and "" are the same value
+            if doc.cast(value, df) != doc.cast(doc.get(key), df):
+                changed[key] = value
+        elif value != doc.get(key):
+            changed[key] = value
+
+    if changed and item.get("modified"):
+        # the version the item was edited from, for save to detect conflicts
+        changed["modified"] = item["modified"]
+    return changed
+
+
+def run_additions(doctype, items, check_permissions=False):
+    results = [None] * len(items)
+    prepared = {}
+    if items and can_bulk_insert(doctype):
+        meta = frappe.get_meta(doctype)
+        check_user_permissions = check_permissions and bool(get_user_permissions())
+        for idx, item in enumerate(items):
+            if has_child_rows(meta, item):
+                continue
+            try:
+                prepared[idx] = prepare_insert(
+                    new_doc(doctype, item), check_user_permissions
+                )
+            except Exception as e:
+                results[idx] = get_result(FAILED, error=get_error_message(e))
+
+        for idx, error in validate_links(meta, prepared).items():
+            results[idx] = get_result(FAILED, prepared.pop(idx).name, error)
+
+        insert_prepared(doctype, prepared, results)
+
+    for idx, item in enumerate(items):
+        if results[idx] is None:
+            name, error = run_in_savepoint(
+                lambda: new_doc(doctype, item)
+                .insert(ignore_permissions=not check_permissions)
+                .name
+            )
+            results[idx] = get_result(FAILED if error else INSERTED, name, error)
+    return results
+
+
+def update_item(doctype, item, docs, existing_names, check_permissions=False):
+    """
+    Saves the changed fields of a record, returns the status of the item
+    """
+    key = normalize_name(item["name"])
+    if key not in existing_names:
+        frappe.throw(
+            _("{0} {1} not found").format(_(doctype), item["name"]),
+            frappe.DoesNotExistError,
+        )
+
+    doc = docs.get(key) or frappe.get_doc(doctype, item["name"])
+    if check_permissions and not doc.has_permission("write"):
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+    changed = get_changed_values(doc, item)
+    if not changed:
+        return UNCHANGED
+    doc.update(changed)
+    doc.save(ignore_permissions=not check_permissions)
+    return UPDATED
+
+
+def run_updates(doctype, items, check_permissions=False):
+    missing_name = get_result(
+        FAILED, error=_("Document name missing in update payload")
+    )
+    results = [None if item.get("name") else missing_name for item in items]
+    names = [item["name"] for item in items if item.get("name")]
+    if any(df.fieldtype in table_fields for df in frappe.get_meta(doctype).fields):
+        # documents with child tables are loaded whole, one at a time
+        docs = {}
+        existing_names = get_existing_names(doctype, names, for_update=True)
+    else:
+        docs = load_docs(doctype, names)
+        existing_names = set(docs)
+
+    for idx, item in enumerate(items):
+        if results[idx] is None:
+            status, error = run_in_savepoint(
+                lambda: update_item(
+                    doctype, item, docs, existing_names, check_permissions
+                )
+            )
+            results[idx] = get_result(status or FAILED, item["name"], error)
+    return results
+
+
+def run_deletions(doctype, items, check_permissions=False):
+    missing_name = get_result(
+        FAILED, error=_("Document name missing in delete payload")
+    )
+    results = [None if item.get("name") else missing_name for item in items]
+    names = [item["name"] for item in items if item.get("name")]
+
+    bulk = {}
+    if names and can_bulk_delete(doctype):
+        docs = load_docs(doctype, names)
+        # these are left to delete_doc, which reports why they cannot go
+        blocked = get_linked_names(doctype, list(docs)) | get_attached_names(
+            doctype, names
+        )
+        for idx, item in enumerate(items):
+            if results[idx] is not None:
+                continue
+            key = normalize_name(item["name"])
+            if (
+                key in docs
+                and key not in blocked
+                and docs[key].docstatus != 1
+                and (not check_permissions or docs[key].has_permission("delete"))
+            ):
+                bulk[idx] = docs.pop(key)
+
+    if bulk:
+        _result, error = run_in_savepoint(
+            lambda: bulk_delete_docs(doctype, list(bulk.values()))
+        )
+        if error:
+            bulk = {}
+        for idx, doc in bulk.items():
+            results[idx] = get_result(DELETED, doc.name)
+
+    for idx, item in enumerate(items):
+        if results[idx] is None:
+            _result, error = run_in_savepoint(
+                lambda: frappe.delete_doc(
+                    doctype, item["name"], ignore_permissions=not check_permissions
+                )
+            )
+            results[idx] = get_result(FAILED if error else DELETED, item["name"], error)
+    return results
+
+
+def run_batch(doctype, add=None, update=None, delete=None, check_permissions=False):
+    """
+    Inserts, updates and deletes records of a doctype, in this order. The
+    permissions of the user on every record are checked with
+    `check_permissions` only. Returns the result of every item, by type:
+
+    {"add": [...], "update": [...], "delete": [...]}, with items like
+    {"status": "Inserted" | "Updated" | "Unchanged" | "Deleted" | "Failed",
+    "name": ..., "error": ...}
+    """
+    return {
+        "add": run_additions(doctype, add or [], check_permissions),
+        "update": run_updates(doctype, update or [], check_permissions),
+        "delete": run_deletions(doctype, delete or [], check_permissions),
+    }
+
+
+def get_failures(results):
+    return [
+        result
+        for type_results in results.values()
+        for result in type_results
+        if result["status"] == FAILED
+    ]
+
+
+def throw_on_failures(results):
+    """
+    Rolls the batch back and raises when any item failed, the error carrying
+    the result of every item as "results"
+    """
+    failures = get_failures(results)
+    if not failures:
+        return
+
+    frappe.db.rollback()
+    frappe.response["results"] = results
+    frappe.throw(
+        _("{0} of the changes could not be saved: {1}").format(
+            len(failures), failures[0]["error"]
+        )
+    )
+
+
+def get_parent_link_field(child_doctype, parent_doctype, link_field=None):
+    """
+    Returns the Link field of a child doctype pointing to its parent doctype
+    """
+    meta = frappe.get_meta(child_doctype)
+    fieldnames = [
+        df.fieldname for df in meta.get_link_fields() if df.options == parent_doctype
+    ]
+    if link_field:
+        if link_field not in fieldnames:
+            frappe.throw(
+                _("{0} is not a link to {1} in {2}").format(
+                    link_field, _(parent_doctype), _(child_doctype)
+                )
+            )
+        return link_field
+    if not fieldnames:
+        frappe.throw(
+            _("{0} has no link to {1}").format(_(child_doctype), _(parent_doctype))
+        )
+    # the field named after the parent doctype wins, as it used to be the only one
+    scrubbed = frappe.scrub(parent_doctype)
+    return scrubbed if scrubbed in fieldnames else fieldnames[0]
+
+
+def save_children(child_doctype, link_field, parent_name, children, mode=INSERT):
+    """
+    Writes the children of a parent record, in one transaction:
+
+    - insert: every child is inserted
+    - upsert: children with a name are updated, the others inserted
+    - replace: as upsert, and the children of the parent missing from
+      `children` are deleted
+
+    Children named in `children` which belong to another parent are not
+    updated but reported as failed. The permissions on the child doctype are
+    checked once, the results are those of run_batch.
+    """
+    if mode not in MODES:
+        frappe.throw(_("Invalid mode {0}").format(mode))
+
+    children = [
+        {**child, "doctype": child_doctype, link_field: parent_name}
+        for child in children
+        if child
+    ]
+    if mode == INSERT:
+        add, update = children, []
+    else:
+        add = [child for child in children if not child.get("name")]
+        update = [child for child in children if child.get("name")]
+
+    # only the children of this parent are updated, not moved from another one
+    own_names = {}
+    if mode != INSERT:
+        own_names = {
+            normalize_name(name): name
+            for name in frappe.get_all(
+                child_doctype, filters={link_field: parent_name}, pluck="name"
+            )
+        }
+    is_own = [normalize_name(child["name"]) in own_names for child in update]
+
+    delete = []
+    if mode == REPLACE:
+        kept = {normalize_name(child["name"]) for child in update}
+        delete = [{"name": name} for key, name in own_names.items() if key not in kept]
+
+    for ptype, items in (("create", add), ("write", update), ("delete", delete)):
+        if items:
+            frappe.has_permission(child_doctype, ptype, throw=True)
+
+    own_update = [child for child, own in zip(update, is_own, strict=True) if own]
+    results = run_batch(child_doctype, add, own_update, delete, check_permissions=True)
+
+    own_results = iter(results["update"])
+    results["update"] = []
+    for child, own in zip(update, is_own, strict=True):
+        if own:
+            results["update"].append(next(own_results))
+            continue
+        error = _("{0} {1} does not belong to {2}").format(
+            _(child_doctype), child["name"], parent_name
+        )
+        results["update"].append(get_result(FAILED, child["name"], error))
+    return results
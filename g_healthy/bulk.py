@@ -0,0 +1,633 @@
+"""
+This file includes the bulk write engine of the REST APIs.
+
+A batch of records is checked up front: permissions once per doctype, and the
+new records of a doctype without controller hooks are named and validated
+in memory, their links checked (and their `fetch_from` fields set) with one
+query per linked doctype. The batch
+is then written in chunks, each committed on its own:
+
+- the validated new records of a chunk are inserted with one multi-row
+  statement, and the doc_events of the app are run once for all of them;
+- the records to update are locked with one `SELECT ... FOR UPDATE` and
+  saved one by one, as are the new records that need their controller.
+
+Every record is written within a savepoint, so a failing record is reported
+and skipped without undoing the others.
+
+The same building blocks are used by the batch executor of the grid editors
+(g_healthy.batch), which also deletes records in bulk.
+"""
+
+import frappe
+from frappe import _
+from frappe.desk.notifications import clear_doctype_notifications
+from frappe.model import table_fields
+from frappe.model.base_document import get_controller
+from frappe.model.document import Document
+from frappe.model.workflow import get_workflow_name
+from frappe.permissions import get_user_permissions
+from frappe.utils import cint, create_batch, cstr
+
+from g_healthy.count import clear_count_cache
+from g_healthy.enrichment import clear_link_title
+from g_healthy.report_cache import clear_report_cache
+from g_healthy.search import delete_from_search_index_bulk, update_search_index_bulk
+
+# Records written (and committed) at once, `bulk_chunk_size` in the site config
+DEFAULT_CHUNK_SIZE = 500
+
+# Controller methods run when a document is inserted
+INSERT_METHODS = (
+    "before_insert",
+    "before_validate",
+    "validate",
+    "before_save",
+    "after_insert",
+    "on_update",
+    "on_change",
+    "db_insert",
+)
+
+# Controller methods run when a document is deleted
+DELETE_METHODS = ("on_trash", "after_delete", "on_change")
+
+# Field types whose values are handled by the full insert (files, dynamic links)
+HEAVY_FIELDTYPES = ("Attach", "Attach Image", "Dynamic Link")
+
+# doc_events of every doctype (by handler) that writes in bulk may skip: the
+# ones they replicate, and the ones doing nothing for doctypes without an
+# active rule, given as (rule doctype, its doctype field, its active filters)
+SKIPPABLE_WILDCARD_EVENTS = {
+    "frappe.desk.notifications.clear_doctype_notifications": None,
+    "frappe.core.doctype.file.utils.attach_files_to_document": None,
+    "frappe.core.doctype.permission_log.permission_log.make_perm_log": None,
+    "frappe.core.doctype.user_type.user_type."
+    "apply_permissions_for_non_standard_user_type": None,
+    "frappe.workflow.doctype.workflow_action.workflow_action."
+    "process_workflow_actions": ("Workflow", "document_type", {"is_active": 1}),
+    "frappe.automation.doctype.assignment_rule.assignment_rule.apply": (
+        "Assignment Rule",
+        "document_type",
+        {"disabled": 0},
+    ),
+    "frappe.automation.doctype.assignment_rule.assignment_rule.update_due_date": (
+        "Assignment Rule",
+        "document_type",
+        {"disabled": 0},
+    ),
+    "frappe.social.doctype.energy_point_rule.energy_point_rule."
+    "process_energy_points": ("Energy Point Rule", "reference_doctype", {"enabled": 1}),
+    "frappe.automation.doctype.milestone_tracker.milestone_tracker."
+    "evaluate_milestone": ("Milestone Tracker", "document_type", {"disabled": 0}),
+}
+
+ROW_SAVEPOINT = "g_healthy_bulk_row"
+
+INSERTED = "Inserted"
+UPDATED = "Updated"
+FAILED = "Failed"
+
+
+def get_chunk_size(chunk_size=None):
+    return (
+        cint(chunk_size)
+        or cint(frappe.conf.get("bulk_chunk_size"))
+        or DEFAULT_CHUNK_SIZE
+    )
+
+
+def can_skip_controller(doctype, methods):
+    """
+    Returns True when nothing but the doc_events of the app listens to the
+    given controller methods of a doctype, i.e. its records can be written
+    without loading their controller
+    """
+    meta = frappe.get_meta(doctype)
+    if meta.issingle or meta.istable or meta.is_virtual or meta.is_tree:
+        return False
+    if any(
+        df.fieldtype in HEAVY_FIELDTYPES or df.in_global_search for df in meta.fields
+    ):
+        return False
+
+    controller = get_controller(doctype)
+    if any(
+        getattr(controller, method, None) is not getattr(Document, method, None)
+        for method in methods
+    ):
+        return False
+
+    doc_events = frappe.get_hooks("doc_events")
+    if doc_events.get(doctype):
+        return False
+    if not can_skip_wildcard_events(doctype, doc_events.get("*") or {}, methods):
+        return False
+
+    from frappe.core.doctype.server_script.server_script_utils import (
+        get_server_script_map,
+    )
+
+    return not (
+        get_server_script_map().get(doctype)
+        or frappe.db.exists("Webhook", {"webhook_doctype": doctype, "enabled": 1})
+    )
+
+
+def can_skip_wildcard_events(doctype, wildcard_events, methods):
+    """
+    Returns True when the doc_events of every doctype listening to the given
+    methods are the app's own or known to do nothing for a doctype
+    """
+    for method in methods:
+        handlers = wildcard_events.get(method) or []
+        for handler in [handlers] if isinstance(handlers, str) else handlers:
+            if handler.startswith("g_healthy."):
+                continue
+            if handler not in SKIPPABLE_WILDCARD_EVENTS:
+                return False
+            rule = SKIPPABLE_WILDCARD_EVENTS[handler]
+            if rule and frappe.db.exists(rule[0], {rule[1]: doctype, **rule[2]}):
+                return False
+    return True
+
+
+def can_bulk_insert(doctype):
+    """
+    Returns True when new records of a doctype can be inserted without
+    running their controller
+    """
+    return (
+        can_skip_controller(doctype, INSERT_METHODS)
+        and not get_workflow_name(doctype)
+        and not frappe.db.exists(
+            "Notification", {"document_type": doctype, "enabled": 1}
+        )
+        and not frappe.db.exists(
+            "Assignment Rule", {"document_type": doctype, "disabled": 0}
+        )
+    )
+
+
+def can_bulk_delete(doctype):
+    """
+    Returns True when records of a doctype can be deleted without running
+    their controller
+    """
+    meta = frappe.get_meta(doctype)
+    return not any(
+        df.fieldtype in table_fields for df in meta.fields
+    ) and can_skip_controller(doctype, DELETE_METHODS)
+
+
+def has_child_rows(meta, record):
+    return any(
+        record.get(df.fieldname) for df in meta.fields if df.fieldtype in table_fields
+    )
+
+
+def normalize_name(name):
+    # names compare case insensitively on MariaDB
+    name = cstr(name)
+    return name.casefold() if frappe.db.db_type == "mariadb" else name
+
+
+def get_existing_names(doctype, names, for_update=False):
+    """
+    Returns the normalized names of the given records that exist, with one query
+    """
+    if not names:
+        return set()
+    return {
+        normalize_name(name)
+        for (name,) in frappe.db.sql(
+            f"""select `name` from `tab{doctype}` where `name` in %(names)s
+            {"for update" if for_update else ""}""",
+            {"names": tuple(names)},
+        )
+    }
+
+
+def prepare_insert(record, check_user_permissions=False):
+    """
+    Returns a new document (from a dict or a new Document) named and validated as `Document.insert` would,
+    without running its controller or writing it
+    """
+    doc = record if isinstance(record, Document) else frappe.get_doc(record)
+    # links are checked for the whole batch by validate_links
+    doc.flags.ignore_links = True
+    doc.set("__islocal", True)
+    doc._set_defaults()
+    doc.set_user_and_timestamp()
+    doc.set_docstatus()
+    if check_user_permissions and not doc.has_permission("create"):
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+
+    doc.set_new_name()
+    doc.set_parent_in_children()
+    doc.validate_higher_perm_levels()
+    doc.flags.in_insert = True
+    doc._validate()
+    doc.set_docstatus()
+    doc.flags.in_insert = False
+    return doc
+
+
+def get_fetch_fields(meta):
+    """
+    Returns {link fieldname: [(field, fieldname in the linked doctype)]} of the
+    `fetch_from` fields of a doctype
+    """
+    fetch_fields = {}
+    for df in meta.fields:
+        if df.fetch_from and "." in df.fetch_from:
+            link_fieldname, source = df.fetch_from.split(".", 1)
+            fetch_fields.setdefault(link_fieldname, []).append((df, source))
+    return fetch_fields
+
+
+def get_link_values(doctype, names, fieldnames):
+    """
+    Returns {normalized name: {fieldname: value}} of the given records that
+    exist, with one query
+    """
+    if not names:
+        return {}
+    columns = ["name", *fieldnames]
+    return {
+        normalize_name(row[0]): dict(zip(columns, row, strict=True))
+        for row in frappe.db.sql(
+            f"""select {", ".join(f"`{column}`" for column in columns)}
+            from `tab{doctype}` where `name` in %(names)s""",
+            {"names": tuple(names)},
+        )
+    }
+
+
+def validate_links(meta, docs):
+    """
+    Returns {key: error} of the documents of `docs` ({key: doc}) linking to
+    records that do not exist, with one query per linked doctype. The
+    `fetch_from` fields of the others are set from the same queries.
+    """
+    link_fields = [
+        df
+        for df in meta.get_link_fields()
+        if df.options and not frappe.get_meta(df.options).issingle
+    ]
+    fetch_fields = get_fetch_fields(meta)
+    names, fieldnames = {}, {}
+    for df in link_fields:
+        values = {doc.get(df.fieldname) for doc in docs.values()} - {None, ""}
+        names.setdefault(df.options, set()).update(values)
+        columns = frappe.get_meta(df.options).get_valid_columns()
+        fieldnames.setdefault(df.options, set()).update(
+            source
+            for _df, source in fetch_fields.get(df.fieldname, [])
+            if source in columns and source != "name"
+        )
+    existing = {
+        doctype: get_link_values(doctype, doctype_names, sorted(fieldnames[doctype]))
+        for doctype, doctype_names in names.items()
+    }
+
+    errors = {}
+    for key, doc in docs.items():
+        for df in link_fields:
+            value = doc.get(df.fieldname)
+            if not value:
+                continue
+            linked = existing[df.options].get(normalize_name(value))
+            if linked is None:
+                errors[key] = _("Could not find {0}: {1}").format(
+                    _(df.label or df.fieldname), value
+                )
+                break
+            for fetch_df, source in fetch_fields.get(df.fieldname, []):
+                if fetch_df.fetch_if_empty and doc.get(fetch_df.fieldname):
+                    continue
+                if source in linked:
+                    doc.set(fetch_df.fieldname, linked[source])
+    return errors
+
+
+def load_docs(doctype, names):
+    """
+    Returns {normalized name: document} of the given records of a doctype
+    without child tables, locked and loaded with one query
+    """
+    if not names:
+        return {}
+    return {
+        normalize_name(row.name): frappe.get_doc({**row, "doctype": doctype})
+        for row in frappe.db.sql(
+            f"select * from `tab{doctype}` where `name` in %(names)s for update",
+            {"names": tuple(names)},
+            as_dict=True,
+        )
+    }
+
+
+def get_linked_names(doctype, names):
+    """
+    Returns the normalized names of the records of `names` that other records
+    link to, with one query per link field. Links from the records of `names`
+    themselves and from cancelled documents do not count, as in delete_doc.
+    """
+    from frappe.model.dynamic_links import get_dynamic_link_map
+    from frappe.model.rename_doc import get_link_fields
+
+    if not names:
+        return set()
+
+    ignored = {"Deleted Document", *frappe.get_hooks("ignore_links_on_delete")}
+    deleted = {normalize_name(name) for name in names}
+    links = [
+        (link["parent"], link["fieldname"], None)
+        for link in get_link_fields(doctype)
+        if not link.get("issingle")
+    ]
+    links.extend(
+        (df.parent, df.fieldname, df.options)
+        for df in get_dynamic_link_map().get(doctype, [])
+    )
+
+    linked = set()
+    for parent, fieldname, doctype_field in links:
+        meta = frappe.get_meta(parent)
+        if parent in ignored or meta.issingle or meta.is_virtual:
+            continue
+        conditions = [f"`{fieldname}` in %(names)s", "`docstatus` < 2"]
+        if doctype_field:
+            conditions.append(f"`{doctype_field}` = %(doctype)s")
+        for linking_name, name in frappe.db.sql(
+            f"""select `name`, `{fieldname}` from `tab{parent}`
+            where {" and ".join(conditions)}""",
+            {"names": tuple(names), "doctype": doctype},
+        ):
+            if parent == doctype and normalize_name(linking_name) in deleted:
+                continue
+            linked.add(normalize_name(name))
+    return linked
+
+
+def get_attached_names(doctype, names):
+    """
+    Returns the normalized names of the records of `names` with attached files
+    """
+    if not names:
+        return set()
+    return {
+        normalize_name(name)
+        for name in frappe.get_all(
+            "File",
+            filters={"attached_to_doctype": doctype, "attached_to_name": ("in", names)},
+            pluck="attached_to_name",
+        )
+    }
+
+
+def bulk_delete_docs(doctype, docs):
+    """
+    Deletes records without links, attachments or child tables as delete_doc
+    would, with one statement per table: the records are archived as Deleted
+    Documents and the feed gets a Deleted comment for each of them
+    """
+    from frappe.utils import get_fullname
+
+    names = [doc.name for doc in docs]
+    frappe.db.delete(doctype, {"name": ("in", names)})
+    frappe.db.delete(
+        "Tag Link", {"document_type": doctype, "document_name": ("in", names)}
+    )
+
+    bulk_insert_docs(
+        "Deleted Document",
+        [
+            prepare_insert(
+                {
+                    "doctype": "Deleted Document",
+                    "deleted_doctype": doctype,
+                    "deleted_name": doc.name,
+                    "data": doc.as_json(),
+                }
+            )
+            for doc in docs
+        ],
+    )
+    bulk_insert_docs(
+        "Comment",
+        [
+            prepare_insert(
+                {
+                    "doctype": "Comment",
+                    "comment_type": "Deleted",
+                    "comment_email": frappe.session.user,
+                    "reference_doctype": doctype,
+                    "subject": f"{_(doctype)} {doc.name}",
+                    "full_name": get_fullname(doc.owner),
+                }
+            )
+            for doc in docs
+        ],
+    )
+
+    frappe.enqueue(
+        "g_healthy.bulk.delete_dynamic_links",
+        doctype=doctype,
+        names=names,
+        enqueue_after_commit=True,
+    )
+    run_after_bulk_delete(doctype, docs)
+
+
+def delete_dynamic_links(doctype, names):
+    """
+    Clears the references to deleted records (comments, todos, shares...),
+    runs in background after a bulk delete
+    """
+    from frappe.model.delete_doc import delete_dynamic_links
+
+    for name in names:
+        delete_dynamic_links(doctype, name)
+
+
+def run_after_bulk_delete(doctype, docs):
+    """
+    Runs once for documents deleted in bulk what runs on trash of every document
+    """
+    for doc in docs:
+        doc.clear_cache()
+        clear_link_title(doc)
+    clear_count_cache(docs[0])
+    clear_report_cache(docs[0])
+    clear_doctype_notifications(docs[0])
+    delete_from_search_index_bulk(doctype, [doc.name for doc in docs])
+    docs[-1].notify_update()
+
+
+def get_error_message(error):
+    # the messages of frappe.throw would be sent once more with the response
+    frappe.clear_messages()
+    return cstr(error) or error.__class__.__name__
+
+
+def run_in_savepoint(function):
+    """
+    Runs `function`, undoing its writes when it fails. Returns (result, error).
+    """
+    frappe.db.savepoint(ROW_SAVEPOINT)
+    try:
+        result = function()
+    except Exception as e:
+        frappe.db.rollback(save_point=ROW_SAVEPOINT)
+        return None, get_error_message(e)
+    frappe.db.release_savepoint(ROW_SAVEPOINT)
+    return result, None
+
+
+def bulk_insert_docs(doctype, docs):
+    """
+    Inserts prepared documents with one multi-row statement
+    """
+    rows = [
+        doc.get_valid_dict(convert_dates_to_str=True, ignore_virtual=True)
+        for doc in docs
+    ]
+    fields = list(rows[0])
+    frappe.db.bulk_insert(
+        doctype, fields, [tuple(row.get(field) for field in fields) for row in rows]
+    )
+
+
+def run_after_bulk_insert(doctype, docs):
+    """
+    Runs once for documents inserted in bulk what runs on insert of every document
+    """
+    clear_count_cache(docs[0])
+    clear_report_cache(docs[0])
+    clear_doctype_notifications(docs[0])
+    update_search_index_bulk(doctype, docs)
+    docs[-1].notify_update()
+
+
+def insert_prepared(doctype, docs, results):
+    """
+    Inserts the prepared documents of a chunk ({index: doc}), one by one
+    when the multi-row insert fails, e.g. on a duplicate name
+    """
+    if not docs:
+        return
+
+    _result, error = run_in_savepoint(
+        lambda: bulk_insert_docs(doctype, list(docs.values()))
+    )
+    if error:
+        inserted = {}
+        for idx, doc in docs.items():
+            _result, error = run_in_savepoint(doc.db_insert)
+            if error:
+                results[idx] = get_result(FAILED, doc.name, error)
+            else:
+                inserted[idx] = doc
+        docs = inserted
+
+    for idx, doc in docs.items():
+        results[idx] = get_result(INSERTED, doc.name)
+    if docs:
+        run_after_bulk_insert(doctype, list(docs.values()))
+
+
+def save_record(doctype, record, existing_names):
+    """
+    Inserts or updates a record through its controller, returns its name
+    """
+    if not record.get("name"):
+        return frappe.get_doc({**record, "doctype": doctype}).insert().name
+
+    if normalize_name(record["name"]) not in existing_names:
+        frappe.throw(
+            _("{0} {1} not found").format(_(doctype), record["name"]),
+            frappe.DoesNotExistError,
+        )
+    # already locked by get_existing_names
+    doc = frappe.get_doc(doctype, record["name"])
+    if not doc.has_permission("write"):
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+    doc.update(record)
+    doc.save()
+    return doc.name
+
+
+def get_result(status, name=None, error=None):
+    return {"status": status, "name": name, "error": error}
+
+
+def save_records(doctype, records, chunk_size=None):
+    """
+    Inserts the records without a `name` and updates the others, committing
+    every `chunk_size` records. Returns the result of every record, in order:
+
+    {"inserted": 2, "updated": 1, "failed": 1, "results": [
+        {"status": "Inserted" | "Updated" | "Failed", "name": ..., "error": ...}
+    ]}
+    """
+    meta = frappe.get_meta(doctype)
+    # flags (e.g. ignore_permissions) are not set by the client
+    records = [
+        {key: value for key, value in record.items() if key != "flags"}
+        for record in records
+    ]
+    inserts = [idx for idx, record in enumerate(records) if not record.get("name")]
+    if inserts:
+        frappe.has_permission(doctype, "create", throw=True)
+    if len(inserts) < len(records):
+        frappe.has_permission(doctype, "write", throw=True)
+
+    results = [None] * len(records)
+    prepared = {}
+    if inserts and can_bulk_insert(doctype):
+        check_user_permissions = bool(get_user_permissions())
+        for idx in inserts:
+            if has_child_rows(meta, records[idx]):
+                continue
+            try:
+                prepared[idx] = prepare_insert(
+                    {**records[idx], "doctype": doctype}, check_user_permissions
+                )
+            except Exception as e:
+                results[idx] = get_result(FAILED, error=get_error_message(e))
+
+        for idx, error in validate_links(meta, prepared).items():
+            results[idx] = get_result(FAILED, prepared.pop(idx).name, error)
+
+    for chunk in create_batch(range(len(records)), get_chunk_size(chunk_size)):
+        pending = [idx for idx in chunk if results[idx] is None]
+        insert_prepared(
+            doctype, {idx: prepared[idx] for idx in pending if idx in prepared}, results
+        )
+
+        others = [idx for idx in pending if idx not in prepared]
+        existing_names = get_existing_names(
+            doctype,
+            [records[idx]["name"] for idx in others if records[idx].get("name")],
+            for_update=True,
+        )
+        for idx in others:
+            name, error = run_in_savepoint(
+                lambda: save_record(doctype, records[idx], existing_names)
+            )
+            if error:
+                results[idx] = get_result(FAILED, records[idx].get("name"), error)
+            else:
+                status = UPDATED if records[idx].get("name") else INSERTED
+                results[idx] = get_result(status, name)
+
+        frappe.db.commit()
+
+    return {
+        "inserted": sum(result["status"] == INSERTED for result in results),
+        "updated": sum(result["status"] == UPDATED for result in results),
+        "failed": sum(result["status"] == FAILED for result in results),
+        "results": results,
+    }
@@ -0,0 +1,87 @@
+"""
+This file includes the helpers shared by the app level redis caches
+"""
+
+import hashlib
+
+import frappe
+
+CACHE_PREFIX = "g_healthy"
+
+
+def make_cache_key(*parts):
+    """
+    Returns a cache key under the app prefix, e.g. `g_healthy:schema:User:...`
+    """
+    return ":".join([CACHE_PREFIX, *(str(part) for part in parts)])
+
+
+def make_hash(*parts):
+    """
+    Returns a short and stable hash of the given JSON serialisable parts.
+    Keys of dicts are sorted so that equal payloads always hash the same.
+    """
+    payload = frappe.as_json(parts, indent=None)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def get_roles_hash(user=None):
+    """
+    Returns a hash of the role set of the given user (defaults to session user)
+    """
+    return make_hash(sorted(frappe.get_roles(user or frappe.session.user)))
+
+
+def get_generation(namespace):
+    """
+    Returns the current generation of a cache namespace.
+
+    Cached values embed the generation in their keys, so bumping it
+    invalidates every entry of the namespace in O(1) without scanning redis.
+    """
+    value = frappe.cache.get(frappe.cache.make_key(make_cache_key("gen", namespace)))
+    return int(value) if value else 0
+
+
+def bump_generation(namespace):
+    """
+    Invalidates all the cached values of a namespace
+    """
+    frappe.cache.incr(frappe.cache.make_key(make_cache_key("gen", namespace)))
+
+
+def get_cached(key, builder, expires_in_sec=None):
+    """
+    Returns the value stored under `key`, building and storing it on a miss
+    """
+    value = frappe.cache.get_value(key)
+    if value is None:
+        value = builder()
+        frappe.cache.set_value(key, value, expires_in_sec=expires_in_sec)
+    return value
+
+
+def get_permission_fingerprint(doctype, user=None):
+    """
+    Returns a hash of everything that decides which records of a doctype a user can see:
+    the role set and user permissions, plus the user itself when access depends on
+    ownership, shares or permission query conditions (which may use the user).
+    """
+    from frappe.core.doctype.server_script.server_script_utils import (
+        get_server_script_map,
+    )
+    from frappe.permissions import get_role_permissions, get_user_permissions
+
+    user = user or frappe.session.user
+    role_permissions = get_role_permissions(frappe.get_meta(doctype), user)
+    per_user = (
+        not role_permissions.get("read")
+        or role_permissions.get("if_owner", {}).get("read")
+        or frappe.get_hooks("permission_query_conditions", {}).get(doctype)
+        or get_server_script_map().get("permission_query", {}).get(doctype)
+    )
+    return make_hash(
+        sorted(frappe.get_roles(user)),
+        get_user_permissions(user),
+        user if per_user else None,
+    )
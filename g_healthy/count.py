@@ -0,0 +1,164 @@
+"""
+This file includes the count strategy of list views.
+
+Counts up to EXACT_COUNT_THRESHOLD are exact: the permitted records are
+counted with a `count(*)` capped at the threshold. Above it, the query plan
+(or the table statistics, for users who can read every record) is used
+instead of counting the whole table. Results are cached for a short time per
+doctype, filters and permission fingerprint, and the cache of a doctype is
+cleared whenever one of its records is inserted or deleted.
+"""
+
+import frappe
+from frappe.permissions import get_role_permissions, get_user_permissions
+
+from g_healthy.cache import (
+    bump_generation,
+    get_generation,
+    get_permission_fingerprint,
+    make_cache_key,
+    make_hash,
+)
+from g_healthy.search import get_list_query
+
+EXACT_COUNT_THRESHOLD = 10000
+COUNT_CACHE_TTL = 60
+
+
+def get_count(doctype, filters=None, or_filters=None, distinct=False, search=None):
+    """
+    Returns the number of records matching the filters (and the search text)
+    and whether it is exact
+    """
+    key = make_cache_key(
+        "count",
+        doctype,
+        get_generation(f"count:{doctype}"),
+        make_hash(
+            filters, or_filters, distinct, search, get_permission_fingerprint(doctype)
+        ),
+    )
+    cached = frappe.cache.get_value(key)
+    if cached is not None:
+        return cached
+
+    count = get_capped_count(doctype, filters, or_filters, distinct, search)
+    if count <= EXACT_COUNT_THRESHOLD:
+        result = (count, True)
+    else:
+        # there are more, the estimate can only be used as an upper figure
+        estimate = estimate_count(doctype, filters, or_filters, search)
+        result = (max(estimate or 0, count), False)
+
+    frappe.cache.set_value(key, result, expires_in_sec=COUNT_CACHE_TTL)
+    return result
+
+
+def get_capped_count(
+    doctype, filters=None, or_filters=None, distinct=False, search=None
+):
+    """
+    Returns the exact number of permitted records matching the filters,
+    counting at most EXACT_COUNT_THRESHOLD + 1 of them
+    """
+    distinct = "distinct " if distinct else ""
+    query = get_list_query(doctype, search).execute(
+        filters=filters,
+        or_filters=or_filters,
+        fields=[f"{distinct}`tab{doctype}`.name"],
+        order_by=None,
+        limit_page_length=EXACT_COUNT_THRESHOLD + 1,
+        run=0,
+    )
+    return frappe.db.sql(f"select count(*) from ({query}) p")[0][0]
+
+
+def has_match_conditions(doctype, user=None):
+    """
+    Returns True when the records a user can read are narrowed down by
+    conditions (ownership, user permissions, permission queries)
+    """
+    user = user or frappe.session.user
+    if user == "Administrator":
+        return False
+
+    role_permissions = get_role_permissions(frappe.get_meta(doctype), user)
+    if not role_permissions.get("read") or role_permissions.get("if_owner", {}).get(
+        "read"
+    ):
+        return True
+    if get_user_permissions(user):
+        return True
+    if frappe.get_hooks("permission_query_conditions", {}).get(doctype):
+        return True
+
+    from frappe.core.doctype.server_script.server_script_utils import (
+        get_server_script_map,
+    )
+
+    return bool(get_server_script_map().get("permission_query", {}).get(doctype))
+
+
+def estimate_count(doctype, filters=None, or_filters=None, search=None):
+    """
+    Returns the row estimate of the database, None if there is none.
+    Table statistics are used when nothing narrows the records down, the query
+    plan of the permitted records otherwise.
+    """
+    if frappe.get_meta(doctype).is_virtual:
+        return None
+
+    try:
+        if (
+            not filters
+            and not or_filters
+            and not search
+            and not has_match_conditions(doctype)
+        ):
+            return estimate_table_rows(doctype)
+        return estimate_query_rows(doctype, filters, or_filters, search)
+    except Exception:
+        # an estimate is only an optimisation, the capped count is used instead
+        frappe.log_error(title=f"Count estimate failed for {doctype}")
+        return None
+
+
+def estimate_table_rows(doctype):
+    if frappe.db.db_type == "postgres":
+        rows = frappe.db.sql(
+            "select reltuples::bigint from pg_class where relname = %s",
+            (f"tab{doctype}",),
+        )
+    else:
+        rows = frappe.db.sql(
+            """select table_rows from information_schema.tables
+            where table_schema = database() and table_name = %s""",
+            (f"tab{doctype}",),
+        )
+    # postgres reports -1 for tables that were never analyzed
+    if rows and rows[0][0] is not None and rows[0][0] >= 0:
+        return rows[0][0]
+    return None
+
+
+def estimate_query_rows(doctype, filters=None, or_filters=None, search=None):
+    query = get_list_query(doctype, search).execute(
+        filters=filters,
+        or_filters=or_filters,
+        fields=[f"`tab{doctype}`.name"],
+        order_by=None,
+        run=0,
+    )
+    if frappe.db.db_type == "postgres":
+        plan = frappe.db.sql(f"explain (format json) {query}")[0][0]
+        return plan[0]["Plan"]["Plan Rows"]
+
+    plan = frappe.db.sql(f"explain {query}", as_dict=True)
+    return plan[0].get("rows") if plan else None
+
+
+def clear_count_cache(doc, method=None):
+    """
+    Invalidates the cached counts of a doctype, runs on insert and trash of every doctype
+    """
+    bump_generation(f"count:{doc.doctype}")
@@ -4,6 +4,8 @@ import frappe
 import geocoder
 import requests
 
+from g_healthy.naming import get_next_name
+
 
 # def validate_on_update(data, method):
 #     if frappe.flags.in_migrate:
@@ -346,36 +348,4 @@ def custom_naming(doc, method):
     doc_meta = frappe.get_meta(doc.doctype)
     if doc_meta and doc_meta.naming_rule == "By script":
         doc.naming_series = None
-
-        series_key = doc.doctype
-
-        current_number = frappe.db.get_value(
-            "Series", {"name": series_key}, "current", order_by=None
-        )
-
-        if current_number is None:
-            # If series does not exist, initialize it with 1
-            new_number = 1
-            frappe.db.sql(
-                """INSERT INTO `tabSeries` (`name`, `current`) 
-                   VALUES (%s, %s) 
-                   ON CONFLICT (`name`) DO NOTHING""",
-                (series_key, new_number),
-            )
-        else:
-            # Increment the existing number
-            new_number = int(current_number) + 1
-            frappe.db.sql(
-                """UPDATE `tabSeries` SET `current` = %s WHERE `name` = %s""",
-                (new_number, series_key),
-            )
-        old_number = new_number
-        while frappe.db.exists(doc.doctype, {"name": str(new_number)}):
-            new_number += 1
-        if frappe.db.exists(doc.doctype, {"name": str(old_number)}):
-            frappe.db.sql(
-                """UPDATE `tabSeries` SET `current` = %s WHERE `name` = %s""",
-                (new_number, series_key),
-            )
-
-        doc.name = str(new_number)
+        doc.name = get_next_name(doc.doctype)
@@ -0,0 +1,223 @@
+"""
+This file includes the enrichment stage of list responses: display values that
+are resolved for a whole page of records at once, so the number of queries does
+not grow with the page size.
+"""
+
+import json
+from collections import OrderedDict
+
+import frappe
+from frappe.utils import cstr
+
+from g_healthy.cache import bump_generation, get_generation, make_cache_key
+
+# Size of the per worker LRU of user display names
+USER_NAME_CACHE_SIZE = 4096
+
+_user_names = OrderedDict()
+_user_names_generation = None
+
+
+def get_user_names(users):
+    """
+    Returns a {user: full_name} map for the given users.
+
+    Names are kept in a process level LRU, which is dropped whenever the
+    `user_names` generation is bumped on save of a User.
+    """
+    global _user_names_generation
+
+    generation = get_generation("user_names")
+    if generation != _user_names_generation:
+        _user_names.clear()
+        _user_names_generation = generation
+
+    users = {user for user in users if user}
+    missing = [user for user in users if user not in _user_names]
+    if missing:
+        fetched = dict(
+            frappe.get_all(
+                "User",
+                filters={"name": ["in", missing]},
+                fields=["name", "full_name"],
+                as_list=True,
+            )
+        )
+        for user in missing:
+            _user_names[user] = fetched.get(user)
+        while len(_user_names) > USER_NAME_CACHE_SIZE:
+            _user_names.popitem(last=False)
+
+    names = {}
+    for user in users:
+        _user_names.move_to_end(user)
+        names[user] = _user_names[user]
+    return names
+
+
+def clear_user_names(doc=None, method=None):
+    bump_generation("user_names")
+
+
+def enrich_owners_and_assignees(records):
+    """
+    Adds `owner_name` to the records and expands `_assign` into a list of
+    {email, full_name}, resolving all the users with at most one query
+    """
+    assignees = {}
+    users = set()
+    for record in records:
+        users.add(record.get("owner"))
+        if record.get("_assign"):
+            assignees[record.name] = json.loads(record._assign)
+            users.update(assignees[record.name])
+
+    user_names = get_user_names(users)
+    for record in records:
+        record["owner_name"] = (
+            "Admin"
+            if record.owner == "Administrator"
+            else user_names.get(record.owner) or record.owner
+        )
+        if record.name in assignees:
+            record["_assign"] = [
+                {"email": email, "full_name": user_names.get(email) or ""}
+                for email in assignees[record.name]
+            ]
+
+
+# Link titles are kept in one redis hash per doctype and title field
+LINK_TITLES_TTL = 24 * 60 * 60
+
+
+def get_title_field(doctype):
+    """
+    Returns the title field of a doctype, None when records are shown by name
+    """
+    title_field = frappe.get_meta(doctype).title_field
+    return title_field if title_field and title_field != "name" else None
+
+
+def get_link_title_key(doctype, title_field):
+    return make_cache_key("link_titles", doctype, title_field)
+
+
+def get_link_titles(values_by_doctype):
+    """
+    Returns {doctype: {name: title}} for the given {doctype: names} map.
+
+    Titles are read from redis and the misses are fetched with one IN query per
+    doctype. Doctypes without a title field are left out.
+    """
+    titles = {}
+    for doctype, names in values_by_doctype.items():
+        title_field = get_title_field(doctype)
+        names = list({name for name in names if name})
+        if not title_field or not names:
+            continue
+
+        key = frappe.cache.make_key(get_link_title_key(doctype, title_field))
+        cached = frappe.cache.hmget(key, names)
+        doctype_titles = {
+            name: title.decode()
+            for name, title in zip(names, cached, strict=True)
+            if title is not None
+        }
+        missing = [name for name in names if name not in doctype_titles]
+        if missing:
+            fetched = {
+                name: cstr(title)
+                for name, title in frappe.get_all(
+                    doctype,
+                    filters={"name": ["in", missing]},
+                    fields=["name", title_field],
+                    as_list=True,
+                )
+            }
+            if fetched:
+                pipeline = frappe.cache.pipeline()
+                pipeline.hset(key, mapping=fetched)
+                pipeline.expire(key, LINK_TITLES_TTL)
+                pipeline.execute()
+            doctype_titles.update(fetched)
+
+        titles[doctype] = doctype_titles
+    return titles
+
+
+def get_list_view_link_fields(doctype):
+    """
+    Returns {fieldname: linked doctype} of the Link columns in the List View Settings
+    """
+    settings_fields = frappe.get_cached_value("List View Settings", doctype, "fields")
+    if not settings_fields:
+        return {}
+
+    meta = frappe.get_meta(doctype)
+    link_fields = {}
+    for field in json.loads(settings_fields) or []:
+        df = meta.get_field(field.get("fieldname"))
+        if df and df.fieldtype == "Link" and df.options:
+            link_fields[df.fieldname] = df.options
+    return link_fields
+
+
+def get_record_link_titles(doctype, records, link_fields=None):
+    """
+    Returns {linked doctype: {name: title}} for the Link columns of a page of records
+    """
+    link_fields = (
+        get_list_view_link_fields(doctype) if link_fields is None else link_fields
+    )
+    values_by_doctype = {}
+    for fieldname, link_doctype in link_fields.items():
+        values = values_by_doctype.setdefault(link_doctype, set())
+        values.update(record.get(fieldname) for record in records)
+    return get_link_titles(values_by_doctype)
+
+
+def get_document_links(meta, doc):
+    """
+    Yields (linked doctype, name) for the Link and Dynamic Link values of a document
+    """
+    for df in meta.get_link_fields() + meta.get_dynamic_link_fields():
+        value = doc.get(df.fieldname)
+        link_doctype = df.options if df.fieldtype == "Link" else doc.get(df.options)
+        if value and link_doctype:
+            yield link_doctype, value
+
+
+def set_link_titles(doc):
+    """
+    Sets the `__link_titles` of a document and its child rows for its print, as
+    `frappe.www.printview.set_link_titles` does, with one query per linked doctype
+    """
+    meta = frappe.get_meta(doc.doctype)
+    links = list(get_document_links(meta, doc))
+    for df in meta.get_table_fields():
+        child_meta = frappe.get_meta(df.options)
+        for child in doc.get(df.fieldname) or []:
+            links.extend(get_document_links(child_meta, child))
+
+    values_by_doctype = {}
+    for link_doctype, name in links:
+        link_meta = frappe.get_meta(link_doctype)
+        if link_meta.title_field and link_meta.show_title_field_in_link:
+            values_by_doctype.setdefault(link_doctype, set()).add(name)
+
+    if not doc.get("__link_titles"):
+        setattr(doc, "__link_titles", {})
+    doc_link_titles = doc.get("__link_titles")
+    for link_doctype, titles in get_link_titles(values_by_doctype).items():
+        for name, title in titles.items():
+            doc_link_titles[f"{link_doctype}::{name}"] = title
+
+
+def clear_link_title(doc, method=None):
+    """
+    Drops the cached title of a document, runs on update and trash of every doctype
+    """
+    title_field = get_title_field(doc.doctype)
+    if title_field:
+        frappe.cache.hdel(get_link_title_key(doc.doctype, title_field), doc.name)
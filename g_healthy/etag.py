@@ -0,0 +1,56 @@
+"""
+This file includes the conditional request layer of the metadata endpoints.
+
+An endpoint computes a strong ETag from the versions of what it returns
+(meta `modified`, cache generations...), the role set of the user and the app
+version. When the client sends the same ETag back in `If-None-Match`, a bodiless
+304 is returned instead of building the response again.
+"""
+
+import frappe
+from werkzeug.wrappers import Response
+
+from g_healthy import __version__
+from g_healthy.cache import get_roles_hash, make_hash
+
+
+def get_etag(*parts):
+    """
+    Returns a strong ETag of the given version parts for the session user
+    """
+    return '"{}"'.format(
+        make_hash(frappe.__version__, __version__, get_roles_hash(), *parts)
+    )
+
+
+def if_none_match(etag):
+    """
+    Returns True when the client already has the response of the given ETag
+    """
+    request = getattr(frappe.local, "request", None)
+    if not request:
+        return False
+    return etag in [
+        value.strip() for value in request.headers.get("If-None-Match", "").split(",")
+    ]
+
+
+def conditional_response(etag_parts, builder):
+    """
+    Returns a 304 response when the ETag of `etag_parts` matches `If-None-Match`,
+    otherwise the result of `builder` with the ETag set on the response.
+
+    Disabled in developer mode, where files change without a version bump.
+    """
+    if frappe.conf.developer_mode:
+        return builder()
+
+    etag = get_etag(*etag_parts)
+    if if_none_match(etag):
+        return Response(status=304, headers={"ETag": etag})
+
+    result = builder()
+    response_headers = getattr(frappe.local, "response_headers", None)
+    if response_headers is not None:
+        response_headers.set("ETag", etag)
+    return result
@@ -0,0 +1,272 @@
+"""
+This file includes the compiler of `depends_on` / `mandatory_depends_on` expressions.
+
+Expressions like `eval:doc.status == "Open" && !(doc.type in ["A", "B"])` are
+parsed once into a small AST made of lists, which is JSON serialisable so that
+it can be kept in redis, and evaluated against a dict of values, or against
+the values of some fields only (see `evaluate_partial`).
+
+Supported: `||`, `&&`, `!`, parentheses, `==`, `!=`, `===`, `!==`, `<`, `<=`,
+`>`, `>=`, `in` / `not in` a list (`[...]` or `(...)`), strings, numbers,
+`true`, `false`, `null`, `undefined` and `doc.<fieldname>` variables.
+Anything else (function calls, other objects) does not compile.
+"""
+
+import re
+from functools import lru_cache
+
+TOKEN_PATTERN = re.compile(
+    r"""\s*(?:
+    (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    |(?P<number>\d+(?:\.\d+)?)
+    |(?P<op>===|!==|==|!=|>=|<=|&&|\|\||[!()\[\],<>])
+    |(?P<name>[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*)
+    )""",
+    re.VERBOSE,
+)
+
+LITERALS = {"true": True, "false": False, "null": None, "undefined": None}
+COMPARISONS = {"==", "!=", "===", "!==", "<", "<=", ">", ">="}
+# values are compared loosely, whatever the operator
+STRICT_COMPARISONS = {"===": "==", "!==": "!="}
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip().rstrip(";")
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if not match or match.end() == position:
+            if expression[position:].strip():
+                raise ExpressionError(f"Unexpected character at {position}")
+            break
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = re.sub(r"\\(.)", r"\1", value[1:-1])
+        elif kind == "number":
+            value = float(value) if "." in value else int(value)
+        tokens.append((kind, value))
+    return tokens
+
+
+class Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def expect(self, value):
+        kind, token = self.next()
+        if token != value or kind not in ("op", "name"):
+            raise ExpressionError(f"Expected {value}, got {token}")
+
+    def parse(self):
+        node = self.parse_or()
+        if self.position != len(self.tokens):
+            raise ExpressionError(f"Unexpected {self.peek()[1]}")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == ("op", "||"):
+            self.next()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ["or", *nodes]
+
+    def parse_and(self):
+        nodes = [self.parse_unary()]
+        while self.peek() == ("op", "&&"):
+            self.next()
+            nodes.append(self.parse_unary())
+        return nodes[0] if len(nodes) == 1 else ["and", *nodes]
+
+    def parse_unary(self):
+        if self.peek() == ("op", "!"):
+            self.next()
+            return ["not", self.parse_unary()]
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_primary()
+        kind, token = self.peek()
+        if kind == "op" and token in COMPARISONS:
+            self.next()
+            operator = STRICT_COMPARISONS.get(token, token)
+            return ["cmp", operator, left, self.parse_primary()]
+        if (kind, token) == ("name", "in"):
+            self.next()
+            return ["in", left, self.parse_list()]
+        if (kind, token) == ("name", "not") and self.peek(1) == ("name", "in"):
+            self.position += 2
+            return ["not", ["in", left, self.parse_list()]]
+        return left
+
+    def parse_list(self):
+        kind, token = self.next()
+        if kind != "op" or token not in ("[", "("):
+            raise ExpressionError("Expected a list after in")
+        closing = "]" if token == "[" else ")"
+        items = []
+        while self.peek() != ("op", closing):
+            items.append(self.parse_primary())
+            if self.peek() == ("op", ","):
+                self.next()
+            elif self.peek() != ("op", closing):
+                raise ExpressionError(f"Expected , or {closing}")
+        self.next()
+        return ["list", *items]
+
+    def parse_primary(self):
+        kind, token = self.next()
+        if (kind, token) == ("op", "("):
+            node = self.parse_or()
+            self.expect(")")
+            return node
+        if (kind, token) == ("op", "["):
+            self.position -= 1
+            return self.parse_list()
+        if kind in ("string", "number"):
+            return ["lit", token]
+        if kind == "name":
+            if token in LITERALS:
+                return ["lit", LITERALS[token]]
+            if token.startswith("doc.") and token.count(".") == 1:
+                return ["var", token[4:]]
+        raise ExpressionError(f"Unsupported {token}")
+
+
+@lru_cache(maxsize=4096)
+def compile_expression(expression):
+    """
+    Returns the AST of an `eval:` expression, None if it cannot be compiled
+    """
+    if not expression:
+        return None
+    expression = expression.strip()
+    if expression.startswith("eval:"):
+        expression = expression[5:]
+    elif re.fullmatch(r"[\w]+", expression):
+        # a bare fieldname: the field must be set
+        return ["var", expression]
+    try:
+        return Parser(tokenize(expression)).parse()
+    except ExpressionError:
+        return None
+
+
+def evaluate(node, values):
+    """
+    Evaluates an AST against a dict of field values, with javascript semantics
+    """
+    operator = node[0]
+    if operator == "var":
+        return values.get(node[1])
+    if operator == "lit":
+        return node[1]
+    if operator == "or":
+        return any(is_truthy(evaluate(child, values)) for child in node[1:])
+    if operator == "and":
+        return all(is_truthy(evaluate(child, values)) for child in node[1:])
+    if operator == "not":
+        return not is_truthy(evaluate(node[1], values))
+    if operator == "in":
+        value = evaluate(node[1], values)
+        return any(loose_equals(value, evaluate(item, values)) for item in node[2][1:])
+    if operator == "list":
+        return [evaluate(item, values) for item in node[1:]]
+    if operator == "cmp":
+        return compare(node[1], evaluate(node[2], values), evaluate(node[3], values))
+    raise ExpressionError(f"Unknown node {operator}")
+
+
+def evaluate_partial(node, values):
+    """
+    Evaluates an AST against the values of some fields only. Returns True or
+    False when those values decide the expression, None when it depends on
+    fields that are not given.
+    """
+    operator = node[0]
+    if operator in ("or", "and"):
+        results = [evaluate_partial(child, values) for child in node[1:]]
+        # true for "or", false for "and" decides whatever the other fields are
+        deciding = operator == "or"
+        if deciding in results:
+            return deciding
+        return None if None in results else not deciding
+    if operator == "not":
+        result = evaluate_partial(node[1], values)
+        return None if result is None else not result
+    if not get_variables(node) <= set(values):
+        return None
+    return is_truthy(evaluate(node, values))
+
+
+def get_variables(node):
+    """
+    Returns the fieldnames an AST refers to
+    """
+    if node[0] == "var":
+        return {node[1]}
+    return set().union(
+        *(get_variables(child) for child in node[1:] if isinstance(child, list))
+    )
+
+
+def is_truthy(value):
+    return value not in (None, "", 0, False)
+
+
+def to_number(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int | float):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def loose_equals(left, right):
+    if left is None or right is None:
+        return left is None and right is None
+    if isinstance(left, str) and isinstance(right, str):
+        return left == right
+    if isinstance(left, int | float) or isinstance(right, int | float):
+        left, right = to_number(left), to_number(right)
+        return left is not None and left == right
+    return left == right
+
+
+def compare(operator, left, right):
+    if operator == "==":
+        return loose_equals(left, right)
+    if operator == "!=":
+        return not loose_equals(left, right)
+
+    if not (isinstance(left, str) and isinstance(right, str)):
+        left, right = to_number(left), to_number(right)
+        if left is None or right is None:
+            return False
+    if operator == "<":
+        return left < right
+    if operator == "<=":
+        return left <= right
+    if operator == ">":
+        return left > right
+    return left >= right
@@ -5,6 +5,12 @@ import frappe
 from frappe.model.document import Document
 import re
 
+from g_healthy.cache import get_generation
+from g_healthy.etag import conditional_response
+from g_healthy.permissions import get_permission_context
+
+from ..routes.navigation import get_user_menu_items
+
 
 class MenuItems(Document):
     def validate(self):
@@ -54,7 +60,7 @@ def modify_submenu_data(data):
 def transform_tabs_data(input_data):
     grouped_data = []  # Array to store objects with "groupby"
     ungrouped_data = []  # Array to store objects without "groupby"
-    cur_roles = frappe.get_roles(frappe.session.user)
+    cur_roles = get_permission_context().roles
     child = frappe.get_all(
         "RoutesRoles",
         fields=["*"],
@@ -82,37 +88,11 @@ def transform_tabs_data(input_data):
                 for tab in tabs:
                     permissions_r = None
                     if tab.page:
-                        roles1 = frappe.get_roles(frappe.session.user)
-                        keys = []
-                        link_keys = []
-                        try:
-                            fields = None
-                            docs = get_meta_bundle(tab.page)
-                            if docs and docs[0]:
-                                fields = docs[0].fields
-                                permissions = docs[0].permissions
-                                if permissions:
-                                    for permission in permissions:
-                                        if permission.permlevel == 0:
-                                            if "Administrator" in roles1:
-                                                permissions_r = {
-                                                    "read": 1,
-                                                    "create": 1,
-                                                    "delete": 1,
-                                                    "update": 1,
-                                                    "only_owner": 0,
-                                                }
-                                            else:
-                                                permissions_r = {
-                                                    "read": permission.read,
-                                                    "create": permission.create,
-                                                    "delete": permission.delete,
-                                                    "update": permission.write,
-                                                    "only_owner": permission.if_owner,
-                                                }
-
-                        except frappe.DoesNotExistError:
-                            frappe.clear_messages()
+                        permissions_r = (
+                            get_permission_context().get_dashboard_permissions(
+                                tab.page
+                            )
+                        )
                     tab["permissions"] = permissions_r
             key = item.get("path")
             label = item.get("label")
@@ -226,210 +206,23 @@ def get_menu_items(parent_id):
 @frappe.whitelist()
 def get_menu_items_optimized(parent_id):
     """
-    Optimized version of get_menu_items that uses batch queries to reduce database calls
+    Optimized version of get_menu_items served from the compiled navigation tree
     """
     try:
-        # Fetch the data
-        tabs = frappe.get_all(
-            "Menu Items",
-            filters={"route": parent_id},
-            fields=[
-                "name",
-                "order_sequence",
-                "path",
-                "label",
-                "content",
-                "group_by",
-                "page",
-                "child_page",
-                "creation",
-                "form_title",
-                "update_form_title",
-                "add_button_title",
-                "cancel_button_title",
-                "update_button_title",
-                "add_button_type",
-                "template",
-            ],
-            order_by="order_sequence asc",
+        return conditional_response(
+            (
+                "menu_items",
+                parent_id,
+                get_generation("navigation"),
+                get_generation("schema"),
+            ),
+            lambda: get_user_menu_items(parent_id),
         )
-
-        return transform_tabs_data_optimized(tabs)
     except Exception as e:
         frappe.log_error(f"Error in get_menu_items_optimized: {str(e)}")
         return None
 
 
-def transform_tabs_data_optimized(input_data):
-    """
-    Optimized version of transform_tabs_data that uses batch queries
-    """
-    grouped_data = []  # Array to store objects with "groupby"
-    ungrouped_data = []  # Array to store objects without "groupby"
-    cur_roles = frappe.get_roles(frappe.session.user)
-
-    # OPTIMIZED: Batch fetch all menu item roles at once
-    menu_item_names = [item.get("name") for item in input_data]
-    all_menu_roles = frappe.get_all(
-        "RoutesRoles",
-        fields=["*"],
-        filters={
-            "title": ["IN", cur_roles],
-            "parenttype": "Menu Items",
-            "parent": ["IN", menu_item_names],
-        },
-    )
-    authorized_menu_items = {row["parent"] for row in all_menu_roles}
-
-    # OPTIMIZED: Batch fetch all tabs for all menu items at once
-    all_tabs = frappe.get_all(
-        "Page Tabs",
-        filters={"menu_item": ["IN", menu_item_names]},
-        fields=["*"],
-        order_by="sequence_number asc",
-    )
-
-    # Group tabs by menu item
-    tabs_lookup = {}
-    for tab in all_tabs:
-        if tab["menu_item"] not in tabs_lookup:
-            tabs_lookup[tab["menu_item"]] = []
-        tabs_lookup[tab["menu_item"]].append(tab)
-
-    # OPTIMIZED: Batch fetch all unique pages for meta bundle caching
-    unique_pages = set()
-    for tab in all_tabs:
-        if tab.get("page"):
-            unique_pages.add(tab["page"])
-
-    # Pre-load meta bundles for all unique pages
-    meta_bundle_cache = {}
-    for page in unique_pages:
-        try:
-            meta_bundle_cache[page] = get_meta_bundle(page)
-        except:
-            meta_bundle_cache[page] = None
-
-    # Iterate through the input data
-    for item in input_data:
-        if item.get("name") in authorized_menu_items:
-            # Get menu item roles using the original approach
-            temp_menu = frappe.get_doc("Menu Items", item.get("name"))
-            roles2 = temp_menu.roles
-            roles_temp = []
-            if roles2:
-                for role_temp in roles2:
-                    roles_temp.append(role_temp.title)
-
-            name = item.get("name")
-            # Use pre-fetched tabs
-            tabs = tabs_lookup.get(name, [])
-
-            if tabs:
-                for tab in tabs:
-                    permissions_r = None
-                    if tab.get("page") and tab["page"] in meta_bundle_cache:
-                        docs = meta_bundle_cache[tab["page"]]
-                        if docs and docs[0]:
-                            permissions = docs[0].permissions
-                            if permissions:
-                                for permission in permissions:
-                                    if permission.permlevel == 0:
-                                        if "Administrator" in cur_roles:
-                                            permissions_r = {
-                                                "read": 1,
-                                                "create": 1,
-                                                "delete": 1,
-                                                "update": 1,
-                                                "only_owner": 0,
-                                            }
-                                        else:
-                                            permissions_r = {
-                                                "read": permission.read,
-                                                "create": permission.create,
-                                                "delete": permission.delete,
-                                                "update": permission.write,
-                                                "only_owner": permission.if_owner,
-                                            }
-                    tab["permissions"] = permissions_r
-
-            key = item.get("path")
-            label = item.get("label")
-            content = item.get("content")
-            groupby = item.get("group_by")
-            page = item.get("page")
-            child_page = item.get("child_page")
-
-            form_title = item.get("form_title")
-            update_form_title = item.get("update_form_title")
-            add_button_title = item.get("add_button_title")
-            cancel_button_title = item.get("cancel_button_title")
-            update_button_title = item.get("update_button_title")
-            add_button_type = item.get("add_button_type")
-            template = item.get("template")
-
-            if groupby:
-                # If the item has a "groupby" value, add it to the grouped_data array
-                grouped_data.append(
-                    {
-                        "key": key,
-                        "label": label,
-                        "content": content,
-                        "groupby": groupby,
-                        "page": page,
-                        "path": key,
-                        "child_page": child_page,
-                        "name": name,
-                        "labels": {
-                            "form_title": form_title,
-                            "update_form_title": update_form_title,
-                            "add_button_title": add_button_title,
-                            "cancel_button_title": cancel_button_title,
-                            "update_button_title": update_button_title,
-                            "add_button_type": add_button_type,
-                            "template": template,
-                        },
-                        "tabs": tabs,
-                        "roles": roles_temp,
-                    }
-                )
-            else:
-                # If there's no "groupby" value, add it to the ungrouped_data array
-                ungrouped_data.append(
-                    {
-                        "key": key,
-                        "label": label,
-                        "content": content,
-                        "page": page,
-                        "path": key,
-                        "child_page": child_page,
-                        "name": name,
-                        "labels": {
-                            "form_title": form_title,
-                            "update_form_title": update_form_title,
-                            "add_button_title": add_button_title,
-                            "cancel_button_title": cancel_button_title,
-                            "update_button_title": update_button_title,
-                            "add_button_type": add_button_type,
-                            "template": template,
-                        },
-                        "tabs": tabs,
-                        "roles": roles_temp,
-                    }
-                )
-
-    # Iterate through ungrouped_data and add items from grouped_data to their submenu
-    for ungrouped_item in ungrouped_data:
-        key = ungrouped_item.get("name")
-        ungrouped_item["subMenu"] = [
-            grouped_item
-            for grouped_item in grouped_data
-            if grouped_item.get("groupby") == key
-        ]
-
-    return modify_submenu_data(ungrouped_data)
-
-
 def get_meta_bundle(doctype):
     bundle = [frappe.desk.form.meta.get_meta(doctype)]
     for df in bundle[0].fields:
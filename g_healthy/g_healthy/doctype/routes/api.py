@@ -1,125 +1,24 @@
 import json
 
 import frappe
-from frappe import get_all
 
-from ..menu_items.menu_items import get_menu_items, get_menu_items_optimized
+from g_healthy.cache import get_generation
+from g_healthy.etag import conditional_response
+
+from .navigation import get_user_routes
 
 
 @frappe.whitelist()
 def get_parent_and_child_data():
-    cur_roles = frappe.get_roles(frappe.session.user)
-    child = get_all(
-        "RoutesRoles",
-        fields=["parent"],
-        filters={"title": ["IN", cur_roles], "parenttype": "Routes"},
-    )
-    child = [row["parent"] for row in child]
-    data = get_all(
-        "Routes",
-        fields=["*"],
-        filters={"ishidden": 0, "name": ["IN", child]},
-        order_by="sequence_number asc",
-    )
-
-    # OPTIMIZED: Batch fetch all roles for all routes at once
-    route_names = [row["name"] for row in data]
-    all_roles = get_all(
-        "RoutesRoles",
-        filters={"parent": ["IN", route_names]},
-        fields=["parent", "title"],
+    """
+    Returns the routes of the session user along with their tabs and menu items.
+    Served from the compiled navigation tree, see `navigation.py`.
+    """
+    return conditional_response(
+        ("routes", get_generation("navigation"), get_generation("schema")),
+        get_user_routes,
     )
 
-    # Create a lookup dictionary for roles
-    roles_lookup = {}
-    for role in all_roles:
-        if role["parent"] not in roles_lookup:
-            roles_lookup[role["parent"]] = []
-        roles_lookup[role["parent"]].append(role["title"])
-
-    # OPTIMIZED: Batch fetch all tabs for all routes at once
-    all_tabs = get_all(
-        "Page Tabs",
-        filters={"route": ["IN", route_names]},
-        fields=["*"],
-        order_by="sequence_number asc",
-    )
-
-    # Group tabs by route
-    tabs_lookup = {}
-    for tab in all_tabs:
-        if tab["route"] not in tabs_lookup:
-            tabs_lookup[tab["route"]] = []
-        tabs_lookup[tab["route"]].append(tab)
-
-    # OPTIMIZED: Batch fetch all unique pages for meta bundle caching
-    unique_pages = set()
-    for tab in all_tabs:
-        if tab.get("page"):
-            unique_pages.add(tab["page"])
-
-    # Pre-load meta bundles for all unique pages
-    meta_bundle_cache = {}
-    for page in unique_pages:
-        try:
-            meta_bundle_cache[page] = get_meta_bundle(page)
-        except:
-            meta_bundle_cache[page] = None
-
-    # Include child table data by querying the child table directly
-    for row in data:
-        # Use pre-fetched roles
-        row["roles"] = roles_lookup.get(row["name"], [])
-
-        # Use pre-fetched tabs
-        tabs = tabs_lookup.get(row["name"], [])
-
-        if tabs:
-            for tab in tabs:
-                # Get tab details using the original approach for roles
-                tab_details = frappe.get_doc("Page Tabs", tab["name"])
-                roles_temp = []
-                if tab_details.roles:
-                    for role_temp in tab_details.roles:
-                        roles_temp.append(role_temp.title)
-                tab["roles"] = roles_temp
-
-                permissions_r = None
-                if tab.get("page") and tab["page"] in meta_bundle_cache:
-                    docs = meta_bundle_cache[tab["page"]]
-                    if docs and docs[0]:
-                        permissions = docs[0].permissions
-                        if permissions:
-                            for permission in permissions:
-                                if permission.permlevel == 0:
-                                    if "Administrator" in cur_roles:
-                                        permissions_r = {
-                                            "read": 1,
-                                            "create": 1,
-                                            "delete": 1,
-                                            "update": 1,
-                                            "only_owner": 0,
-                                        }
-                                    else:
-                                        permissions_r = {
-                                            "read": permission.read,
-                                            "create": permission.create,
-                                            "delete": permission.delete,
-                                            "update": permission.write,
-                                            "only_owner": permission.if_owner,
-                                        }
-                tab["permissions"] = permissions_r
-
-        # Add header data here - use optimized function to reduce database calls
-        row["subRoutes"] = get_menu_items_optimized(row["name"])
-        row["tabs"] = tabs
-
-    # Sort the data array by the "name" field
-    # sorted_data = sorted(data, key=lambda x: x["name"])
-    sorted_data = sorted(data, key=lambda x: x["sequence_number"])
-
-    return sorted_data
-
 
 @frappe.whitelist()
 def modify_submenu_data(data):
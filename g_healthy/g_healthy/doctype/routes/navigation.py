@@ -0,0 +1,217 @@
+"""
+This file includes the navigation tree of the dashboard: Routes, their
+Menu Items and the Page Tabs of both.
+
+The whole tree is compiled once with a handful of queries and kept in redis,
+each request then only filters it by the roles of the user.
+"""
+
+import frappe
+
+from g_healthy.cache import (
+    bump_generation,
+    get_cached,
+    get_generation,
+    make_cache_key,
+)
+from g_healthy.permissions import get_permission_context
+
+NAVIGATION_CACHE_TTL = 24 * 60 * 60
+
+MENU_ITEM_FIELDS = [
+    "name",
+    "route",
+    "order_sequence",
+    "path",
+    "label",
+    "content",
+    "group_by",
+    "page",
+    "child_page",
+    "creation",
+    "form_title",
+    "update_form_title",
+    "add_button_title",
+    "cancel_button_title",
+    "update_button_title",
+    "add_button_type",
+    "template",
+]
+
+def get_navigation_key(*parts):
+    # page permissions come from the doctype meta, so the tree also follows
+    # the schema generation bumped on save of DocType and Custom DocPerm
+    return make_cache_key(
+        "navigation",
+        get_generation("navigation"),
+        get_generation("schema"),
+        *parts,
+    )
+
+
+def get_navigation_tree():
+    return get_cached(
+        get_navigation_key("tree"),
+        build_navigation_tree,
+        expires_in_sec=NAVIGATION_CACHE_TTL,
+    )
+
+
+def build_navigation_tree():
+    """
+    Returns {"routes": [...], "menu_items": {route: [...]}} with the roles of
+    every route and menu item resolved
+    """
+    routes = frappe.get_all(
+        "Routes",
+        fields=["*"],
+        filters={"ishidden": 0},
+        order_by="sequence_number asc",
+    )
+    menu_items = frappe.get_all(
+        "Menu Items", fields=MENU_ITEM_FIELDS, order_by="order_sequence asc"
+    )
+    tabs = frappe.get_all("Page Tabs", fields=["*"], order_by="sequence_number asc")
+    roles = frappe.get_all(
+        "RoutesRoles",
+        fields=["parent", "parenttype", "title"],
+        filters={"parenttype": ["in", ["Routes", "Menu Items", "Page Tabs"]]},
+        order_by="idx asc",
+    )
+
+    roles_lookup = {}
+    for role in roles:
+        roles_lookup.setdefault((role.parenttype, role.parent), []).append(role.title)
+
+    route_tabs, menu_item_tabs = {}, {}
+    for tab in tabs:
+        if tab.route:
+            route_tabs.setdefault(tab.route, []).append(
+                {**tab, "roles": roles_lookup.get(("Page Tabs", tab.name), [])}
+            )
+        if tab.menu_item:
+            menu_item_tabs.setdefault(tab.menu_item, []).append(tab)
+
+    for route in routes:
+        route["roles"] = roles_lookup.get(("Routes", route.name), [])
+        route["tabs"] = route_tabs.get(route.name, [])
+
+    route_menu_items = {}
+    for item in menu_items:
+        item["roles"] = roles_lookup.get(("Menu Items", item.name), [])
+        item["tabs"] = menu_item_tabs.get(item.name, [])
+        route_menu_items.setdefault(item.route, []).append(item)
+
+    return {"routes": routes, "menu_items": route_menu_items}
+
+
+def get_user_routes(user=None):
+    """
+    Returns the routes the user has access to, each with its tabs and menu items
+    """
+    context = get_permission_context(user)
+    return get_cached(
+        get_navigation_key("routes", context.roles_hash),
+        lambda: filter_routes(get_navigation_tree(), context),
+        expires_in_sec=NAVIGATION_CACHE_TTL,
+    )
+
+
+def get_user_menu_items(route, user=None):
+    """
+    Returns the menu items of a route the user has access to
+    """
+    context = get_permission_context(user)
+    return get_cached(
+        get_navigation_key("menu_items", route, context.roles_hash),
+        lambda: filter_menu_items(
+            get_navigation_tree()["menu_items"].get(route, []), context
+        ),
+        expires_in_sec=NAVIGATION_CACHE_TTL,
+    )
+
+
+def filter_routes(tree, context):
+    routes = []
+    for route in tree["routes"]:
+        if not context.role_set.intersection(route["roles"]):
+            continue
+        routes.append(
+            {
+                **route,
+                "subRoutes": filter_menu_items(
+                    tree["menu_items"].get(route["name"], []), context
+                ),
+                "tabs": [with_permissions(tab, context) for tab in route["tabs"]],
+            }
+        )
+    return sorted(routes, key=lambda x: x["sequence_number"])
+
+
+def filter_menu_items(menu_items, context):
+    grouped_data = []  # Array to store objects with "groupby"
+    ungrouped_data = []  # Array to store objects without "groupby"
+
+    for item in menu_items:
+        if not context.role_set.intersection(item["roles"]):
+            continue
+
+        menu_item = {
+            "key": item["path"],
+            "label": item["label"],
+            "content": item["content"],
+            "page": item["page"],
+            "path": item["path"],
+            "child_page": item["child_page"],
+            "name": item["name"],
+            "labels": {
+                "form_title": item["form_title"],
+                "update_form_title": item["update_form_title"],
+                "add_button_title": item["add_button_title"],
+                "cancel_button_title": item["cancel_button_title"],
+                "update_button_title": item["update_button_title"],
+                "add_button_type": item["add_button_type"],
+                "template": item["template"],
+            },
+            "tabs": [with_permissions(tab, context) for tab in item["tabs"]],
+            "roles": item["roles"],
+        }
+        if item["group_by"]:
+            grouped_data.append(
+                {
+                    "key": menu_item.pop("key"),
+                    "label": menu_item.pop("label"),
+                    "content": menu_item.pop("content"),
+                    "groupby": item["group_by"],
+                    **menu_item,
+                }
+            )
+        else:
+            ungrouped_data.append(menu_item)
+
+    for ungrouped_item in ungrouped_data:
+        sub_menu = [
+            grouped_item
+            for grouped_item in grouped_data
+            if grouped_item["groupby"] == ungrouped_item["name"]
+        ]
+        # same as modify_submenu_data: either a submenu or a content
+        if sub_menu:
+            ungrouped_item["subMenu"] = sub_menu
+            ungrouped_item.pop("content", None)
+
+    return ungrouped_data
+
+
+def with_permissions(tab, context):
+    permissions = None
+    if tab["page"]:
+        permissions = context.get_dashboard_permissions(tab["page"])
+    return {**tab, "permissions": permissions}
+
+
+def clear_navigation_cache(doc=None, method=None):
+    """
+    Invalidates the navigation tree, runs on save of Routes, Menu Items, Page Tabs and RoutesRoles
+    """
+    bump_generation("navigation")
@@ -70,6 +70,7 @@ app_license = "mit"
 # ------------
 
 # after_migrate = "g_healthy.after_migrate.run_after_migrate"
+after_migrate = ["g_healthy.search.setup_search_table"]
 # before_install = "g_healthy.install.before_install"
 # after_install = "g_healthy.after_install.run_after_install"
 
@@ -144,6 +145,24 @@ override_doctype_class = {
 doc_events = {
     "*": {
         "autoname": "g_healthy.custom_hooks.custom_naming",
+        "after_insert": "g_healthy.count.clear_count_cache",
+        "on_update": [
+            "g_healthy.search.update_search_index",
+            "g_healthy.enrichment.clear_link_title",
+            "g_healthy.report_cache.clear_report_cache",
+        ],
+        "on_update_after_submit": [
+            "g_healthy.search.update_search_index",
+            "g_healthy.enrichment.clear_link_title",
+            "g_healthy.report_cache.clear_report_cache",
+        ],
+        "on_cancel": "g_healthy.report_cache.clear_report_cache",
+        "on_trash": [
+            "g_healthy.search.delete_from_search_index",
+            "g_healthy.count.clear_count_cache",
+            "g_healthy.enrichment.clear_link_title",
+            "g_healthy.report_cache.clear_report_cache",
+        ],
         # "before_insert": "g_healthy.planning.utils.restrict_admin_access",
     },
     "ToDo": {
@@ -155,6 +174,38 @@ doc_events = {
         "validate": "g_healthy.utils.update_user_sectors",
         "on_trash": "g_healthy.utils.update_user_sectors",
     },
+    "Custom Field": {
+        "on_update": "g_healthy.apis.api.clear_schema_cache",
+        "on_trash": "g_healthy.apis.api.clear_schema_cache",
+    },
+    "Property Setter": {
+        "on_update": "g_healthy.apis.api.clear_schema_cache",
+        "on_trash": "g_healthy.apis.api.clear_schema_cache",
+    },
+    "Custom DocPerm": {
+        "on_update": "g_healthy.apis.api.clear_schema_cache",
+        "on_trash": "g_healthy.apis.api.clear_schema_cache",
+    },
+    "Code": {
+        "on_update": "g_healthy.job_logs.clear_code_cache",
+        "on_trash": "g_healthy.job_logs.clear_code_cache",
+    },
+    "Routes": {
+        "on_update": "g_healthy.g_healthy.doctype.routes.navigation.clear_navigation_cache",
+        "on_trash": "g_healthy.g_healthy.doctype.routes.navigation.clear_navigation_cache",
+    },
+    "Menu Items": {
+        "on_update": "g_healthy.g_healthy.doctype.routes.navigation.clear_navigation_cache",
+        "on_trash": "g_healthy.g_healthy.doctype.routes.navigation.clear_navigation_cache",
+    },
+    "Page Tabs": {
+        "on_update": "g_healthy.g_healthy.doctype.routes.navigation.clear_navigation_cache",
+        "on_trash": "g_healthy.g_healthy.doctype.routes.navigation.clear_navigation_cache",
+    },
+    "RoutesRoles": {
+        "on_update": "g_healthy.g_healthy.doctype.routes.navigation.clear_navigation_cache",
+        "on_trash": "g_healthy.g_healthy.doctype.routes.navigation.clear_navigation_cache",
+    },
     # "Time Extension": {
     #     "after_insert": "g_healthy.planning.utils.workflow_updates",
     #     "on_submit": "g_healthy.planning.utils.workflow_updates",
@@ -0,0 +1,172 @@
+"""
+This file includes the ingestion of the job logs sent by the apps.
+
+The events of a log are written as Log Details in one transaction: the Codes
+they refer to are read from a dictionary cached until a Code changes, and the
+rows are inserted with one multi-row statement when Log Details has no
+controller hooks (see g_healthy.bulk). A request carrying an
+`Idempotency-Key` header (or `idempotency_key` field) is processed once:
+its retries get the response of the first request. Requests without a key
+are always processed, as identical logs may well be sent on purpose.
+"""
+
+import frappe
+from frappe import _
+from frappe.permissions import get_user_permissions
+
+from g_healthy.bulk import (
+    bulk_insert_docs,
+    can_bulk_insert,
+    has_child_rows,
+    normalize_name,
+    prepare_insert,
+    run_after_bulk_insert,
+    validate_links,
+)
+from g_healthy.cache import (
+    bump_generation,
+    get_cached,
+    get_generation,
+    make_cache_key,
+)
+
+CODES_TTL = 24 * 60 * 60
+
+# Seconds the response of a request is replayed to its retries
+IDEMPOTENCY_TTL = 24 * 60 * 60
+
+# Seconds a request is held as in progress, should its worker die
+IN_PROGRESS_TTL = 5 * 60
+
+IN_PROGRESS = b"in_progress"
+
+
+def get_codes():
+    """
+    Returns {normalized name: Code} of all the Codes with the values copied
+    to the Log Details, cached until a Code changes
+    """
+
+    def build():
+        return {
+            normalize_name(code.name): code
+            for code in frappe.get_all(
+                "Code", fields=["name", "is_billable", "general_cargo_group"]
+            )
+        }
+
+    return get_cached(
+        make_cache_key("codes", get_generation("codes")), build, CODES_TTL
+    )
+
+
+def clear_code_cache(doc=None, method=None):
+    bump_generation("codes")
+
+
+def get_log_detail_rows(events, log_name, set_code_values=True):
+    """
+    Returns the Log Details of the events of a log
+    """
+    codes = get_codes() if set_code_values else {}
+    rows = []
+    for event in events:
+        if not event or not event.get("event"):
+            continue
+
+        code = codes.get(normalize_name(event["event"]))
+        if code:
+            if code.is_billable:
+                event["is_billable"] = code.is_billable
+            if code.general_cargo_group:
+                event["general_cargo_group"] = code.general_cargo_group
+        if not event.get("hold"):
+            event["hold"] = ""
+        event["doctype"] = "Log Details"
+        event["logs"] = log_name
+        rows.append(event)
+    return rows
+
+
+def insert_log_details(rows):
+    """
+    Inserts Log Details with one multi-row statement, through their
+    controller when they have one. Returns their names.
+    """
+    if not rows:
+        return []
+
+    meta = frappe.get_meta("Log Details")
+    if not can_bulk_insert("Log Details") or any(
+        has_child_rows(meta, row) for row in rows
+    ):
+        return [frappe.get_doc(row).insert().name for row in rows]
+
+    frappe.has_permission("Log Details", "create", throw=True)
+    check_user_permissions = bool(get_user_permissions())
+    docs = {
+        idx: prepare_insert(row, check_user_permissions) for idx, row in enumerate(rows)
+    }
+    errors = validate_links(meta, docs)
+    if errors:
+        frappe.throw(next(iter(errors.values())), frappe.LinkValidationError)
+
+    bulk_insert_docs("Log Details", list(docs.values()))
+    run_after_bulk_insert("Log Details", list(docs.values()))
+    return [doc.name for doc in docs.values()]
+
+
+def save_log(data, events):
+    """
+    Inserts a log unless `data` has a name, then the Log Details of its events.
+    Code values are copied to the events of new logs only.
+    """
+    if data and not data.name:
+        data["doctype"] = "Logs"
+        log_name = frappe.get_doc(data).insert().name
+    else:
+        log_name = data.name
+
+    rows = get_log_detail_rows(events, log_name, set_code_values=not data.name)
+    return {"name": log_name, "log_details": insert_log_details(rows)}
+
+
+def get_idempotency_key(data):
+    """
+    Returns the cache key identifying a request and its retries, None when
+    the request has no Idempotency-Key
+    """
+    key = data.pop("idempotency_key", None)
+    key = frappe.get_request_header("Idempotency-Key") or key
+    return key and make_cache_key("job_logs", frappe.session.user, key)
+
+
+def run_once(key, function, ttl=IDEMPOTENCY_TTL):
+    """
+    Runs `function` unless it already ran for `key`, in which case its
+    response is returned again. The response is kept once committed.
+    """
+    if not key:
+        return function()
+
+    key = frappe.cache.make_key(key)
+    if not frappe.cache.set(key, IN_PROGRESS, nx=True, ex=IN_PROGRESS_TTL):
+        response = frappe.cache.get(key)
+        if response is None or response == IN_PROGRESS:
+            frappe.throw(
+                _("This request is already being processed, please retry later"),
+                frappe.DuplicateEntryError,
+            )
+        return frappe.parse_json(frappe.safe_decode(response))
+
+    frappe.db.after_rollback.add(lambda: frappe.cache.delete(key))
+    try:
+        response = function()
+    except Exception:
+        frappe.cache.delete(key)
+        raise
+
+    frappe.db.after_commit.add(
+        lambda: frappe.cache.set(key, frappe.as_json(response), ex=ttl)
+    )
+    return response
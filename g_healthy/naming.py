@@ -0,0 +1,197 @@
+"""
+This file includes the naming service of the doctypes named "By script".
+
+Records are named with the next number of a series of `tabSeries`, keyed by
+the doctype. The series is incremented and read with one atomic statement,
+on a connection of the process kept for naming and committed at once: the
+row of the series is only locked for that statement, not until the insert
+commits, so concurrent inserts (and bulk inserts naming a whole chunk before
+writing it) do not wait for each other. Numbers are never handed out twice,
+but the number of a rolled back insert is not reused, which leaves a gap.
+
+With `naming_block_size` set in the site config, a process reserves blocks
+of numbers at once and hands them out in order, so the series is only
+written once per block. The rest of a block is not used when the process
+stops.
+"""
+
+import os
+import threading
+
+import frappe
+from frappe.utils import cint
+
+# Numbers reserved at once by a process, `naming_block_size` in the site config
+DEFAULT_BLOCK_SIZE = 1
+
+# {(pid, site, series): [next number, last number]} of the blocks of this process
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+# the connection each thread takes numbers from, see run_on_naming_db
+_naming_db = threading.local()
+
+
+def get_block_size():
+    return max(cint(frappe.conf.get("naming_block_size")), DEFAULT_BLOCK_SIZE)
+
+
+def increment_series(series, count=1, db=None):
+    """
+    Adds `count` to a series, created at 0 if missing, and returns its new
+    value, with one atomic statement
+    """
+    db = db or frappe.db
+    if db.db_type == "postgres":
+        return cint(
+            db.sql(
+                """insert into `tabSeries` (`name`, `current`) values (%(series)s, %(count)s)
+                on conflict (`name`) do update set `current` = `tabSeries`.`current` + %(count)s
+                returning `current`""",
+                {"series": series, "count": count},
+            )[0][0]
+        )
+
+    # LAST_INSERT_ID(expr) keeps the value written by this connection
+    db.sql(
+        """insert into `tabSeries` (`name`, `current`)
+        values (%(series)s, last_insert_id(%(count)s))
+        on duplicate key update `current` = last_insert_id(`current` + %(count)s)""",
+        {"series": series, "count": count},
+    )
+    return cint(db.sql("select last_insert_id()")[0][0])
+
+
+def get_naming_db():
+    """
+    Returns a connection of its own to the site database
+    """
+    from frappe.database import get_db
+
+    conf = frappe.local.conf
+    return get_db(
+        socket=conf.db_socket,
+        host=conf.db_host,
+        port=conf.db_port,
+        user=conf.db_user or conf.db_name,
+        password=conf.db_password,
+        cur_db_name=conf.db_name,
+    )
+
+
+def run_on_naming_db(function):
+    """
+    Runs `function(db)` on the naming connection of the thread, committed at
+    once so that the series is not held by the transaction of the insert
+    """
+    key = (os.getpid(), frappe.local.site)
+    previous_key = getattr(_naming_db, "key", None)
+    if previous_key != key:
+        # the connection of a parent process is left to it
+        if previous_key and previous_key[0] == key[0]:
+            close_naming_db()
+        _naming_db.key, _naming_db.db = key, None
+
+    reused = bool(_naming_db.db)
+    try:
+        return run_committed(function)
+    except Exception:
+        close_naming_db()
+        if not reused:
+            raise
+    # the server may have dropped the idle connection, once more on a new one
+    try:
+        return run_committed(function)
+    except Exception:
+        close_naming_db()
+        raise
+
+
+def run_committed(function):
+    if not _naming_db.db:
+        _naming_db.db = get_naming_db()
+        _naming_db.db.connect()
+    result = function(_naming_db.db)
+    _naming_db.db.commit()
+    return result
+
+
+def close_naming_db():
+    db = getattr(_naming_db, "db", None)
+    _naming_db.db = None
+    if db:
+        try:
+            db.close()
+        except Exception:
+            pass
+
+
+def reserve_block(series, size):
+    """
+    Reserves the next `size` numbers of a series, returns [first, last]
+    """
+    last = run_on_naming_db(lambda db: increment_series(series, size, db))
+    return [last - size + 1, last]
+
+
+def get_next_number(series, block_size=None):
+    """
+    Returns the next number of a series
+    """
+    block_size = block_size or get_block_size()
+    if block_size <= 1:
+        return run_on_naming_db(lambda db: increment_series(series, 1, db))
+
+    # a forked process starts with the blocks of its parent, it reserves its own
+    key = (os.getpid(), frappe.local.site, series)
+    with _blocks_lock:
+        block = _blocks.get(key)
+        if not block or block[0] > block[1]:
+            block = _blocks[key] = reserve_block(series, block_size)
+        number = block[0]
+        block[0] += 1
+    return number
+
+
+def get_max_numeric_name(doctype):
+    if frappe.db.db_type == "postgres":
+        condition = "`name` ~ '^[0-9]{1,18}$'"
+        number_type = "bigint"
+    else:
+        condition = "`name` regexp '^[0-9]{1,18}$'"
+        number_type = "unsigned"
+    return cint(
+        frappe.db.sql(
+            f"select max(cast(`name` as {number_type})) from `tab{doctype}` where {condition}"
+        )[0][0]
+    )
+
+
+def sync_series(series, doctype):
+    """
+    Moves a series past the numeric names already taken, e.g. by imported records
+    """
+    max_name = get_max_numeric_name(doctype)
+
+    def update(db):
+        db.sql(
+            "update `tabSeries` set `current` = greatest(`current`, %s) where `name` = %s",
+            (max_name, series),
+        )
+
+    # numbers are taken on the naming connection, which would wait for this one
+    run_on_naming_db(update)
+    with _blocks_lock:
+        _blocks.pop((os.getpid(), frappe.local.site, series), None)
+
+
+def get_next_name(doctype):
+    """
+    Returns the next free numeric name of a doctype
+    """
+    number = get_next_number(doctype)
+    if frappe.db.exists(doctype, str(number)):
+        # the series is behind the records, this happens once after an import
+        sync_series(doctype, doctype)
+        number = get_next_number(doctype)
+    return str(number)
@@ -0,0 +1,129 @@
+"""
+This file includes the concurrency benchmark of the naming service.
+
+    bench --site <site> execute g_healthy.naming_benchmark.run \
+        --kwargs "{'doctype': 'Jobs', 'values': {'job_name': 'Benchmark'}, 'inserters': 8}"
+
+Every inserter is a thread with a connection of its own, inserting records of
+a doctype named "By script" (through `custom_naming`) in transactions of its
+own, held open for `hold` seconds before they commit. One insert out of
+`rollback_every` is rolled back instead. The names of the committed records
+are then checked: there must be no duplicates, and no more gaps than rolled
+back inserts (plus the unused ends of the blocks, with `naming_block_size`).
+The records are deleted afterwards unless `cleanup` is off.
+"""
+
+import threading
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+from g_healthy.naming import close_naming_db, get_block_size
+
+
+def insert_records(
+    site, sites_path, doctype, values, count, hold, rollback_every, results
+):
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+    frappe.set_user("Administrator")
+    try:
+        for idx in range(1, count + 1):
+            try:
+                name = (
+                    frappe.get_doc({**values, "doctype": doctype})
+                    .insert(ignore_permissions=True)
+                    .name
+                )
+                # the rest of the transaction of the insert
+                time.sleep(hold)
+                if rollback_every and idx % rollback_every == 0:
+                    frappe.db.rollback()
+                    results["rolled_back"].append(name)
+                else:
+                    frappe.db.commit()
+                    results["committed"].append(name)
+            except Exception as e:
+                frappe.db.rollback()
+                results["errors"].append(repr(e))
+    finally:
+        close_naming_db()
+        frappe.destroy()
+
+
+def run(
+    doctype,
+    values=None,
+    inserters=8,
+    records=100,
+    hold=0,
+    rollback_every=10,
+    cleanup=True,
+):
+    """
+    Runs `inserters` parallel inserters inserting `records` records each,
+    returns the numbers of duplicates, gaps and rolled back inserts
+    """
+    if frappe.get_meta(doctype).naming_rule != "By script":
+        frappe.throw(_("{0} is not named By script").format(doctype))
+
+    results = {"committed": [], "rolled_back": [], "errors": []}
+    threads = [
+        threading.Thread(
+            target=insert_records,
+            args=(
+                frappe.local.site,
+                frappe.local.sites_path,
+                doctype,
+                frappe.parse_json(values) or {},
+                records,
+                hold,
+                rollback_every,
+                results,
+            ),
+        )
+        for _idx in range(inserters)
+    ]
+
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    committed = results["committed"]
+    # the names the database holds, not the ones the inserters were given
+    stored = (
+        frappe.get_all(doctype, filters={"name": ("in", committed)}, pluck="name")
+        if committed
+        else []
+    )
+    numbers = {cint(name) for name in stored}
+    # a name given twice fails the second insert
+    duplicates = len(committed) - len(set(committed))
+    duplicates += sum("DuplicateEntryError" in error for error in results["errors"])
+    result = {
+        "doctype": doctype,
+        "inserters": inserters,
+        "block_size": get_block_size(),
+        "hold": hold,
+        "seconds": round(elapsed, 3),
+        "inserts_per_second": round(len(committed) / elapsed) if elapsed else None,
+        "committed": len(committed),
+        "stored": len(stored),
+        "rolled_back": len(results["rolled_back"]),
+        "duplicates": duplicates,
+        "gaps": (
+            len(set(range(min(numbers), max(numbers) + 1)) - numbers) if numbers else 0
+        ),
+        "errors": results["errors"],
+    }
+
+    if cleanup:
+        for name in stored:
+            frappe.delete_doc(doctype, name, force=True, ignore_permissions=True)
+        frappe.db.commit()
+    return result
@@ -1,9 +1,19 @@
 import frappe
 from frappe.core.doctype.doctype.doctype import DocType
 
+from g_healthy.apis.api import clear_schema_cache
+
 
 class CustomDoctype(DocType):
 
+    def on_update(self):
+        super().on_update()
+        clear_schema_cache()
+
+    def on_trash(self):
+        super().on_trash()
+        clear_schema_cache()
+
     def setup_fields_to_fetch(self):
         """Setup query to update values for newly set fetch values"""
         try:
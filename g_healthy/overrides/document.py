@@ -10,6 +10,8 @@ from frappe.desk.reportview import (
     execute,
 )
 
+from g_healthy.count import get_count
+
 DISALLOWED_PARAMS = (
     "cmd",
     "data",
@@ -67,8 +69,12 @@ def custom_get_count() -> int:
                 0
             ]
         else:
-            args.fields = [f"count({fieldname}) as total_count"]
-            count = execute(**args)[0].get("total_count")
+            count, _is_exact = get_count(
+                args.doctype,
+                filters=args.filters,
+                or_filters=args.or_filters,
+                distinct=args.distinct,
+            )
 
     return count
 
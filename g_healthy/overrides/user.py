@@ -4,11 +4,20 @@ from frappe.core.doctype.user.user import User
 from frappe.utils import now_datetime
 from frappe.utils.data import sha256_hash
 from frappe.utils.password import get_password_reset_limit
+from g_healthy.enrichment import clear_user_names
 from g_healthy.rate_limiter import rate_limit
 
 
 class CustomUser(User):
 
+    def on_update(self):
+        super().on_update()
+        clear_user_names()
+
+    def on_trash(self):
+        super().on_trash()
+        clear_user_names()
+
     def reset_password(self, send_email=False, password_expired=False):
         from frappe.utils import get_url
 
@@ -0,0 +1,336 @@
+"""
+This file includes the PDF renderer of the app.
+
+Each long-lived process (web worker, long running job) keeps a headless
+Chromium started once, with a pool of browser contexts reused across
+renders. Renders are coroutines submitted to the event loop of a dedicated
+thread, so several documents of a batch are rendered at once, one per
+context of the pool, each within a timeout.
+
+Chromium is opt-in, with `pdf_renderer` set to "chromium" in the site config.
+Otherwise, or when Playwright is not installed or the browser cannot be
+launched, PDFs are rendered by `frappe.utils.pdf.get_pdf` as before. The
+header and footer of a print format (the `#header-html` and `#footer-html`
+elements, or the `header-html` / `footer-html` options) are repeated on
+every page by Chromium as they are by wkhtmltopdf. A render gets the session
+cookie of the user, cleared before its browser context is used again, and
+the `pdfkit-*` meta tags of the HTML are read as pdfkit does.
+"""
+
+import asyncio
+import atexit
+import os
+import re
+import threading
+import time
+
+import frappe
+from bs4 import BeautifulSoup
+from frappe.utils import cint, get_url, scrub_urls
+from frappe.utils.pdf import get_pdf as get_wkhtmltopdf_pdf
+
+# Browser contexts kept warm by a process, i.e. documents rendered at once
+DEFAULT_POOL_SIZE = 2
+
+# Seconds a document may take to load and print
+DEFAULT_RENDER_TIMEOUT = 60
+
+# Seconds given to Chromium to start
+LAUNCH_TIMEOUT = 30
+
+# Seconds before retrying to launch a browser that failed to start
+RETRY_AFTER = 10 * 60
+
+DEFAULT_MARGIN = "15mm"
+
+# wkhtmltopdf options set by print formats, e.g. <meta name="pdfkit-page-size" content="A5">
+PDFKIT_META_PATTERN = re.compile(
+    r"""<meta\s+name=["']pdfkit-([\w-]+)["']\s+content=["']([^"']*)["']""",
+    re.IGNORECASE,
+)
+
+# wkhtmltopdf page counters of the footers, and the classes Chromium fills in
+PAGE_COUNTER_CLASSES = {"page": "pageNumber", "topage": "totalPages"}
+
+_renderer = None
+_renderer_pid = None
+_renderer_lock = threading.Lock()
+_unavailable_until = 0
+
+
+class PdfRenderer:
+    """
+    A headless Chromium with a pool of contexts, driven by an event loop
+    running in its own thread
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        self.pool_size = pool_size
+        self.loop = asyncio.new_event_loop()
+        self.connected = False
+        self.error = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="g_healthy-pdf-renderer", daemon=True
+        )
+        self.thread.start()
+
+        if not self.ready.wait(LAUNCH_TIMEOUT):
+            self.close()
+            raise TimeoutError("Chromium did not start in time")
+        if self.error:
+            raise self.error
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.launch())
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+            return
+
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def launch(self):
+        from playwright.async_api import async_playwright
+
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(args=["--no-sandbox"])
+        self.browser.on("disconnected", self.on_disconnected)
+        self.contexts = asyncio.Queue()
+        for _ in range(self.pool_size):
+            await self.contexts.put(await self.browser.new_context())
+        self.connected = True
+
+    def on_disconnected(self, browser):
+        self.connected = False
+
+    def is_alive(self):
+        return self.connected and self.thread.is_alive()
+
+    async def render(self, html, pdf_options, cookies, timeout):
+        # the timeout starts once a context of the pool is free
+        context = await self.contexts.get()
+        try:
+            # the session of the user, for the private files of the document
+            if cookies:
+                await context.add_cookies(cookies)
+            return await asyncio.wait_for(
+                self.render_page(context, html, pdf_options, timeout), timeout
+            )
+        finally:
+            # the context is used for other users next
+            await context.clear_cookies()
+            self.contexts.put_nowait(context)
+
+    async def render_page(self, context, html, pdf_options, timeout):
+        page = await context.new_page()
+        try:
+            await page.set_content(html, wait_until="load", timeout=timeout * 1000)
+            return await page.pdf(**pdf_options)
+        finally:
+            await page.close()
+
+    def render_many(self, documents, timeout):
+        """
+        Renders (html, print options, cookies) documents concurrently on the
+        pool, returns their PDFs in order
+        """
+        futures = [
+            asyncio.run_coroutine_threadsafe(
+                self.render(html, pdf_options, cookies, timeout), self.loop
+            )
+            for html, pdf_options, cookies in documents
+        ]
+        # every document may wait for the ones before it on a busy pool
+        guard = timeout * (len(futures) // self.pool_size + 2)
+        try:
+            return [future.result(guard) for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def close(self):
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop)
+
+    async def shutdown(self):
+        try:
+            if self.connected:
+                await self.browser.close()
+            await self.playwright.stop()
+        finally:
+            self.connected = False
+            self.loop.stop()
+
+
+def get_renderer():
+    """
+    Returns the renderer of the process, started on first use,
+    None when PDFs are rendered by wkhtmltopdf
+    """
+    global _renderer, _renderer_pid, _unavailable_until
+
+    if frappe.conf.get("pdf_renderer") != "chromium":
+        return None
+
+    with _renderer_lock:
+        # threads do not survive a fork, a forked process starts its own browser
+        if _renderer and _renderer_pid == os.getpid() and _renderer.is_alive():
+            return _renderer
+        if time.monotonic() < _unavailable_until:
+            return None
+
+        try:
+            _renderer = PdfRenderer(
+                cint(frappe.conf.get("pdf_renderer_pool_size")) or DEFAULT_POOL_SIZE
+            )
+            _renderer_pid = os.getpid()
+        except Exception:
+            _renderer = None
+            _unavailable_until = time.monotonic() + RETRY_AFTER
+            frappe.log_error("PDF Renderer Error")
+        return _renderer
+
+
+def close_renderer():
+    if _renderer and _renderer_pid == os.getpid():
+        _renderer.close()
+
+
+atexit.register(close_renderer)
+
+
+def get_length(value):
+    # wkhtmltopdf lengths are in mm unless they have a unit, Chromium's in px
+    value = str(value).strip()
+    return f"{value}mm" if re.fullmatch(r"[\d.]+", value) else value
+
+
+def get_pdf_options(options=None, html=None):
+    """
+    Returns the Chromium print options of the wkhtmltopdf `options` used by
+    frappe, and of the `pdfkit-*` meta tags of the HTML, which win as with pdfkit
+    """
+    options = dict(options or {})
+    if html and "pdfkit-" in html:
+        options.update(PDFKIT_META_PATTERN.findall(html))
+
+    pdf_options = {
+        "landscape": (options.get("orientation") or "").lower() == "landscape",
+        "print_background": True,
+        "margin": {
+            side: get_length(options.get(f"margin-{side}") or DEFAULT_MARGIN)
+            for side in ("top", "right", "bottom", "left")
+        },
+    }
+    if options.get("page-width") and options.get("page-height"):
+        pdf_options["width"] = get_length(options["page-width"])
+        pdf_options["height"] = get_length(options["page-height"])
+    else:
+        pdf_options["format"] = (
+            options.get("page-size")
+            or frappe.db.get_single_value("Print Settings", "pdf_page_size")
+            or "A4"
+        )
+    return pdf_options
+
+
+def read_header_footer_option(value):
+    """
+    Returns the HTML of a `header-html` / `footer-html` option, which is the
+    path of a file for wkhtmltopdf, or the HTML itself
+    """
+    if value and os.path.isfile(value):
+        with open(value, encoding="utf-8") as f:
+            return f.read()
+    return value
+
+
+def get_header_footer_template(content, styles):
+    """
+    Returns a Chromium header or footer template of some HTML. The template
+    does not get the styles of the page, they are copied into it.
+    """
+    soup = BeautifulSoup(content, "html.parser")
+    for css_class, chromium_class in PAGE_COUNTER_CLASSES.items():
+        for element in soup.find_all(class_=css_class):
+            element["class"] = chromium_class
+    body = soup.body or soup
+    return (
+        f"{styles}<div style='width: 100%; margin: 0 {DEFAULT_MARGIN};"
+        f" -webkit-print-color-adjust: exact;'>{body.decode_contents()}</div>"
+    )
+
+
+def get_session_cookies():
+    """
+    Returns the session cookie of the user for the site, which frappe also
+    gives wkhtmltopdf
+    """
+    sid = frappe.session and frappe.session.sid
+    if not sid or sid == "Guest":
+        return []
+    return [{"name": "sid", "value": sid, "url": get_url()}]
+
+
+def get_document(html, options=None, cookies=None):
+    """
+    Returns the HTML, Chromium print options and cookies of a document, its
+    header and footer taken out of the HTML as frappe does for wkhtmltopdf
+    """
+    options = options or {}
+    pdf_options = get_pdf_options(options, html)
+    parts = {
+        "header": read_header_footer_option(options.get("header-html")),
+        "footer": read_header_footer_option(options.get("footer-html")),
+    }
+    styles = ""
+    if 'id="header-html"' in html or 'id="footer-html"' in html:
+        soup = BeautifulSoup(html, "html.parser")
+        for part in parts:
+            element = soup.find(id=f"{part}-html")
+            if element:
+                parts[part] = parts[part] or element.decode_contents()
+                element.extract()
+        styles = "".join(str(style) for style in soup.find_all("style"))
+        html = str(soup)
+
+    if parts["header"] or parts["footer"]:
+        pdf_options["display_header_footer"] = True
+        for part, content in parts.items():
+            # an empty template hides the default date and title of Chromium
+            pdf_options[f"{part}_template"] = (
+                get_header_footer_template(content, styles)
+                if content
+                else "<span></span>"
+            )
+    return scrub_urls(html), pdf_options, cookies
+
+
+def get_pdf(html, options=None):
+    """
+    Renders HTML to PDF, same as `frappe.utils.pdf.get_pdf`
+    """
+    return get_pdfs([html], options)[0]
+
+
+def get_pdfs(htmls, options=None):
+    """
+    Renders a batch of HTML documents to PDF at once, returns the PDFs in order
+    """
+    renderer = get_renderer()
+    if renderer:
+        try:
+            cookies = get_session_cookies()
+            return renderer.render_many(
+                [get_document(html, options, cookies) for html in htmls],
+                cint(frappe.conf.get("pdf_render_timeout")) or DEFAULT_RENDER_TIMEOUT,
+            )
+        except Exception:
+            frappe.log_error("PDF Renderer Error")
+
+    return [get_wkhtmltopdf_pdf(html, dict(options or {})) for html in htmls]
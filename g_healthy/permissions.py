@@ -0,0 +1,148 @@
+"""
+This file includes the request scoped permission context of the app endpoints.
+
+The roles of a user are resolved once per request, and the effective permissions
+of a doctype (permlevel -> {read, write, create, delete, ..., if_owner}) are
+computed once per role set and kept in redis.
+"""
+
+import frappe
+from frappe.utils import cint
+
+from g_healthy.cache import get_cached, get_generation, make_cache_key, make_hash
+
+PERMISSIONS_CACHE_TTL = 24 * 60 * 60
+
+PERMISSION_TYPES = (
+    "select",
+    "read",
+    "write",
+    "create",
+    "delete",
+    "submit",
+    "cancel",
+    "amend",
+    "report",
+    "export",
+    "import",
+    "print",
+    "email",
+    "share",
+)
+
+# permissions of permlevel 0 as sent to the dashboard
+ADMIN_PERMISSIONS = {
+    "read": 1,
+    "create": 1,
+    "delete": 1,
+    "update": 1,
+    "only_owner": 0,
+}
+
+
+class PermissionContext:
+    """
+    Roles and effective permissions of a user, shared by everything that runs
+    in the same request
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.roles = frappe.get_roles(user)
+        self.role_set = set(self.roles)
+        self.is_admin = "Administrator" in self.role_set
+        self.roles_hash = make_hash(sorted(self.roles))
+        self._matrices = {}
+
+    def get_matrix(self, doctype):
+        """
+        Returns the effective permissions of the user on a doctype by permlevel
+        """
+        if doctype not in self._matrices:
+            self._matrices[doctype] = get_permission_matrix(
+                doctype, self.roles, self.roles_hash
+            )
+        return self._matrices[doctype]
+
+    def get_dashboard_permissions(self, doctype):
+        """
+        Returns the permlevel 0 permissions of a doctype in the shape used by the
+        dashboard, None when none of the user's roles has any
+        """
+        level = self.get_matrix(doctype).get(0)
+        if not level:
+            return None
+        if self.is_admin:
+            return dict(ADMIN_PERMISSIONS)
+        return {
+            "read": level["read"],
+            "create": level["create"],
+            "delete": level["delete"],
+            "update": level["write"],
+            "only_owner": level["if_owner"],
+        }
+
+
+def get_permission_context(user=None):
+    """
+    Returns the permission context of a user (defaults to session user) for
+    the current request
+    """
+    user = user or frappe.session.user
+    contexts = getattr(frappe.local, "g_healthy_permission_contexts", None)
+    if contexts is None:
+        contexts = frappe.local.g_healthy_permission_contexts = {}
+    if user not in contexts:
+        contexts[user] = PermissionContext(user)
+    return contexts[user]
+
+
+def get_permission_matrix(doctype, roles, roles_hash=None):
+    """
+    Returns {permlevel: {ptype: 0 | 1, "if_owner": 0 | 1}} of a doctype for a
+    role set, an empty dict for unknown doctypes
+    """
+    try:
+        meta = frappe.get_meta(doctype)
+    except frappe.DoesNotExistError:
+        frappe.clear_messages()
+        return {}
+
+    key = make_cache_key(
+        "permissions",
+        get_generation("schema"),
+        doctype,
+        make_hash(str(meta.modified), roles_hash or make_hash(sorted(roles))),
+    )
+    return get_cached(
+        key,
+        lambda: build_permission_matrix(meta.permissions, roles),
+        expires_in_sec=PERMISSIONS_CACHE_TTL,
+    )
+
+
+def build_permission_matrix(permissions, roles):
+    """
+    Merges the permission rules of the given roles: a permission type is granted
+    when any role grants it, while `if_owner` only holds when every role giving
+    access to the permlevel restricts it to owned documents
+    """
+    roles = set(roles)
+    matrix = {}
+    for permission in permissions:
+        if permission.role not in roles:
+            continue
+        level = matrix.setdefault(
+            cint(permission.permlevel),
+            {**{ptype: 0 for ptype in PERMISSION_TYPES}, "if_owner": None},
+        )
+        for ptype in PERMISSION_TYPES:
+            level[ptype] = level[ptype] or cint(permission.get(ptype))
+        if_owner = cint(permission.if_owner)
+        level["if_owner"] = (
+            if_owner if level["if_owner"] is None else level["if_owner"] and if_owner
+        )
+
+    for level in matrix.values():
+        level["if_owner"] = level["if_owner"] or 0
+    return matrix
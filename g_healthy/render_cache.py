@@ -0,0 +1,155 @@
+"""
+This file includes the render cache of the print formats.
+
+A render is addressed by a hash of everything it is made of: the document
+and its `modified`, the print format, letter head and print settings with
+their `modified`, the role set and language of the user and the render
+options. The HTML is kept in redis and the PDF as a file in the private
+folder of the site, the least recently used PDFs being removed once their
+total size goes over the budget.
+
+The cache does not check permissions, callers do before reading it.
+"""
+
+import os
+import time
+
+import frappe
+from frappe.utils import cint
+
+from g_healthy.cache import (
+    get_generation,
+    get_roles_hash,
+    make_cache_key,
+    make_hash,
+)
+
+RENDER_HTML_TTL = 7 * 24 * 60 * 60
+
+# Total size of the cached PDFs, in bytes
+DEFAULT_PDF_CACHE_SIZE = 512 * 1024 * 1024
+
+PDF_CACHE_FOLDER = "render_cache"
+
+
+def get_modified(doctype, name):
+    return name and str(frappe.db.get_value(doctype, name, "modified") or "")
+
+
+def get_render_hash(
+    doctype, name, modified, print_format=None, letterhead=None, *parts
+):
+    """
+    Returns the content address of a render of a document
+    """
+    return make_hash(
+        doctype,
+        name,
+        str(modified),
+        print_format,
+        get_modified("Print Format", print_format),
+        letterhead,
+        get_modified("Letter Head", letterhead),
+        str(frappe.get_cached_doc("Print Settings").modified),
+        get_generation("schema"),
+        get_roles_hash(),
+        frappe.local.lang,
+        *parts,
+    )
+
+
+def get_default_letterhead():
+    return frappe.db.get_value("Letter Head", {"is_default": 1}, "name")
+
+
+def get_cached_html(render_hash, builder):
+    """
+    Returns the HTML (or any picklable value) of a render, built on a miss
+    """
+    key = make_cache_key("render", "html", render_hash)
+    value = frappe.cache.get_value(key)
+    if value is None:
+        value = builder()
+        frappe.cache.set_value(key, value, expires_in_sec=RENDER_HTML_TTL)
+    return value
+
+
+def get_pdf_path(render_hash):
+    folder = frappe.get_site_path("private", PDF_CACHE_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{render_hash}.pdf")
+
+
+def get_index_key():
+    return frappe.cache.make_key(make_cache_key("render", "pdf", "index"))
+
+
+def get_sizes_key():
+    return frappe.cache.make_key(make_cache_key("render", "pdf", "sizes"))
+
+
+def get_cached_pdf(render_hash, builder):
+    """
+    Returns the PDF of a render, built on a miss
+    """
+    path = get_pdf_path(render_hash)
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+    except FileNotFoundError:
+        content = None
+
+    if content:
+        frappe.cache.zadd(get_index_key(), {render_hash: time.time()})
+        return content
+
+    content = builder()
+    admit_pdf(render_hash, path, content)
+    return content
+
+
+def admit_pdf(render_hash, path, content):
+    temp_path = f"{path}.{frappe.generate_hash(length=8)}"
+    with open(temp_path, "wb") as f:
+        f.write(content)
+    # readers never see a partially written file
+    os.replace(temp_path, path)
+
+    index_key, sizes_key = get_index_key(), get_sizes_key()
+    pipeline = frappe.cache.pipeline()
+    pipeline.zadd(index_key, {render_hash: time.time()})
+    pipeline.zadd(sizes_key, {render_hash: len(content)})
+    pipeline.execute()
+    evict_pdfs()
+
+
+def evict_pdfs():
+    """
+    Removes the least recently used PDFs until their total size fits the budget
+    """
+    budget = cint(frappe.conf.get("render_cache_size")) or DEFAULT_PDF_CACHE_SIZE
+    index_key, sizes_key = get_index_key(), get_sizes_key()
+
+    sizes = {
+        frappe.safe_decode(render_hash): int(size)
+        for render_hash, size in frappe.cache.zrange(sizes_key, 0, -1, withscores=True)
+    }
+    total = sum(sizes.values())
+    if total <= budget:
+        return
+
+    evicted = []
+    for render_hash in frappe.cache.zrange(index_key, 0, -1):
+        if total <= budget:
+            break
+        render_hash = frappe.safe_decode(render_hash)
+        total -= sizes.get(render_hash, 0)
+        evicted.append(render_hash)
+        try:
+            os.remove(get_pdf_path(render_hash))
+        except FileNotFoundError:
+            pass
+
+    if evicted:
+        frappe.cache.zrem(index_key, *evicted)
+        frappe.cache.zrem(sizes_key, *evicted)
@@ -0,0 +1,121 @@
+"""
+This file includes the result cache of the query and script reports.
+
+A result is keyed by the report, its filters and custom columns and the
+permission fingerprint of the user, under a generation of the `ref_doctype`
+of the report bumped on every write of that doctype. Only reports slower than
+`REPORT_CACHE_MIN_EXECUTION_TIME` are admitted, and the number of cached
+results is bounded by evicting the least recently used ones.
+"""
+
+import json
+import time
+
+import frappe
+from frappe.permissions import get_user_permissions
+from frappe.utils import cint
+
+from g_healthy.cache import (
+    bump_generation,
+    get_generation,
+    get_permission_fingerprint,
+    make_cache_key,
+    make_hash,
+)
+
+REPORT_CACHE_TTL = 10 * 60
+
+# Bumped when the shape of the cached results changes
+REPORT_CACHE_VERSION = 2
+
+# Reports running faster than this (in seconds) are not cached
+REPORT_CACHE_MIN_EXECUTION_TIME = 0.5
+
+# Number of results kept, the least recently used ones are evicted first
+REPORT_CACHE_MAX_ENTRIES = 200
+
+# Results with more rows are not cached
+REPORT_CACHE_MAX_ROWS = 20000
+
+
+def get_report_cache_key(
+    report, filters, user, custom_columns=None, is_tree=False, parent_field=None
+):
+    if filters and isinstance(filters, str):
+        filters = json.loads(filters)
+
+    return make_cache_key(
+        "report_result",
+        REPORT_CACHE_VERSION,
+        report.ref_doctype,
+        get_generation(f"report:{report.ref_doctype}"),
+        make_hash(
+            report.name,
+            str(report.modified),
+            report.get("custom_report"),
+            report.custom_columns,
+            filters or {},
+            custom_columns or [],
+            cint(is_tree),
+            parent_field,
+            get_permission_fingerprint(report.ref_doctype, user),
+            # shared documents pass the user permission filter of get_filtered_data
+            user if get_user_permissions(user) else None,
+        ),
+    )
+
+
+def get_index_key():
+    return frappe.cache.make_key(make_cache_key("report_result", "index"))
+
+
+def get_cached_report_result(key, builder):
+    """
+    Returns the cached result of a report, running `builder` on a miss and
+    caching its result when the report is slow enough
+    """
+    result = frappe.cache.get_value(key)
+    if result is not None:
+        frappe.cache.zadd(get_index_key(), {key: time.time()})
+        return result
+
+    start = time.monotonic()
+    result = builder()
+    execution_time = time.monotonic() - start
+
+    if (
+        execution_time >= REPORT_CACHE_MIN_EXECUTION_TIME
+        and len(result.get("result") or []) <= REPORT_CACHE_MAX_ROWS
+    ):
+        admit_report_result(key, result)
+
+    return result
+
+
+def admit_report_result(key, result):
+    now = time.time()
+    index_key = get_index_key()
+    frappe.cache.set_value(key, result, expires_in_sec=REPORT_CACHE_TTL)
+
+    pipeline = frappe.cache.pipeline()
+    pipeline.zadd(index_key, {key: now})
+    # results not read within the TTL are already gone
+    pipeline.zremrangebyscore(index_key, "-inf", now - REPORT_CACHE_TTL)
+    pipeline.zcard(index_key)
+    size = pipeline.execute()[-1]
+
+    overflow = size - REPORT_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        evicted = [
+            frappe.safe_decode(member)
+            for member in frappe.cache.zrange(index_key, 0, overflow - 1)
+        ]
+        frappe.cache.delete_value(evicted)
+        frappe.cache.zrem(index_key, *evicted)
+
+
+def clear_report_cache(doc, method=None):
+    """
+    Invalidates the cached results of the reports on a doctype, runs on write of every doctype
+    """
+    bump_generation(f"report:{doc.doctype}")
@@ -0,0 +1,236 @@
+"""
+This file includes the constant memory writers of the report exports.
+
+Rows are consumed one at a time from an iterator and written to a temporary
+file (CSV through the csv module, XLSX through a write-only openpyxl workbook),
+which is then streamed to the client in chunks. Query results can be spooled
+to disk in pickled chunks so that the database cursor is released before the
+rows are processed.
+"""
+
+import contextlib
+import csv
+import datetime
+import io
+import os
+import pickle
+import re
+import tempfile
+
+import frappe
+from frappe import _
+from frappe.utils import cint, cstr, format_duration
+from frappe.utils.xlsxutils import handle_html
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+# Number of rows read from the database, filtered and written at once
+EXPORT_CHUNK_SIZE = 5000
+
+# Size of the chunks the export file is sent in
+FILE_BUFFER_SIZE = 64 * 1024
+
+EXCEL_TYPES = (
+    str,
+    bool,
+    type(None),
+    int,
+    float,
+    datetime.datetime,
+    datetime.date,
+    datetime.time,
+    datetime.timedelta,
+)
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+
+
+def iter_chunks(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def spool_rows(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Writes the rows of an iterator to a temporary file in pickled chunks,
+    returns the file rewound
+    """
+    spool = tempfile.TemporaryFile()
+    for chunk in iter_chunks(rows, chunk_size):
+        pickle.dump(
+            [list(row) for row in chunk], spool, protocol=pickle.HIGHEST_PROTOCOL
+        )
+    spool.seek(0)
+    return spool
+
+
+def iter_spooled_chunks(spool):
+    """
+    Yields the chunks written by `spool_rows`, closes (and removes) the file once read
+    """
+    with spool:
+        while True:
+            try:
+                yield pickle.load(spool)
+            except EOFError:
+                return
+
+
+def unbuffered_cursor():
+    """
+    Returns a context in which `frappe.db.sql(..., as_iterator=True)` does not
+    load the whole result set in memory, where the database supports it
+    """
+    if frappe.db.db_type == "mariadb":
+        return frappe.db.unbuffered_cursor()
+    return contextlib.nullcontext()
+
+
+def get_header_rows(columns, filters=None, include_filters=False):
+    """
+    Returns the leading rows of an export (applied filters and column labels)
+    and the column widths in the scale of openpyxl
+    """
+    rows = []
+    if cint(include_filters) and filters:
+        for filter_name, filter_value in filters.items():
+            if not filter_value:
+                continue
+            filter_value = (
+                ", ".join([cstr(x) for x in filter_value])
+                if isinstance(filter_value, list)
+                else cstr(filter_value)
+            )
+            rows.append([cstr(filter_name), filter_value])
+        rows.append([])
+
+    column_data = []
+    column_widths = []
+    for column in columns:
+        if column.get("hidden"):
+            continue
+        column_data.append(_(column.get("label")))
+        # to convert into a scale accepted by openpyxl
+        column_widths.append(cint(column.get("width", 0)) / 10)
+    rows.append(column_data)
+
+    return rows, column_widths
+
+
+def iter_export_rows(columns, rows, visible_idx=None, include_indentation=False):
+    """
+    Yields the cells of the visible columns of every row, indented for trees
+    when asked. Duration fields are formatted on the way.
+    """
+    visible_idx = set(visible_idx or [])
+    include_indentation = cint(include_indentation)
+    duration_columns = {
+        idx
+        for idx, column in enumerate(columns)
+        if column.get("fieldtype") == "Duration"
+    }
+    visible_columns = [
+        (idx, column.get("fieldname"), column.get("label"))
+        for idx, column in enumerate(columns)
+        if not column.get("hidden")
+    ]
+
+    for row_idx, row in enumerate(rows):
+        # only pick up rows that are visible in the report
+        if visible_idx and row_idx not in visible_idx:
+            continue
+
+        if isinstance(row, dict):
+            row_data = []
+            for col_idx, fieldname, label in visible_columns:
+                cell_value = row.get(fieldname, row.get(label, ""))
+                if cell_value and col_idx in duration_columns:
+                    cell_value = format_duration(cell_value)
+                if not isinstance(cell_value, EXCEL_TYPES):
+                    cell_value = cstr(cell_value)
+
+                if include_indentation and "indent" in row and col_idx == 0:
+                    cell_value = ("    " * cint(row["indent"])) + cstr(cell_value)
+                row_data.append(cell_value)
+        elif row:
+            row_data = list(row)
+            for col_idx in duration_columns:
+                if col_idx < len(row_data) and row_data[col_idx]:
+                    row_data[col_idx] = format_duration(row_data[col_idx])
+        else:
+            row_data = []
+
+        yield row_data
+
+
+def write_csv(file, rows, csv_params=None):
+    """
+    Writes rows to a binary file as UTF-8 CSV, one row at a time
+    """
+    text_file = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    writer = csv.writer(text_file, **(csv_params or {}))
+    for row in rows:
+        writer.writerow(row)
+    text_file.flush()
+    # keep the underlying file open
+    text_file.detach()
+
+
+def write_xlsx(file, rows, sheet_name, column_widths=None):
+    """
+    Writes rows to a binary file as XLSX with a write-only workbook, the
+    first row being the header. Cells are cleaned the same way as `make_xlsx`.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name, 0)
+    for i, column_width in enumerate(column_widths or []):
+        if column_width:
+            ws.column_dimensions[get_column_letter(i + 1)].width = column_width
+
+    row1 = ws.row_dimensions[1]
+    row1.font = Font(name="Calibri", bold=True)
+
+    for row in rows:
+        clean_row = []
+        for item in row:
+            value = item
+            if isinstance(item, str):
+                value = handle_html(item)
+                if next(ILLEGAL_CHARACTERS_RE.finditer(value), None):
+                    value = re.sub(ILLEGAL_CHARACTERS_RE, "", value)
+            clean_row.append(value)
+        ws.append(clean_row)
+
+    wb.save(file)
+
+
+def make_file_response(file, filename, file_extension):
+    """
+    Returns a response sending a file in chunks, the file is closed once sent
+    """
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+
+    response = Response(
+        wrap_file(frappe.local.request.environ, file, buffer_size=FILE_BUFFER_SIZE),
+        mimetype=CONTENT_TYPES.get(file_extension, "application/octet-stream"),
+        direct_passthrough=True,
+    )
+    response.headers["Content-Length"] = str(size)
+    response.headers.add("Content-Disposition", "attachment", filename=filename)
+    return response
@@ -0,0 +1,160 @@
+"""
+This file includes the HTML renderer of the reports, used for their PDFs.
+
+A report with an `.html` template in its folder is rendered through Jinja,
+the template being compiled once per process and recompiled only when the
+file changes. Other reports are rendered as a plain table, written as a
+sequence of fragments joined once so that the time taken grows linearly with
+the number of rows.
+"""
+
+import os
+import threading
+
+import frappe
+from frappe.utils import cint, cstr, escape_html
+from frappe.utils.jinja import get_jenv
+
+REPORT_LETTER_HEAD = "Associated Terminals"
+
+REPORT_STYLE = """
+    body {
+        font-family: "Roboto", sans-serif;
+        margin: 20px;
+    }
+    h1 {
+        text-align: center;
+    }
+    .filters {
+        margin-bottom: 20px;
+    }
+    table {
+        width: 100%;
+        border-collapse: collapse;
+    }
+    th, td {
+        border: 1px solid #ddd;
+        padding: 8px;
+        text-align: left;
+    }
+    th {
+        background-color: #f2f2f2;
+    }
+    .job-link {
+        color: blue;
+        text-decoration: underline;
+    }
+    .letter-head {
+        margin-bottom: 20px;
+    }
+"""
+
+# {template path: (mtime of the file, compiled code)}
+_compiled_templates = {}
+_compiled_templates_lock = threading.Lock()
+
+
+def get_report_template_path(report):
+    """
+    Returns the path of the `.html` template of a standard report, if any
+    """
+    module = report.module or frappe.get_cached_value(
+        "DocType", report.ref_doctype, "module"
+    )
+    if frappe.get_cached_value("Module Def", module, "custom"):
+        return None
+
+    report_folder = os.path.join(
+        frappe.get_module_path(module), "report", frappe.scrub(report.name)
+    )
+    return os.path.join(report_folder, frappe.scrub(report.name) + ".html")
+
+
+def get_report_template(path):
+    """
+    Returns the Jinja template of a file, None when there is no such file
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+    jenv = get_jenv()
+    cached = _compiled_templates.get(path)
+    if cached and cached[0] == mtime:
+        code = cached[1]
+    else:
+        with open(path, encoding="utf-8") as f:
+            code = jenv.compile(f.read(), filename=path)
+        with _compiled_templates_lock:
+            _compiled_templates[path] = (mtime, code)
+
+    # the environment (filters, globals) is set up per request, the code is not
+    return jenv.template_class.from_code(jenv, code, jenv.make_globals(None))
+
+
+def get_letter_head_content():
+    return frappe.get_cached_value("Letter Head", REPORT_LETTER_HEAD, "content") or ""
+
+
+def escape(value):
+    return escape_html(cstr(value))
+
+
+def iter_report_html(title, filters, columns, rows):
+    """
+    Yields the fragments of the HTML table of a report, every value escaped
+    """
+    yield f"<html><head><style>{REPORT_STYLE}</style></head><body>"
+    yield f"<h1>{escape(title)}</h1>"
+
+    if filters:
+        yield "<div class='filters'>"
+        for filter_name, filter_value in filters.items():
+            yield (
+                f"<p><strong>{escape(filter_name.replace('_', ' ').title())}:</strong> "
+                f"{escape(filter_value)}</p>"
+            )
+        yield "</div>"
+
+    yield "<table><tr>"
+    for col in columns:
+        width = cint(col.get("width", 100))
+        yield f"<th style='width: {width}px;'>{escape(col['label'])}</th>"
+    yield "</tr>"
+
+    fieldnames = [col["fieldname"] for col in columns]
+    for row in rows:
+        if isinstance(row, dict):
+            values = (row.get(fieldname) for fieldname in fieldnames)
+        else:
+            # list rows (e.g. the total row) follow the order of the columns
+            values = (
+                row[idx] if idx < len(row) else None for idx in range(len(fieldnames))
+            )
+        yield "<tr>{}</tr>".format(
+            "".join(f"<td>{escape(value)}</td>" for value in values)
+        )
+
+    yield "</table></body></html>"
+
+
+def render_report_html(report_name, filters, columns, rows):
+    """
+    Returns the printable HTML of the result of a report
+    """
+    report = frappe.get_cached_doc("Report", report_name)
+    template_path = get_report_template_path(report)
+    template = template_path and get_report_template(template_path)
+
+    if template:
+        return template.render(
+            {
+                "data": rows,
+                "columns": columns,
+                "filters": filters,
+                "letter_head": get_letter_head_content(),
+            }
+        )
+
+    return "".join(iter_report_html(report_name, filters, columns, rows))
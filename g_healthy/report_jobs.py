@@ -0,0 +1,211 @@
+"""
+This file includes the background export jobs of the reports.
+
+An export request is turned into a job on the `long` queue whose id is a hash
+of (kind, params, user): identical requests made while a job is queued or
+running get the status of that job instead of starting another one. The
+status record lives in redis and is checked against the state of the job in
+RQ, so that the export of a killed worker can be started again. The result
+is kept as a private File of the user and a Notification Log tells the user
+when it is ready.
+"""
+
+import os
+import shutil
+
+import frappe
+from frappe import _
+from frappe.utils import now_datetime
+from frappe.utils.background_jobs import is_job_enqueued
+from werkzeug.utils import secure_filename
+
+from g_healthy.cache import make_cache_key, make_hash
+from g_healthy.report_export import EXPORT_CHUNK_SIZE
+
+EXPORT_JOB_TIMEOUT = 60 * 60
+EXPORT_STATUS_TTL = 24 * 60 * 60
+
+# Form params which do not change the result of an export
+IGNORED_PARAMS = ("cmd", "run_in_background")
+
+IN_PROGRESS = ("Queued", "Running")
+
+
+def get_export_job_id(kind, params, user=None):
+    return "g_healthy_report_export::{}".format(
+        make_hash(kind, params, user or frappe.session.user)
+    )
+
+
+def get_status_key(job_id):
+    return make_cache_key("report_export", job_id)
+
+
+def get_export_status(job_id):
+    return frappe.cache.get_value(get_status_key(job_id))
+
+
+def set_export_status(job_id, **values):
+    """
+    Updates the status record of an export job, returns the record
+    """
+    status = get_export_status(job_id) or {"job_id": job_id}
+    status.update(values, modified=str(now_datetime()))
+    frappe.cache.set_value(
+        get_status_key(job_id), status, expires_in_sec=EXPORT_STATUS_TTL
+    )
+    return status
+
+
+def check_job_state(job_id, status):
+    """
+    Marks an export as failed when its job is no longer queued or running,
+    e.g. after its worker was killed, returns the status record
+    """
+    if status and status.get("status") in IN_PROGRESS and not is_job_enqueued(job_id):
+        status = set_export_status(
+            job_id, status="Failed", error=_("The export job stopped unexpectedly")
+        )
+    return status
+
+
+def enqueue_export(method, kind, report_name, params):
+    """
+    Enqueues an export job unless an identical one is already queued or running,
+    returns the status record of the job
+    """
+    params = {key: value for key, value in params.items() if key not in IGNORED_PARAMS}
+    user = frappe.session.user
+    job_id = get_export_job_id(kind, params, user)
+
+    status = check_job_state(job_id, get_export_status(job_id))
+    if status and status.get("status") in IN_PROGRESS:
+        return status
+
+    status = set_export_status(
+        job_id,
+        status="Queued",
+        kind=kind,
+        report_name=report_name,
+        user=user,
+        rows=0,
+        file_url=None,
+        file_name=None,
+        error=None,
+        creation=str(now_datetime()),
+    )
+    frappe.enqueue(
+        method,
+        queue="long",
+        timeout=EXPORT_JOB_TIMEOUT,
+        job_id=job_id,
+        deduplicate=True,
+        export_job_id=job_id,
+        kind=kind,
+        report_name=report_name,
+        params=params,
+    )
+    return status
+
+
+def get_user_export_status(job_id):
+    """
+    Returns the status record of an export job of the session user
+    """
+    status = check_job_state(job_id, get_export_status(job_id))
+    if not status:
+        frappe.throw(_("Export {0} not found").format(job_id), frappe.DoesNotExistError)
+    if (
+        status.get("user") != frappe.session.user
+        and frappe.session.user != "Administrator"
+    ):
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+    return status
+
+
+def track_progress(job_id, rows, every=EXPORT_CHUNK_SIZE):
+    """
+    Yields the rows of an iterator, recording the number of rows read so far
+    """
+    count = 0
+    for count, row in enumerate(rows, 1):
+        if count % every == 0:
+            set_export_status(job_id, rows=count)
+        yield row
+    set_export_status(job_id, rows=count)
+
+
+def get_export_file_name(report_name, file_extension):
+    return secure_filename(
+        f"Report-{report_name}-{frappe.generate_hash(length=8)}.{file_extension}"
+    )
+
+
+def save_export_file(file, file_name):
+    """
+    Copies a temporary file to the private files of the site and returns
+    its File record, owned by the session user
+    """
+    path = frappe.get_site_path("private", "files", file_name)
+    file.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(file, f)
+
+    return frappe.get_doc(
+        {
+            "doctype": "File",
+            "file_name": file_name,
+            "file_url": f"/private/files/{file_name}",
+            "file_size": os.path.getsize(path),
+            "is_private": 1,
+        }
+    ).insert(ignore_permissions=True)
+
+
+def save_export_content(content, file_name):
+    """
+    Saves the content of an export as a private File of the session user
+    """
+    return frappe.get_doc(
+        {
+            "doctype": "File",
+            "file_name": file_name,
+            "content": content,
+            "is_private": 1,
+        }
+    ).insert(ignore_permissions=True)
+
+
+def notify_export(job_id, subject, file_doc=None):
+    status = get_export_status(job_id) or {}
+    doc = frappe.new_doc("Notification Log")
+    doc.for_user = status.get("user") or frappe.session.user
+    doc.type = "Alert"
+    doc.subject = subject
+    if file_doc:
+        doc.document_type = "File"
+        doc.document_name = file_doc.name
+    doc.insert(ignore_permissions=True)
+
+
+def complete_export(job_id, file_doc=None, subject=None):
+    set_export_status(
+        job_id,
+        status="Completed",
+        file_url=file_doc and file_doc.file_url,
+        file_name=file_doc and file_doc.name,
+    )
+    notify_export(job_id, subject, file_doc)
+    frappe.db.commit()
+
+
+def fail_export(job_id, report_name):
+    frappe.db.rollback()
+    frappe.log_error("Report Export Error")
+    set_export_status(
+        job_id,
+        status="Failed",
+        error=frappe.get_traceback().strip().splitlines()[-1],
+    )
+    notify_export(job_id, _("Export of report {0} failed").format(report_name))
+    frappe.db.commit()
@@ -0,0 +1,174 @@
+"""
+This file includes the columnar representation of report results.
+
+The stages of a report run (custom columns, permission filtering, total row)
+work on one list of values per column instead of one dict per row. Rows are
+only built when the result leaves the app, e.g. as the JSON of `custom_run`.
+"""
+
+
+class _Missing:
+    """
+    Value of a key absent from a dict row, kept apart from None so that rows
+    are rebuilt with the keys they had
+    """
+
+    def __repr__(self):
+        return "MISSING"
+
+    def __reduce__(self):
+        # unpickles to the module singleton, results are cached in redis
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class ReportResult:
+    """
+    Rows of a report stored by column.
+
+    `keys` are the fieldnames of dict rows, or the indexes of list rows when
+    `is_dict` is False, and `data` maps every key to its values, MISSING where
+    a row has no such key. `total_row` is kept as a list, as in the row form.
+    """
+
+    def __init__(self, keys=None, data=None, length=0, is_dict=True, total_row=None):
+        self.keys = list(keys or [])
+        self.data = data or {}
+        self.length = length
+        self.is_dict = is_dict
+        self.total_row = total_row
+
+    @classmethod
+    def from_rows(cls, rows, columns=None):
+        """
+        Returns the columnar form of a list of rows. List rows are keyed by
+        the fieldnames of `columns` when given, by their indexes otherwise.
+        """
+        rows = rows or []
+        if rows and isinstance(rows[0], list | tuple):
+            if columns is not None:
+                # the last column wins when fieldnames repeat, as in a dict
+                indexes = {
+                    column["fieldname"]: idx for idx, column in enumerate(columns)
+                }
+                return cls(
+                    indexes,
+                    {key: get_list_column(rows, idx) for key, idx in indexes.items()},
+                    len(rows),
+                )
+
+            width = max(len(row) for row in rows if isinstance(row, list | tuple))
+            return cls(
+                range(width),
+                {idx: get_list_column(rows, idx) for idx in range(width)},
+                len(rows),
+                is_dict=False,
+            )
+
+        keys = {}
+        for row in rows:
+            if isinstance(row, dict):
+                for key in row:
+                    keys.setdefault(key)
+        return cls(
+            keys,
+            {
+                key: [
+                    row.get(key, MISSING) if isinstance(row, dict) else MISSING
+                    for row in rows
+                ]
+                for key in keys
+            },
+            len(rows),
+        )
+
+    def __len__(self):
+        return self.length
+
+    def values(self, key):
+        """
+        Returns the values of a column, None where a row has no value
+        """
+        if key not in self.data:
+            return [None] * self.length
+        return [None if value is MISSING else value for value in self.data[key]]
+
+    def column(self, key):
+        """
+        Returns the list holding the values of a column, added if missing
+        """
+        if key not in self.data:
+            self.keys.append(key)
+            self.data[key] = [MISSING] * self.length
+        return self.data[key]
+
+    def row_lengths(self):
+        """
+        Returns the number of values of every row, i.e. `len(row)` of the row form
+        """
+        lengths = [0] * self.length
+        for values in self.data.values():
+            for idx, value in enumerate(values):
+                if value is not MISSING:
+                    lengths[idx] += 1
+        return lengths
+
+    def take(self, indexes):
+        """
+        Returns a result made of the rows at the given indexes
+        """
+        indexes = list(indexes)
+        return ReportResult(
+            self.keys,
+            {
+                key: [values[idx] for idx in indexes]
+                for key, values in self.data.items()
+            },
+            len(indexes),
+            is_dict=self.is_dict,
+        )
+
+    def iter_rows(self):
+        """
+        Yields the rows as dicts (or lists), then the total row if any
+        """
+        columns = [(key, self.data[key]) for key in self.keys]
+        for idx in range(self.length):
+            if self.is_dict:
+                yield {
+                    key: values[idx]
+                    for key, values in columns
+                    if values[idx] is not MISSING
+                }
+            else:
+                yield [
+                    values[idx]
+                    for _key, values in columns
+                    if values[idx] is not MISSING
+                ]
+
+        if self.total_row is not None:
+            yield self.total_row
+
+    def to_rows(self):
+        return list(self.iter_rows())
+
+    def to_columns(self):
+        """
+        Returns the JSON serialisable columnar form:
+        {"keys": [...], "values": [[...] per key], "total_row": [...] | None}
+        """
+        return {
+            "keys": self.keys,
+            "values": [self.values(key) for key in self.keys],
+            "total_row": self.total_row,
+        }
+
+
+def get_list_column(rows, idx):
+    return [
+        row[idx] if isinstance(row, list | tuple) and idx < len(row) else MISSING
+        for row in rows
+    ]
@@ -0,0 +1,328 @@
+"""
+This file includes the search index used by the `global` filter of list views.
+
+Every doctype that has List View Settings gets one row per record in the
+`__g_healthy_search` table, holding the text of its list view fields.
+The table has a FULLTEXT index on MariaDB and a trigram index on Postgres,
+and is kept up to date by doc_events. A search is applied to the list query
+itself, as a subquery on the table, so that it narrows down the whole list
+and its count however many records match.
+"""
+
+import json
+import re
+
+import frappe
+from frappe.model.db_query import DatabaseQuery
+from frappe.utils import cstr
+
+from g_healthy.cache import (
+    bump_generation,
+    get_cached,
+    get_generation,
+    make_cache_key,
+)
+
+SEARCH_TABLE = "__g_healthy_search"
+
+# FULLTEXT ignores tokens shorter than innodb_ft_min_token_size
+MIN_FULLTEXT_TOKEN_LENGTH = 3
+
+NON_SEARCHABLE_FIELDTYPES = (
+    "Attach",
+    "Attach Image",
+    "Button",
+    "Column Break",
+    "Fold",
+    "Heading",
+    "HTML",
+    "Image",
+    "JSON",
+    "Password",
+    "Section Break",
+    "Signature",
+    "Tab Break",
+    "Table",
+    "Table MultiSelect",
+)
+
+
+def setup_search_table():
+    """
+    Creates the search table and its index, runs after migrate
+    """
+    if frappe.db.db_type == "postgres":
+        frappe.db.sql_ddl(
+            f"""create table if not exists "{SEARCH_TABLE}" (
+                "doctype" varchar(140) not null,
+                "name" varchar(140) not null,
+                "content" text,
+                primary key ("doctype", "name")
+            )"""
+        )
+        frappe.db.sql_ddl("create extension if not exists pg_trgm")
+        frappe.db.sql_ddl(
+            f"""create index if not exists "{SEARCH_TABLE}_content_trgm"
+            on "{SEARCH_TABLE}" using gin ("content" gin_trgm_ops)"""
+        )
+    else:
+        frappe.db.sql_ddl(
+            f"""create table if not exists `{SEARCH_TABLE}` (
+                `doctype` varchar(140) not null,
+                `name` varchar(140) not null,
+                `content` text,
+                primary key (`doctype`, `name`),
+                fulltext key `content` (`content`)
+            ) engine=InnoDB character set=utf8mb4 collate=utf8mb4_unicode_ci"""
+        )
+
+    for doctype in get_indexed_doctypes():
+        frappe.enqueue(
+            "g_healthy.search.rebuild_search_index",
+            queue="long",
+            doctype=doctype,
+            job_id=f"g_healthy_search_index::{doctype}",
+            deduplicate=True,
+        )
+
+
+def get_indexed_doctypes():
+    """
+    Returns the doctypes having List View Settings, those are the ones indexed
+    """
+    return get_cached(
+        make_cache_key("search", get_generation("search"), "doctypes"),
+        lambda: frappe.get_all("List View Settings", pluck="name"),
+    )
+
+
+def get_search_fields(doctype):
+    """
+    Returns fieldnames whose values are indexed for a doctype: the list view
+    fields from List View Settings, or the `in_list_view` fields of the meta
+    """
+    meta = frappe.get_meta(doctype)
+    fieldnames = []
+    settings_fields = frappe.get_cached_value("List View Settings", doctype, "fields")
+    if settings_fields:
+        fieldnames = [
+            field.get("fieldname") for field in json.loads(settings_fields) or []
+        ]
+    else:
+        fieldnames = [df.fieldname for df in meta.fields if df.in_list_view]
+
+    if meta.title_field:
+        fieldnames.append(meta.title_field)
+
+    search_fields = []
+    for fieldname in fieldnames:
+        if not fieldname or fieldname in search_fields:
+            continue
+        df = meta.get_field(fieldname)
+        if fieldname == "name" or (
+            df and df.fieldtype not in NON_SEARCHABLE_FIELDTYPES
+        ):
+            search_fields.append(fieldname)
+    return search_fields
+
+
+def get_search_content(doc, search_fields):
+    return " | ".join(
+        cstr(doc.get(fieldname)) for fieldname in search_fields if doc.get(fieldname)
+    )
+
+
+def update_search_index(doc, method=None):
+    """
+    Updates the search row of a document, runs on update of every doctype
+    """
+    if frappe.flags.in_migrate or frappe.flags.in_install:
+        return
+    if doc.doctype == "List View Settings":
+        bump_generation("search")
+        frappe.enqueue(
+            "g_healthy.search.rebuild_search_index",
+            queue="long",
+            doctype=doc.name,
+            job_id=f"g_healthy_search_index::{doc.name}",
+            deduplicate=True,
+            enqueue_after_commit=True,
+        )
+        return
+    if doc.doctype not in get_indexed_doctypes() or doc.meta.istable:
+        return
+
+    content = get_search_content(doc, get_search_fields(doc.doctype))
+    upsert_search_rows([(doc.doctype, doc.name, content)])
+
+
+def update_search_index_bulk(doctype, docs):
+    """
+    Updates the search rows of documents written in bulk, with one statement
+    """
+    if frappe.flags.in_migrate or frappe.flags.in_install:
+        return
+    if doctype not in get_indexed_doctypes() or frappe.get_meta(doctype).istable:
+        return
+
+    search_fields = get_search_fields(doctype)
+    upsert_search_rows(
+        [(doctype, doc.name, get_search_content(doc, search_fields)) for doc in docs]
+    )
+
+
+def delete_from_search_index(doc, method=None):
+    """
+    Removes the search row of a document, runs on trash of every doctype
+    """
+    if doc.doctype == "List View Settings":
+        bump_generation("search")
+        return
+    if doc.doctype not in get_indexed_doctypes():
+        return
+    frappe.db.sql(
+        f"delete from `{SEARCH_TABLE}` where `doctype`=%s and `name`=%s",
+        (doc.doctype, doc.name),
+    )
+
+
+def delete_from_search_index_bulk(doctype, names):
+    """
+    Removes the search rows of documents deleted in bulk, with one statement
+    """
+    if not names or doctype not in get_indexed_doctypes():
+        return
+    frappe.db.sql(
+        f"delete from `{SEARCH_TABLE}` where `doctype`=%s and `name` in %s",
+        (doctype, tuple(names)),
+    )
+
+
+def upsert_search_rows(rows):
+    if not rows:
+        return
+    placeholders = ", ".join(["(%s, %s, %s)"] * len(rows))
+    values = [value for row in rows for value in row]
+    if frappe.db.db_type == "postgres":
+        frappe.db.sql(
+            f"""insert into `{SEARCH_TABLE}` (`doctype`, `name`, `content`)
+            values {placeholders}
+            on conflict (`doctype`, `name`) do update set `content` = excluded.`content`""",
+            values,
+        )
+    else:
+        frappe.db.sql(
+            f"""insert into `{SEARCH_TABLE}` (`doctype`, `name`, `content`)
+            values {placeholders}
+            on duplicate key update `content` = values(`content`)""",
+            values,
+        )
+
+
+def rebuild_search_index(doctype, chunk_size=1000):
+    """
+    Builds the search rows of all the records of a doctype, runs in background.
+
+    The rows are upserted chunk by chunk and the ones of records that no longer
+    exist are deleted at the end, so searches keep matching during a rebuild.
+    """
+    if not frappe.db.exists("List View Settings", doctype):
+        frappe.db.sql(f"delete from `{SEARCH_TABLE}` where `doctype`=%s", (doctype,))
+        return
+
+    search_fields = get_search_fields(doctype)
+    last_name = None
+    while True:
+        records = frappe.get_all(
+            doctype,
+            fields=list({"name", *search_fields}),
+            filters={"name": (">", last_name)} if last_name is not None else None,
+            order_by="name asc",
+            limit_page_length=chunk_size,
+        )
+        if not records:
+            break
+        upsert_search_rows(
+            [
+                (doctype, record.name, get_search_content(record, search_fields))
+                for record in records
+            ]
+        )
+        frappe.db.commit()
+        last_name = records[-1].name
+
+    frappe.db.sql(
+        f"""delete from `{SEARCH_TABLE}` where `doctype`=%s and not exists (
+            select 1 from `tab{doctype}`
+            where `tab{doctype}`.`name` = `{SEARCH_TABLE}`.`name`
+        )""",
+        (doctype,),
+    )
+    frappe.db.commit()
+
+
+def get_search_condition(doctype, text):
+    """
+    Returns the SQL condition on the records of a doctype that match the
+    search text, None without a text. Uses the search table when the doctype
+    is indexed, otherwise a LIKE over its list view fields.
+    """
+    text = cstr(text).strip()
+    if not text:
+        return None
+
+    postgres = frappe.db.db_type == "postgres"
+    like = "ilike" if postgres else "like"
+    pattern = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = frappe.db.escape(f"%{pattern}%", percent=False)
+
+    if doctype not in get_indexed_doctypes():
+        columns = [
+            f"`tab{doctype}`.`{fieldname}`"
+            for fieldname in get_search_fields(doctype) or ["name"]
+        ]
+        if postgres:
+            columns = [f"cast({column} as text)" for column in columns]
+        return "({})".format(
+            " or ".join(f"{column} {like} {pattern}" for column in columns)
+        )
+
+    words = [word for word in re.split(r"[\s+\-<>()~*\"@]+", text) if word]
+    if (
+        not postgres
+        and words
+        and all(len(word) >= MIN_FULLTEXT_TOKEN_LENGTH for word in words)
+    ):
+        against = frappe.db.escape(
+            " ".join(f"+{word}*" for word in words), percent=False
+        )
+        match = f"match(`content`) against ({against} in boolean mode)"
+    else:
+        # served by the trigram index on postgres
+        match = f"`content` {like} {pattern}"
+
+    return f"""`tab{doctype}`.`name` in (select `name` from `{SEARCH_TABLE}`
+        where `doctype`={frappe.db.escape(doctype, percent=False)} and {match})"""
+
+
+class SearchQuery(DatabaseQuery):
+    """
+    A list query narrowed down to the records matching a search condition
+    """
+
+    def __init__(self, doctype, search_condition, user=None):
+        super().__init__(doctype, user=user)
+        self.search_condition = search_condition
+
+    def build_conditions(self):
+        super().build_conditions()
+        self.conditions.append(self.search_condition)
+
+
+def get_list_query(doctype, search=None):
+    """
+    Returns the query of the list of a doctype, narrowed down to the records
+    matching the search text when there is one
+    """
+    condition = get_search_condition(doctype, search)
+    return SearchQuery(doctype, condition) if condition else DatabaseQuery(doctype)
@@ -0,0 +1,100 @@
+from frappe.tests.utils import FrappeTestCase
+
+from g_healthy.expressions import (
+    compile_expression,
+    evaluate,
+    evaluate_partial,
+    is_truthy,
+)
+
+
+def holds(expression, **values):
+    node = compile_expression(expression)
+    if node is None:
+        raise AssertionError(f"{expression} does not compile")
+    return is_truthy(evaluate(node, values))
+
+
+def decides(expression, **values):
+    return evaluate_partial(compile_expression(expression), values)
+
+
+class TestExpressions(FrappeTestCase):
+    def test_and(self):
+        expression = 'eval:doc.status == "Open" && doc.priority == "High"'
+        self.assertTrue(holds(expression, status="Open", priority="High"))
+        self.assertFalse(holds(expression, status="Open", priority="Low"))
+        self.assertFalse(holds(expression, status="Open"))
+
+    def test_or(self):
+        expression = 'eval:doc.status == "Open" || doc.status == "Pending"'
+        self.assertTrue(holds(expression, status="Open"))
+        self.assertTrue(holds(expression, status="Pending"))
+        self.assertFalse(holds(expression, status="Closed"))
+
+    def test_and_binds_tighter_than_or(self):
+        expression = "eval:doc.a || doc.b && doc.c"
+        self.assertTrue(holds(expression, a=1))
+        self.assertFalse(holds(expression, b=1))
+        self.assertTrue(holds(expression, b=1, c=1))
+        self.assertFalse(holds("eval:(doc.a || doc.b) && doc.c", a=1))
+
+    def test_not(self):
+        self.assertTrue(holds("eval:!doc.is_return"))
+        self.assertFalse(holds("eval:!doc.is_return", is_return=1))
+        self.assertTrue(holds("eval:!!doc.is_return", is_return=1))
+        self.assertTrue(holds('eval:!(doc.status == "Open")', status="Closed"))
+
+    def test_in(self):
+        expression = 'eval:doc.type in ["A", "B"]'
+        self.assertTrue(holds(expression, type="A"))
+        self.assertFalse(holds(expression, type="C"))
+        self.assertFalse(holds(expression))
+        self.assertTrue(holds("eval:doc.qty in (1, 2)", qty="2"))
+
+    def test_not_in(self):
+        expression = 'eval:doc.status == "Open" && !(doc.type in ["A", "B"])'
+        self.assertTrue(holds(expression, status="Open", type="C"))
+        self.assertFalse(holds(expression, status="Open", type="A"))
+        self.assertTrue(holds('eval:doc.type not in ["A"]', type="B"))
+        self.assertFalse(holds('eval:doc.type not in ["A"]', type="A"))
+
+    def test_not_equals(self):
+        # a field that is not set differs from any value
+        expression = 'eval:doc.status != "Open"'
+        self.assertTrue(holds(expression, status="Closed"))
+        self.assertFalse(holds(expression, status="Open"))
+        self.assertTrue(holds(expression))
+        self.assertFalse(holds('eval:doc.status !== "Open"', status="Open"))
+        # values are compared loosely, as with ==
+        self.assertFalse(holds("eval:doc.qty != 1", qty="1"))
+        self.assertFalse(holds("eval:doc.qty !== 1.0", qty=1))
+
+    def test_bare_fieldname(self):
+        self.assertTrue(holds("is_return", is_return=1))
+        self.assertFalse(holds("is_return", is_return=0))
+
+    def test_unsupported(self):
+        self.assertIsNone(compile_expression("eval:frappe.user.has_role('Admin')"))
+        self.assertIsNone(compile_expression('eval:doc.status == "Open" &&'))
+        self.assertIsNone(compile_expression(""))
+
+    def test_partial_and_with_another_field(self):
+        expression = 'eval:doc.status == "Open" && doc.priority == "High"'
+        # the other field decides
+        self.assertIsNone(decides(expression, status="Open"))
+        self.assertFalse(decides(expression, status="Closed"))
+        self.assertTrue(decides(expression, status="Open", priority="High"))
+
+    def test_partial_not_equals_another_field(self):
+        self.assertIsNone(decides('eval:doc.other != "X"', status="Open"))
+        self.assertIsNone(decides('eval:!(doc.other == "X")', status="Open"))
+        expression = 'eval:doc.status != "Open" && doc.other != "X"'
+        self.assertFalse(decides(expression, status="Open"))
+        self.assertIsNone(decides(expression, status="Closed"))
+
+    def test_partial_or_with_another_field(self):
+        expression = 'eval:doc.status == "Open" || doc.other in ["A", "B"]'
+        self.assertTrue(decides(expression, status="Open"))
+        self.assertIsNone(decides(expression, status="Closed"))
+        self.assertFalse(decides(expression, status="Closed", other="C"))
@@ -1,11 +1,27 @@
 import frappe
 import json
 
+from g_healthy.cache import get_generation
+from g_healthy.etag import conditional_response
+
 
 @frappe.whitelist()
 def get_table_columns(doctype: str) -> list[dict]:
     """Get the columns for a given doctype from list view settings and metadata"""
 
+    return conditional_response(
+        (
+            "table_columns",
+            doctype,
+            str(frappe.get_meta(doctype).modified),
+            get_generation("schema"),
+            str(frappe.db.get_value("List View Settings", doctype, "modified")),
+        ),
+        lambda: build_table_columns(doctype),
+    )
+
+
+def build_table_columns(doctype):
     # Get list view settings for the doctype
     list_view_settings = frappe.get_doc("List View Settings", doctype)
     columns = []